@@ -0,0 +1,131 @@
+"""
+Простые метрики процесса (счетчики и гистограммы) без внешних зависимостей.
+Отдаются view в текстовом формате Prometheus. Метрики свои у каждого процесса,
+при нескольких воркерах Prometheus собирает их с каждого отдельно.
+"""
+import hmac
+import math
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+registry = {}
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        registry[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        """
+        {labels: (накопительные счетчики по бакетам, сумма, количество)}
+        """
+        with self._lock:
+            return {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.get(name) or Counter(name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.get(name) or Histogram(name, documentation, labelnames, buckets)
+
+
+def _escape(value, quote=True):
+    value = value.replace('\\', '\\\\').replace('\n', '\\n')
+    return value.replace('"', '\\"') if quote else value
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    lines = []
+    for name, metric in sorted(registry.items()):
+        lines.append(f'# HELP {name} {_escape(metric.documentation, quote=False)}')
+        lines.append(f'# TYPE {name} {metric.type}')
+        for key, value in sorted(metric.samples().items()):
+            if metric.type == 'counter':
+                lines.append(f'{name}{_labels(metric.labelnames, key)} {_number(value)}')
+                continue
+            counts, total, count = value
+            for bound, bucket_count in zip((*metric.buckets, math.inf), (*counts, count)):
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, key, [("le", _number(bound))])} {bucket_count}')
+            lines.append(f'{name}_sum{_labels(metric.labelnames, key)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(metric.labelnames, key)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def view(request):
+    """
+    /metrics для Prometheus. Если задан METRICS_TOKEN, нужен заголовок Authorization: Bearer <token>,
+    без него метрики видны только при DEBUG и с адресов из INTERNAL_IPS.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode()):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG and request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
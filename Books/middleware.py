@@ -0,0 +1,225 @@
+import logging
+import os
+import time
+import traceback
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.serializers import BaseSerializer
+
+from . import metrics
+from .routers import replica_reads
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+request_seconds = metrics.histogram('http_request_duration_seconds', 'Время ответа', ['view', 'method'])
+requests_total = metrics.counter('http_requests_total', 'Ответы по view и коду', ['view', 'method', 'status'])
+query_count = metrics.histogram(
+    'http_request_db_queries', 'SQL запросов на один HTTP запрос', ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+query_seconds = metrics.histogram('http_request_db_seconds', 'Время SQL запросов на один HTTP запрос', ['view'])
+serializer_seconds = metrics.histogram(
+    'http_request_serializer_seconds', 'Время сериализации ответа вместе с запросами из сериализаторов', ['view'],
+)
+response_bytes = metrics.histogram(
+    'http_response_size_bytes', 'Размер тела ответа, потоковые ответы не считаются', ['view'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+over_budget_total = metrics.counter(
+    'http_requests_over_budget_total', 'Запросы сверх REQUEST_BUDGET_QUERIES или REQUEST_BUDGET_SECONDS', ['view'],
+)
+
+_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self, trace):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+        self.trace = trace
+        self.origins = []
+
+
+def query_origin():
+    """
+    Кадры кода проекта, из которых пришел запрос (без django, DRF и этого модуля), самый глубокий последним.
+    """
+    frames = []
+    for frame in traceback.extract_stack():
+        filename = frame.filename
+        if filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in filename and filename != __file__:
+            frames.append(f'{os.path.relpath(filename, settings.BASE_DIR)}:{frame.lineno} in {frame.name}')
+    return tuple(frames[-5:])
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_seconds += time.perf_counter() - started
+        if stats.trace:
+            stats.origins.append((sql, query_origin()))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # обертка на все время жизни соединения, вне HTTP запроса она сразу вызывает execute
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_serializers():
+    """
+    Засекает время BaseSerializer.data. Вложенные сериализаторы и .data внутри .data не считаются повторно.
+    """
+    fget = BaseSerializer.data.fget
+    if getattr(fget, 'timed', False):
+        return
+
+    def data(self):
+        stats = _stats.get()
+        if stats is None or stats.serializing:
+            return fget(self)
+        stats.serializing = True
+        started = time.perf_counter()
+        try:
+            return fget(self)
+        finally:
+            stats.serializer_seconds += time.perf_counter() - started
+            stats.serializing = False
+
+    data.timed = True
+    BaseSerializer.data = property(data)
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Включает чтение каталога с реплик для безопасных запросов. После запроса на запись ставит cookie,
+    с которой следующие запросы клиента DATABASE_PRIMARY_PIN_SECONDS читают primary и видят свои изменения
+    несмотря на лаг реплик.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(self.use_replicas(request)):
+            response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        with replica_reads(self.use_replicas(request)):
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def use_replicas(self, request):
+        return request.method in SAFE_METHODS and settings.DATABASE_PRIMARY_PIN_COOKIE not in request.COOKIES
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                settings.DATABASE_PRIMARY_PIN_COOKIE, '1',
+                max_age=settings.DATABASE_PRIMARY_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Метрики каждого запроса по view (шаблону URL): время ответа, число и время SQL запросов,
+    время сериализации и размер ответа. Отдаются на /metrics (Books.metrics.view).
+    Если задан REQUEST_BUDGET_QUERIES или REQUEST_BUDGET_SECONDS, запросы сверх бюджета пишутся в лог
+    вместе с местами в коде, откуда пришли их SQL запросы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        instrument_serializers()
+        for connection in connections.all(initialized_only=True):
+            instrument_connection(None, connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _stats.reset(token)
+        self.finish(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _stats.reset(token)
+        self.finish(request, response, stats, started)
+        return response
+
+    def start(self):
+        trace = settings.REQUEST_BUDGET_QUERIES is not None or settings.REQUEST_BUDGET_SECONDS is not None
+        stats = RequestStats(trace)
+        return stats, _stats.set(stats), time.perf_counter()
+
+    def finish(self, request, response, stats, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        # шаблон URL, а не путь, чтобы число рядов метрик не росло с числом книг
+        view = match.route if match is not None else 'unmatched'
+        request_seconds.observe(elapsed, view=view, method=request.method)
+        requests_total.inc(view=view, method=request.method, status=response.status_code)
+        query_count.observe(stats.queries, view=view)
+        query_seconds.observe(stats.query_seconds, view=view)
+        serializer_seconds.observe(stats.serializer_seconds, view=view)
+        if not response.streaming:
+            response_bytes.observe(len(response.content), view=view)
+
+        if not stats.trace:
+            return
+        budget_queries, budget_seconds = settings.REQUEST_BUDGET_QUERIES, settings.REQUEST_BUDGET_SECONDS
+        if (budget_queries is None or stats.queries <= budget_queries) and \
+                (budget_seconds is None or elapsed <= budget_seconds):
+            return
+        over_budget_total.inc(view=view)
+        logger.warning(
+            '%s %s -> %s over budget: %.1fms, %d queries (%.1fms), serializers %.1fms\n%s',
+            request.method, request.get_full_path(), response.status_code, elapsed * 1000,
+            stats.queries, stats.query_seconds * 1000, stats.serializer_seconds * 1000,
+            self.format_origins(stats.origins),
+        )
+
+    def format_origins(self, origins):
+        # одинаковые запросы из одного места (N+1) схлопываются в одну строку со счетчиком
+        grouped = Counter((sql[:160], frames) for sql, frames in origins)
+        lines = []
+        for (sql, frames), count in grouped.most_common():
+            lines.append(f'  {count}x {sql}')
+            lines.extend(f'      {frame}' for frame in frames)
+        return '\n'.join(lines)
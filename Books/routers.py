@@ -0,0 +1,63 @@
+"""
+Роутер primary/replica.
+
+Записи всегда идут в default (primary). Чтения моделей каталога (книги, страницы, жанры, обложки, популярные и похожие книги)
+идут на случайную реплику из DATABASE_REPLICAS, но только внутри безопасного HTTP запроса, для которого
+Books.middleware.DatabaseRoutingMiddleware включил replica_reads(). Все остальное читает primary:
+данные юзеров (прогресс, статусы, оценки, токены), чтения внутри транзакции, воркеры и management команды,
+запросы на запись и запросы клиента в течение DATABASE_PRIMARY_PIN_SECONDS после его записи.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+CATALOG_MODELS = {
+    'reading.book',
+    'reading.bookgenre',
+    'reading.bookrendition',
+    'reading.genre',
+    'reading.page',
+    'reading.pagetextdictionary',
+    'reading.popularbook',
+    'reading.similarbook',
+}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or not _replica_reads.get():
+            return DEFAULT_DB_ALIAS
+        if model._meta.label_lower not in CATALOG_MODELS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # связанные объекты читаем оттуда же, откуда сам объект
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схему на реплики приносит репликация
+        return db not in settings.DATABASE_REPLICAS
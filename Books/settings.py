@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -52,7 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Books.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'Books.middleware.DatabaseRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -87,12 +90,102 @@ WSGI_APPLICATION = 'Books.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# BOOKS_DB_ENGINE=postgres включает профиль PostgreSQL (BOOKS_DB_NAME, BOOKS_DB_USER, BOOKS_DB_PASSWORD,
+# BOOKS_DB_HOST, BOOKS_DB_PORT). Соединения постоянные (BOOKS_DB_CONN_MAX_AGE) с проверкой перед запросом.
+# За pgbouncer в режиме transaction нужен BOOKS_DB_PGBOUNCER=1: серверные курсоры там не работают.
+# BOOKS_DB_REPLICAS - реплики через запятую: host[:port] для postgres, файлы для sqlite.
+BOOKS_DB_ENGINE = os.environ.get('BOOKS_DB_ENGINE', 'sqlite')
+
+if BOOKS_DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BOOKS_DB_NAME', 'books'),
+            'USER': os.environ.get('BOOKS_DB_USER', 'books'),
+            'PASSWORD': os.environ.get('BOOKS_DB_PASSWORD', ''),
+            'HOST': os.environ.get('BOOKS_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('BOOKS_DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('BOOKS_DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('BOOKS_DB_PGBOUNCER') == '1',
+            'OPTIONS': {'connect_timeout': 5},
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('BOOKS_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.environ.get('BOOKS_DB_REPLICAS', '').split(','))):
+    alias = f'replica_{index}'
+    if BOOKS_DB_ENGINE == 'postgres':
+        host, _, port = replica.strip().partition(':')
+        DATABASES[alias] = {**DATABASES['default'], 'HOST': host, 'PORT': port or DATABASES['default']['PORT']}
+    else:
+        DATABASES[alias] = {**DATABASES['default'], 'NAME': replica.strip()}
+    # в тестах реплика смотрит в тестовую базу default
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# BOOKS_SQLITE_WAL=1 - профиль для узлов на SQLite (см. reading.sqlite): WAL, synchronous=NORMAL
+# (в WAL при отключении питания теряются только последние транзакции, база не портится),
+# ожидание блокировки вместо "database is locked", mmap и кеш страниц 64MB
+SQLITE_WAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
 }
+SQLITE_PRAGMAS = SQLITE_WAL_PRAGMAS if os.environ.get('BOOKS_SQLITE_WAL') == '1' else {}
+
+# каталог читается с реплик, см. Books.routers
+DATABASE_ROUTERS = ['Books.routers.PrimaryReplicaRouter']
+DATABASE_PRIMARY_PIN_SECONDS = 5
+DATABASE_PRIMARY_PIN_COOKIE = 'db_primary'
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# Кеш каталога и состояние токенов должны видеть все процессы: версии каталога увеличивают и воркеры
+# вне веба (render_books, build_renditions, import_books), а правка в одном воркере gunicorn сбрасывает
+# кеш остальных. По умолчанию файловый кеш в BASE_DIR/cache (все процессы на одной машине), каталог
+# меняется через BOOKS_CACHE_DIR. Для нескольких машин: BOOKS_REDIS_URL (пакет redis) или
+# BOOKS_CACHE_TABLE (таблица в базе, manage.py createcachetable)
+if os.environ.get('BOOKS_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['BOOKS_REDIS_URL'],
+        }
+    }
+elif os.environ.get('BOOKS_CACHE_TABLE'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': os.environ['BOOKS_CACHE_TABLE'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('BOOKS_CACHE_DIR', str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+SHARED_CACHE = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+
+# Ответы каталога инвалидируются сигналами, TTL только страховка. CATALOG_CACHE_ENABLED=0 выключает кеш.
+# С кешем в памяти процесса включать нельзя (проверка reading.E001): процесс не узнает о чужой инвалидации
+CATALOG_CACHE_ENABLED = SHARED_CACHE and os.environ.get('CATALOG_CACHE_ENABLED', '1') != '0'
+CATALOG_CACHE_TIMEOUT = 60 * 60
 
 
 # Password validation
@@ -122,6 +215,31 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Хеширование паролей. PASSWORD_HASHER=argon2 делает Argon2 основным (нужен пакет argon2-cffi),
+# старые хеши проверяются по-прежнему и пересчитываются при входе
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_HASHERS = [
+    'regauth.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if PASSWORD_HASHER == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(2))
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 720000))
+
+AUTHENTICATION_BACKENDS = ['regauth.backends.PooledModelBackend']
+
+# Пул процессов для хеширования (regauth/hashing.py): половина ядер хоста остается под остальные запросы.
+# Оба лимита на весь хост, а не на воркер: их делят все процессы с тем же PASSWORD_HASHING_LOCK_DIR
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', max((os.cpu_count() or 2) // 2, 1)))
+PASSWORD_HASHING_MAX_PENDING = int(os.environ.get('PASSWORD_HASHING_MAX_PENDING', max(PASSWORD_HASHING_WORKERS, 1) * 8))
+PASSWORD_HASHING_LOCK_DIR = os.environ.get('PASSWORD_HASHING_LOCK_DIR',
+                                           os.path.join(tempfile.gettempdir(), 'books-password-hashing'))
+PASSWORD_HASHING_RETRY_AFTER = 1
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -155,7 +273,7 @@ REST_FRAMEWORK = {
 
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'regauth.authentication.StatelessJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -181,7 +299,7 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=40),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=14),
     'SLIDING_TOKEN_LIFETIME': timedelta(days=14),
-    'ROTATE_REFRESH_TOKENS': False,
+    'ROTATE_REFRESH_TOKENS': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'VERIFYING_KEY': None,
@@ -193,8 +311,21 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_EXP_CLAIM': 'exp',
     'DOT_ENV_FILE': None,
+    'TOKEN_OBTAIN_SERIALIZER': 'regauth.tokens.VersionedTokenObtainPairSerializer',
 }
 
+# StatelessJWTAuthentication: сколько кешируется версия токенов пользователя и строки пользователей
+# (LRU в памяти процесса). Без общего кеша (SHARED_CACHE) revoke_tokens и деактивация доходят до других
+# процессов только через AUTH_TOKEN_STATE_TTL, поэтому он короткий: это и есть задержка отзыва токенов
+AUTH_TOKEN_STATE_TTL = int(os.environ.get('AUTH_TOKEN_STATE_TTL', 300 if SHARED_CACHE else 5))
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 60
+
+# Denylist jti (regauth.denylist): Bloom-фильтр в памяти процесса и как часто он дочитывает новые записи
+TOKEN_DENYLIST_BLOOM_CAPACITY = 2_000_000
+TOKEN_DENYLIST_BLOOM_ERROR_RATE = 0.01
+TOKEN_DENYLIST_SYNC_INTERVAL = 5
+
 #
 # AUTH_PASSWORD_VALIDATORS = [
 #     {
@@ -225,6 +356,62 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Отдача PDF/обложек через /api/v1/books/<id>/pdf|cover/: 'stream', 'x-accel' (nginx) или 'x-sendfile'
+MEDIA_DELIVERY_MODE = os.environ.get('MEDIA_DELIVERY_MODE', 'stream')
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Очередь рендеринга PDF (manage.py render_books)
+BOOK_RENDER_DEBOUNCE = timedelta(seconds=5)
+BOOK_RENDER_MAX_DELAY = timedelta(minutes=1)
+BOOK_RENDER_MAX_ATTEMPTS = 3
+BOOK_RENDER_STALE_TIMEOUT = timedelta(minutes=10)
+
+# Уменьшенные копии обложек: имя -> ширина в px
+BOOK_RENDITION_SIZES = {'small': 160, 'medium': 320, 'large': 640}
+BOOK_RENDITION_FORMATS = ['webp', 'jpeg']
+BOOK_RENDITION_QUALITY = 80
+
+# Прогресс чтения пишется в базу пачками раз в N секунд, 0 - писать сразу
+READING_PROGRESS_FLUSH_INTERVAL = 2
+READING_PROGRESS_BATCH_SIZE = 200
+READING_POSITIONS_BULK_MAX = 200
+
+# Окно страниц books/<id>/pages/<page_id>/window/?k=
+PAGE_WINDOW_DEFAULT = 5
+PAGE_WINDOW_MAX = 20
+PAGE_WINDOW_MAX_AGE = 300
+
+# Сжатие текста страниц: 'none', 'zlib' или 'zstd' (нужен пакет zstandard), см. reading/pagetext.py
+PAGE_TEXT_COMPRESSION = os.environ.get('PAGE_TEXT_COMPRESSION', 'zlib')
+
+# Конфигурация to_tsvector для полнотекстового поиска на Postgres (ее же берет миграция 0008),
+# после смены индекс перестраивается: manage.py rebuild_search_index
+FULL_TEXT_SEARCH_CONFIG = 'simple'
+# SQLite: слово, которое есть на стольких страницах, не ранжируется bm25 (он считается по каждому совпадению),
+# а запрос из одних таких слов ранжирует только FULL_TEXT_SEARCH_CANDIDATES самых новых совпадений.
+# Замер: manage.py benchmark_search
+FULL_TEXT_SEARCH_RANKED_PAGES = 10_000
+FULL_TEXT_SEARCH_CANDIDATES = 1000
+
+# Рекомендации (manage.py build_recommendations)
+RECOMMENDATIONS_PER_USER = 50
+RECOMMENDATIONS_MAX_BOOKS_PER_USER = 200
+# Кандидаты по жанрам: столько самых популярных книг из каждого из самых близких юзеру жанров
+RECOMMENDATIONS_TOP_GENRES = 5
+RECOMMENDATIONS_GENRE_CANDIDATES = 500
+SIMILAR_BOOKS_TOP_K = 20
+
+# Метрики запросов (Books.middleware.MetricsMiddleware) в формате Prometheus на /metrics.
+# METRICS_TOKEN закрывает их Bearer токеном, без токена их отдают только при DEBUG и на адреса
+# из INTERNAL_IPS (BOOKS_INTERNAL_IPS через запятую, за прокси это адрес прокси).
+# REQUEST_BUDGET_QUERIES / REQUEST_BUDGET_SECONDS включают лог запросов сверх бюджета с местами в коде,
+# откуда пришли SQL запросы (сбор стеков замедляет каждый запрос)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+INTERNAL_IPS = [ip.strip() for ip in os.environ.get('BOOKS_INTERNAL_IPS', '').split(',') if ip.strip()]
+REQUEST_BUDGET_QUERIES = int(os.environ['REQUEST_BUDGET_QUERIES']) if os.environ.get('REQUEST_BUDGET_QUERIES') else None
+REQUEST_BUDGET_SECONDS = float(os.environ['REQUEST_BUDGET_SECONDS']) if os.environ.get('REQUEST_BUDGET_SECONDS') else None
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3030',
     # 'http://217.151.230.35',
@@ -0,0 +1,103 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import router, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+
+from reading.models import Book, BookStatus, LastPage, Page
+from regauth.models import CustomUser
+from .middleware import DatabaseRoutingMiddleware
+from .routers import replica_reads
+
+REPLICA = 'replica_0'
+
+
+# TestCase держит транзакцию на весь тест, а в транзакции роутер всегда выбирает primary
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class PrimaryReplicaRouterTests(TransactionTestCase):
+    def test_catalogue_reads_go_to_replica(self):
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Book), REPLICA)
+            self.assertEqual(router.db_for_read(Page), REPLICA)
+        # вне безопасного HTTP запроса (воркеры, команды) - primary
+        self.assertEqual(router.db_for_read(Book), 'default')
+
+    def test_user_data_reads_stay_on_primary(self):
+        with replica_reads():
+            for model in (BookStatus, LastPage, CustomUser):
+                self.assertEqual(router.db_for_read(model), 'default')
+
+    def test_reads_in_atomic_stay_on_primary(self):
+        with replica_reads(), transaction.atomic():
+            self.assertEqual(router.db_for_read(Book), 'default')
+
+    def test_writes_go_to_primary(self):
+        with replica_reads():
+            for model in (Book, Page, BookStatus, CustomUser):
+                self.assertEqual(router.db_for_write(model), 'default')
+
+
+@override_settings(DATABASE_REPLICAS=[REPLICA])
+class DatabaseRoutingMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = DatabaseRoutingMiddleware(self.get_response)
+
+    def get_response(self, request):
+        # запоминаем, куда view читал бы каталог
+        self.read_from = router.db_for_read(Book)
+        return HttpResponse()
+
+    def test_primary_pin_after_write(self):
+        response = self.middleware(self.factory.post('/api/v1/users/favorites/'))
+        self.assertEqual(self.read_from, 'default')
+        cookie = response.cookies[settings.DATABASE_PRIMARY_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.DATABASE_PRIMARY_PIN_SECONDS)
+
+        request = self.factory.get('/api/v1/books/')
+        request.COOKIES[cookie.key] = cookie.value
+        response = self.middleware(request)
+        self.assertEqual(self.read_from, 'default')
+        self.assertNotIn(cookie.key, response.cookies)
+
+        self.middleware(self.factory.get('/api/v1/books/'))
+        self.assertEqual(self.read_from, REPLICA)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_pin_without_replicas(self):
+        response = self.middleware(self.factory.post('/api/v1/users/favorites/'))
+        self.assertNotIn(settings.DATABASE_PRIMARY_PIN_COOKIE, response.cookies)
+
+
+# Реплики-заглушки: BOOKS_DB_REPLICAS=replica.sqlite3 python manage.py test Books
+# (в тестах реплика смотрит в тестовую базу default, TEST MIRROR)
+@skipUnless(settings.DATABASE_REPLICAS, 'BOOKS_DB_REPLICAS is not set')
+class ReplicaConnectionTests(TransactionTestCase):
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def test_catalogue_read_uses_replica_connection(self):
+        Book.objects.bulk_create([Book(name='Book', author='Author')])
+        with replica_reads():
+            book = Book.objects.get(name='Book')
+            self.assertIn(book._state.db, settings.DATABASE_REPLICAS)
+            self.assertEqual(BookStatus.objects.filter(book=book).db, 'default')
+
+
+@override_settings(DEBUG=False, METRICS_TOKEN=None, INTERNAL_IPS=[])
+class MetricsViewTests(SimpleTestCase):
+    def test_denied_by_default(self):
+        self.assertEqual(Client().get('/metrics').status_code, 403)
+
+    @override_settings(INTERNAL_IPS=['127.0.0.1'])
+    def test_internal_ip(self):
+        response = Client(REMOTE_ADDR='127.0.0.1').get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE http_requests_total counter', response.content)
+        self.assertEqual(Client(REMOTE_ADDR='10.0.0.1').get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret', INTERNAL_IPS=['127.0.0.1'])
+    def test_token(self):
+        # с токеном адрес не важен
+        self.assertEqual(Client().get('/metrics').status_code, 403)
+        self.assertEqual(Client(headers={'Authorization': 'Bearer secret'}).get('/metrics').status_code, 200)
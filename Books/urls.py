@@ -19,15 +19,19 @@ from django.urls import path, include
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 from django.conf.urls.static import static
 from django.conf import settings
+from Books import metrics
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('reading.urls')),
+    path('api/v1/async/', include('reading.async_urls')),
+    path('api/v1/async/regauth/', include('regauth.async_urls')),
     path('api/v1/regauth/', include('regauth.urls')),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/schema/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('metrics', metrics.view, name='metrics'),
 
 
 ]
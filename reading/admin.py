@@ -1,9 +1,7 @@
-import os
-
-from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from django.http import HttpResponse
+from . import delivery
 from .models import *
 
 
@@ -19,8 +17,8 @@ class PageInlineAdmin(admin.TabularInline):
 
 
 class BookAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'total_pages', 'pdf')
-    readonly_fields = ('total_pages', 'pdf')
+    list_display = ('name', 'author', 'total_pages', 'pdf', 'render_status')
+    readonly_fields = ('total_pages', 'pdf', 'render_status')
     inlines = [PageInlineAdmin, GenreInlineAdmin]
 
     exclude = ('status',)
@@ -36,12 +34,7 @@ class BookAdmin(admin.ModelAdmin):
         book = self.get_object(request, object_id)
         if not book.pdf:
             return HttpResponse('PDF not available', status=404)
-
-        pdf_path = os.path.join(settings.MEDIA_ROOT, book.pdf.name)
-        with open(pdf_path, 'rb') as pdf_file:
-            response = HttpResponse(pdf_file.read(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename={os.path.basename(pdf_path)}'
-            return response
+        return delivery.serve(request, book.pdf, 'application/pdf', attachment=True)
 
 
 
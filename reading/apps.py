@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReadingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reading'
+
+    def ready(self):
+        # регистрируют сигналы поискового индекса, инвалидации кеша каталога и настройки соединений SQLite
+        from . import catalog_cache, search, sqlite  # noqa: F401
@@ -0,0 +1,10 @@
+# async_urls.py
+from django.urls import path
+from .async_views import *
+
+urlpatterns = [
+    path('books/', BookListView.as_view(), name='async-book-list'),
+    path('books/<int:book_id>/', BookDetailView.as_view(), name='async-book-detail'),
+    path('books/<int:book_id>/pages/', PageListView.as_view(), name='async-page-list'),
+    path('books/<int:book_id>/pages/<int:page_id>/', PageDetailView.as_view(), name='async-page-detail'),
+]
@@ -0,0 +1,127 @@
+"""
+Async версии читающих эндпоинтов (список и карточка книги, список страниц и страница) для запуска
+под ASGI (Books.asgi, например `uvicorn Books.asgi:application`), смонтированы в api/v1/async/.
+
+DRF не умеет async views, поэтому это обычные django views с тем же форматом ответов, что у reading.views:
+аутентификация только по JWT (StatelessJWTAuthentication.aauthenticate), запросы через async ORM и async API кеша.
+Пока запрос ждет базу, воркер обслуживает другие запросы, а не держит поток.
+"""
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated
+from rest_framework.request import Request
+
+from regauth.authentication import StatelessJWTAuthentication
+from . import catalog_cache, progress
+from .models import Book, Page
+from .pagination import IdCursorPagination, PageNumberCursorPagination
+from .serializers import BookListSerializer, PageListSerializer, PageSerializer
+
+authenticator = StatelessJWTAuthentication()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    if data is None:
+        return HttpResponse(status=status_code)
+    # тот же JSON, что у JSONRenderer DRF
+    return JsonResponse(data, status=status_code, safe=False,
+                        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+class AsyncReadView(View):
+    """
+    Базовая async view: аутентифицирует запрос по JWT и передает в обработчик DRF Request,
+    чтобы пагинаторы и сериализаторы работали как в reading.views.
+    """
+    http_method_names = ['get', 'options']
+    authentication_required = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            auth = await authenticator.aauthenticate(request)
+            if auth is None and self.authentication_required:
+                raise NotAuthenticated()
+        except APIException as exc:
+            response = render(exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail},
+                              exc.status_code)
+            response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            return response
+        request = Request(request)
+        request.user = auth[0] if auth else AnonymousUser()
+        return await super().dispatch(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'view': self}
+
+
+class BookListView(AsyncReadView):
+    """
+       Здесь не нужен access токен, async версия BookListView
+    """
+
+    async def get(self, request):
+        self.request = request
+        return await catalog_cache.arespond(request, await catalog_cache.alist_key(request), self.build, render)
+
+    async def build(self):
+        paginator = IdCursorPagination()
+        books = await paginator.apaginate_queryset(Book.objects.all(), self.request, view=self)
+        serializer = BookListSerializer(books, many=True, context={**self.get_serializer_context(), 'with_status': False})
+        await serializer.child.aload_related(books)
+        return paginator.get_paginated_response(serializer.data).data
+
+
+class BookDetailView(AsyncReadView):
+    """
+       Здесь не нужен access токен, async версия BookDetailView
+    """
+
+    async def get(self, request, book_id):
+        self.request = request
+        key = await catalog_cache.adetail_key(request, book_id)
+        return await catalog_cache.arespond(request, key, lambda: self.build(book_id), render)
+
+    async def build(self, book_id):
+        book = await Book.objects.filter(pk=book_id).afirst()
+        if book is None:
+            return None
+        serializer = BookListSerializer(book, context={**self.get_serializer_context(), 'with_status': False})
+        await serializer.aload_related([book])
+        return serializer.data
+
+
+class PageListView(AsyncReadView):
+    """
+       Здесь нужен access токен, async версия PageListView
+    """
+    authentication_required = True
+
+    async def get(self, request, book_id):
+        self.request = request
+        if not await Book.objects.filter(pk=book_id).aexists():
+            return render({"error": "Book not found"}, status.HTTP_404_NOT_FOUND)
+        paginator = PageNumberCursorPagination()
+        pages = await paginator.apaginate_queryset(
+            Page.objects.filter(book_id=book_id).defer('text'), request, view=self
+        )
+        serializer = PageListSerializer(pages, many=True, context=self.get_serializer_context())
+        return render(paginator.get_paginated_response(serializer.data).data)
+
+
+class PageDetailView(AsyncReadView):
+    """
+        Здесь нужен access токен, async версия PageDetailView
+    """
+    authentication_required = True
+
+    async def get(self, request, book_id, page_id):
+        self.request = request
+        try:
+            page = await Page.objects.aget(pk=page_id, book=book_id)
+        except Page.DoesNotExist:
+            return render({"error": "Page not found"}, status.HTTP_404_NOT_FOUND)
+        serializer = PageSerializer(page, context=self.get_serializer_context())
+        await progress.arecord(request.user, page)
+        return render(serializer.data)
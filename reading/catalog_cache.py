@@ -0,0 +1,208 @@
+"""
+Кеш ответов публичного каталога (BookListView, BookDetailView).
+
+Ключи версионные: список книг зависит от версии всего каталога, карточка книги - от версии этой книги.
+Версии увеличиваются сигналами Book/Page/BookGenre/Genre/BookRating после коммита транзакции,
+старые записи просто перестают читаться. Поле status зависит от юзера, поэтому в кеш попадает
+ответ без статусов, а статусы текущего юзера подмешиваются после чтения из кеша.
+
+Версии увеличивают и процессы вне веба (render_books, build_renditions, import_books), поэтому кеш
+работает только с общим для всех процессов бэкендом (по умолчанию файловый, проверка reading.E001).
+Когда он выключен (CATALOG_CACHE_ENABLED), ключи равны None и ответы строятся на каждый запрос без ETag.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.checks import Error, Tags, register
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Book, BookGenre, BookRating, BookStatus, Genre, Page
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def book_version_key(book_id):
+    return f'catalog:book:{book_id}:version'
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # новая версия не должна совпасть с версией, вытесненной из кеша раньше
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+async def _aversion(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key)
+    return version
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def invalidate_books(book_ids):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return
+    keys = [CATALOG_VERSION_KEY, *(book_version_key(book_id) for book_id in set(book_ids))]
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def _digest(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def list_key(request):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return None
+    return f'catalog:list:{_version(CATALOG_VERSION_KEY)}:{_digest(request.build_absolute_uri())}'
+
+
+def detail_key(request, book_id):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return None
+    return f'catalog:detail:{book_id}:{_version(book_version_key(book_id))}:{_digest(request.build_absolute_uri())}'
+
+
+async def alist_key(request):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return None
+    return f'catalog:list:{await _aversion(CATALOG_VERSION_KEY)}:{_digest(request.build_absolute_uri())}'
+
+
+async def adetail_key(request, book_id):
+    if not settings.CATALOG_CACHE_ENABLED:
+        return None
+    version = await _aversion(book_version_key(book_id))
+    return f'catalog:detail:{book_id}:{version}:{_digest(request.build_absolute_uri())}'
+
+
+def _books(data):
+    return data['results'] if 'results' in data else [data]
+
+
+def user_statuses(user, data):
+    if not user.is_authenticated:
+        return {}
+    book_ids = [book['id'] for book in _books(data)]
+    return dict(BookStatus.objects.filter(user=user, book_id__in=book_ids).values_list('book_id', 'status'))
+
+
+async def auser_statuses(user, data):
+    if not user.is_authenticated:
+        return {}
+    book_ids = [book['id'] for book in _books(data)]
+    statuses = BookStatus.objects.filter(user=user, book_id__in=book_ids).values_list('book_id', 'status')
+    return {book_id: book_status async for book_id, book_status in statuses}
+
+
+def _none_match_fails(request, etag):
+    # слабое сравнение, как для GET в RFC 9110: W/ не учитывается, '*' совпадает с любым тегом
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    return any(tag == '*' or tag.removeprefix('W/') == etag for tag in etags)
+
+
+def _conditional(request, key, data, statuses):
+    """
+    ETag ответа и данные со статусами юзера, или None вместо данных, если клиенту хватит 304.
+    Без ключа (кеш выключен) ETag нет.
+    """
+    etag = key and '"%s"' % _digest(key, sorted(statuses.items()))
+    if etag and _none_match_fails(request, etag):
+        return etag, None
+    if statuses:
+        for book in _books(data):
+            book['status'] = statuses.get(book['id'], '')
+    return etag, data
+
+
+def respond(request, key, build):
+    """
+    Отдает закешированный ответ по key (build() строит данные при промахе, None - книга не найдена),
+    подмешивает статусы юзера и поддерживает ETag/If-None-Match.
+    """
+    data = key and cache.get(key)
+    if data is None:
+        data = build()
+        if data is None:
+            return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+        if key:
+            cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+
+    etag, data = _conditional(request, key, data, user_statuses(request.user, data))
+    response = Response(status=status.HTTP_304_NOT_MODIFIED) if data is None else Response(data)
+    if etag:
+        response['ETag'] = etag
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+async def arespond(request, key, build, render):
+    """
+    respond для async views: build - корутина, render(data, status) строит ответ.
+    """
+    data = key and await cache.aget(key)
+    if data is None:
+        data = await build()
+        if data is None:
+            return render({"error": "Book not found"}, status.HTTP_404_NOT_FOUND)
+        if key:
+            await cache.aset(key, data, settings.CATALOG_CACHE_TIMEOUT)
+
+    etag, data = _conditional(request, key, data, await auser_statuses(request.user, data))
+    response = render(None, status.HTTP_304_NOT_MODIFIED) if data is None else render(data, status.HTTP_200_OK)
+    if etag:
+        response['ETag'] = etag
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.CATALOG_CACHE_ENABLED and backend == 'django.core.cache.backends.locmem.LocMemCache':
+        return [Error(
+            f'CATALOG_CACHE_ENABLED needs a cache shared by all processes, {backend} is per process',
+            hint='Set BOOKS_REDIS_URL, BOOKS_CACHE_DIR or BOOKS_CACHE_TABLE, or disable CATALOG_CACHE_ENABLED',
+            id='reading.E001',
+        )]
+    return []
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_book(sender, instance, **kwargs):
+    invalidate_books([instance.pk])
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+@receiver(post_save, sender=BookGenre)
+@receiver(post_delete, sender=BookGenre)
+@receiver(post_save, sender=BookRating)
+@receiver(post_delete, sender=BookRating)
+def invalidate_related_book(sender, instance, **kwargs):
+    invalidate_books([instance.book_id])
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def invalidate_genre_books(sender, instance, **kwargs):
+    invalidate_books(BookGenre.objects.filter(genre_id=instance.pk).values_list('book_id', flat=True))
@@ -0,0 +1,106 @@
+"""
+Отдача файлов из MEDIA (PDF книг, обложки) кусками с поддержкой Range, ETag и Last-Modified.
+
+MEDIA_DELIVERY_MODE:
+    'stream'     - файл читается и отдается самим Django кусками по CHUNK_SIZE;
+    'x-accel'    - отдачу делает nginx по заголовку X-Accel-Redirect (internal location MEDIA_ACCEL_REDIRECT_PREFIX);
+    'x-sendfile' - отдачу делает Apache/lighttpd по заголовку X-Sendfile.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_chunks(file, start, length):
+    try:
+        file.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = file.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        file.close()
+
+
+def parse_range(header, size):
+    """
+    Разбирает Range с одним диапазоном. Возвращает (start, end) включительно,
+    None если заголовка нет или он не поддерживается, False если диапазон вне файла.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def serve(request, field_file, content_type, attachment=False):
+    storage, name = field_file.storage, field_file.name
+    size = storage.size(name)
+    mtime = int(storage.get_modified_time(name).timestamp())
+    etag = '"%x-%x"' % (mtime, size)
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        response = _build_response(request, storage, name, size, etag, content_type)
+        disposition = 'attachment' if attachment else 'inline'
+        response['Content-Disposition'] = f"{disposition}; filename*=UTF-8''{quote(os.path.basename(name))}"
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _build_response(request, storage, name, size, etag, content_type):
+    mode = settings.MEDIA_DELIVERY_MODE
+    if mode == 'x-accel':
+        # Range и условные запросы nginx обработает сам
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(name)
+        return response
+    if mode == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = storage.path(name)
+        return response
+
+    byte_range = parse_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if if_range and if_range != etag:
+        # файл поменялся с момента первого запроса - отдаем его целиком
+        byte_range = None
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        file_chunks(storage.open(name, 'rb'), start, length),
+        status=206 if byte_range else 200,
+        content_type=content_type,
+    )
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
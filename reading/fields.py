@@ -0,0 +1,43 @@
+from django.db import models
+
+from . import pagetext
+
+
+class CompressedTextField(models.TextField):
+    """
+    Текстовое поле, которое хранится в бинарной колонке в сжатом виде (см. pagetext).
+    dictionary_key - атрибут модели, по которому выбирается словарь сжатия (например book_id).
+    """
+
+    def __init__(self, *args, dictionary_key=None, **kwargs):
+        self.dictionary_key = dictionary_key
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.dictionary_key is not None:
+            kwargs['dictionary_key'] = self.dictionary_key
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        return pagetext.decode(value)
+
+    def pre_save(self, model_instance, add):
+        value = super().pre_save(model_instance, add)
+        if not isinstance(value, str):
+            return value
+        dictionary_id = None
+        if self.dictionary_key is not None:
+            key = getattr(model_instance, self.dictionary_key)
+            dictionary_id = key is not None and pagetext.book_dictionary_id(key)
+        return pagetext.encode(value, dictionary_id)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = pagetext.encode(value)
+        return connection.Database.Binary(bytes(value))
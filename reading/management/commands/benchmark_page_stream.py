@@ -0,0 +1,64 @@
+import random
+import time
+import tracemalloc
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from reading.models import Book, Page
+from reading.serializers import PageSerializer
+from reading.streaming import stream_queryset
+
+WORDS = 'the of and to in was he that it his her with as had for at but not on she be'.split()
+FIELDS = ['id', 'text', 'page_number', 'book_id']
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пиковую память и время выгрузки всех страниц книги: список через PageSerializer '
+            'и JSONRenderer против потоковой выдачи PageDumpView. Книги создаются в транзакции, которая откатывается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+', default=[500, 2000, 8000], help='Размеры книг')
+        parser.add_argument('--words', type=int, default=250, help='Слов на странице')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        self.stdout.write(f'{"pages":>6} {"body MB":>8} {"list peak MB":>13} {"list s":>7} '
+                          f'{"stream peak MB":>15} {"stream s":>9}')
+        with transaction.atomic():
+            for count in options['pages']:
+                book = Book.objects.bulk_create(
+                    [Book(name=f'Stream benchmark {uuid.uuid4().hex[:8]}', author='Benchmark', total_pages=count)]
+                )[0]
+                Page.objects.bulk_create([
+                    Page(book_id=book.pk, page_number=number,
+                         text=' '.join(rng.choice(WORDS) for _ in range(options['words'])))
+                    for number in range(1, count + 1)
+                ], batch_size=500)
+                pages = Page.objects.filter(book_id=book.pk).order_by('page_number')
+
+                size, list_peak, list_seconds = self.measure(
+                    lambda: [JSONRenderer().render(PageSerializer(pages, many=True).data)]
+                )
+                streamed, stream_peak, stream_seconds = self.measure(lambda: stream_queryset(pages, FIELDS))
+                if streamed != size:
+                    self.stderr.write(f'Body sizes differ for {count} pages: {size} and {streamed}')
+                self.stdout.write(
+                    f'{count:>6} {size / 2 ** 20:>8.1f} {list_peak / 2 ** 20:>13.1f} {list_seconds:>7.2f} '
+                    f'{stream_peak / 2 ** 20:>15.1f} {stream_seconds:>9.2f}'
+                )
+            transaction.set_rollback(True)
+
+    def measure(self, body):
+        """
+        (размер ответа, пик памяти, время). Куски ответа отбрасываются, как после записи в сокет.
+        """
+        tracemalloc.start()
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in body())
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size, peak, seconds
@@ -0,0 +1,53 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from reading import pagetext
+from reading.models import Page
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько места экономит сжатие текста страниц и сколько стоит распаковка одной страницы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', help='Только страницы указанных книг')
+        parser.add_argument('--sample', type=int, default=2000, help='Сколько страниц прочитать, 0 - все')
+
+    def handle(self, *args, **options):
+        pages = Page.objects.order_by('?' if options['sample'] else 'pk')
+        if options['book']:
+            pages = pages.filter(book_id__in=options['book'])
+        if options['sample']:
+            pages = pages[:options['sample']]
+        # сырые значения колонки, мимо from_db_value
+        sql, params = pages.values_list('text').query.sql_with_params()
+
+        raw_size = stored_size = 0
+        timings = []
+        codecs = {}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for stored, in cursor:
+                stored = bytes(stored)
+                started = time.perf_counter()
+                text = pagetext.decode(stored)
+                timings.append(time.perf_counter() - started)
+                raw_size += len(text.encode())
+                stored_size += len(stored)
+                codec = pagetext.HEADER.unpack_from(stored)[0]
+                codecs[codec] = codecs.get(codec, 0) + 1
+
+        if not timings:
+            self.stdout.write('No pages')
+            return
+        names = {value: name for name, value in pagetext.CODECS.items()}
+        timings.sort()
+        saved = 1 - stored_size / raw_size if raw_size else 0
+        self.stdout.write(f'Pages read:      {len(timings)}')
+        self.stdout.write('Codecs:          ' + ', '.join(f'{names[c]}={n}' for c, n in sorted(codecs.items())))
+        self.stdout.write(f'Raw text:        {raw_size} bytes')
+        self.stdout.write(f'Stored:          {stored_size} bytes ({saved:.1%} saved)')
+        self.stdout.write(f'Decode per page: mean {statistics.mean(timings) * 1e6:.1f}us, '
+                          f'p95 {timings[int(len(timings) * 0.95)] * 1e6:.1f}us')
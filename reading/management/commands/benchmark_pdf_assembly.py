@@ -0,0 +1,69 @@
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from reading.models import Book, Page
+from reading.rendering import FRAGMENTS_DIR, render_book_pdf
+
+WORDS = 'the of and to in was he that it his her with as had for at but not on she be'.split()
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает полную сборку PDF книги, когда все фрагменты рисуются заново, со сборкой после правки '
+            'одной страницы. Книга создается в транзакции, которая откатывается, фрагменты пишутся во временный каталог')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=2000)
+        parser.add_argument('--words', type=int, default=250, help='Слов на странице')
+        parser.add_argument('--repeat', type=int, default=3, help='Сколько раз повторить каждый замер')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with tempfile.TemporaryDirectory(prefix='books-pdf-') as media_root, override_settings(MEDIA_ROOT=media_root):
+            with transaction.atomic():
+                book = Book.objects.bulk_create(
+                    [Book(name=f'PDF benchmark {uuid.uuid4().hex[:8]}', author='Benchmark', total_pages=options['pages'])]
+                )[0]
+                Page.objects.bulk_create([
+                    Page(book_id=book.pk, page_number=number, text=self.text(rng, options['words']))
+                    for number in range(1, options['pages'] + 1)
+                ], batch_size=500)
+                page_ids = list(Page.objects.filter(book_id=book.pk).values_list('pk', flat=True))
+
+                def full_rebuild():
+                    # без кеша фрагментов рисуется каждая страница, как раньше в Book.save()
+                    shutil.rmtree(os.path.join(media_root, FRAGMENTS_DIR), ignore_errors=True)
+                    return render_book_pdf(book)
+
+                def one_page_edit():
+                    Page.objects.filter(pk=rng.choice(page_ids)).update(text=self.text(rng, options['words']))
+                    return render_book_pdf(book)
+
+                self.stdout.write(f'{options["pages"]} page(s), {options["words"]} word(s) per page')
+                self.stdout.write(f'{"scenario":<16} {"median ms":>10} {"min ms":>8} {"PDF KB":>8}')
+                full = self.report('full rebuild', full_rebuild, options['repeat'])
+                self.report('no changes', lambda: render_book_pdf(book), options['repeat'])
+                edit = self.report('one page edit', one_page_edit, options['repeat'])
+                self.stdout.write(self.style.SUCCESS(f'One page edit is {full / edit:.1f}x faster than a full rebuild'))
+                transaction.set_rollback(True)
+
+    def text(self, rng, words):
+        return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+    def report(self, name, build, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            pdf = build()
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        self.stdout.write(f'{name:<16} {median * 1000:>10.1f} {min(timings) * 1000:>8.1f} {len(pdf) / 1024:>8.0f}')
+        return median
@@ -0,0 +1,144 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from reading.models import Page
+from regauth.tokens import VersionedRefreshToken
+
+SYNC_PREFIX = '/api/v1/'
+ASYNC_PREFIX = '/api/v1/async/'
+
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+class Client:
+    """
+    Минимальный HTTP/1.1 клиент с keep-alive, чтобы не тянуть httpx/aiohttp ради бенчмарка.
+    """
+
+    def __init__(self, host, port, headers):
+        self.host, self.port = host, port
+        self.headers = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n{self.headers}\r\n'.encode())
+        await self.writer.drain()
+        try:
+            status, keep_alive = await read_response(self.reader)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        if not keep_alive:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест читающих эндпоинтов: sync (api/v1/) против async (api/v1/async/), '
+            'печатает пропускную способность и p50/p99. Сервер запускается отдельно, например '
+            '`gunicorn Books.wsgi` и `uvicorn Books.asgi:application`')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес сервера с sync и async путями')
+        parser.add_argument('--async-url', help='Отдельный адрес ASGI сервера для async путей')
+        parser.add_argument('--book', type=int, help='Книга для карточки и страниц (по умолчанию первая со страницами)')
+        parser.add_argument('--user', help='username, от имени которого читаются страницы')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый эндпоинт и путь')
+
+    def handle(self, *args, **options):
+        page = Page.objects.order_by('book_id', 'page_number')
+        if options['book']:
+            page = page.filter(book_id=options['book'])
+        page = page.only('id', 'book_id').first()
+        if page is None:
+            raise CommandError('No book with pages to benchmark')
+
+        headers = {}
+        endpoints = [('book list', 'books/'), ('book detail', f'books/{page.book_id}/')]
+        if options['user']:
+            user = get_user_model().objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'User {options["user"]!r} not found')
+            headers['Authorization'] = f'Bearer {VersionedRefreshToken.for_user(user).access_token}'
+            endpoints += [('page list', f'books/{page.book_id}/pages/'),
+                          ('page detail', f'books/{page.book_id}/pages/{page.pk}/')]
+        else:
+            self.stdout.write(self.style.WARNING('Pass --user to benchmark page endpoints'))
+
+        sync_url = urlsplit(options['url'])
+        async_url = urlsplit(options['async_url'] or options['url'])
+        self.stdout.write(f'{"endpoint":<12} {"path":<6} {"req/s":>9} {"p50 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for name, path in endpoints:
+            for label, url, prefix in (('sync', sync_url, SYNC_PREFIX), ('async', async_url, ASYNC_PREFIX)):
+                rate, latencies, errors = asyncio.run(self.run(
+                    url, headers, prefix + path, options['concurrency'], options['requests']
+                ))
+                self.stdout.write(
+                    f'{name:<12} {label:<6} {rate:>9.0f} {percentile(latencies, 0.5) * 1000:>8.1f} '
+                    f'{percentile(latencies, 0.99) * 1000:>8.1f} {errors:>7}'
+                )
+
+    async def run(self, url, headers, path, concurrency, total):
+        latencies, errors = [], 0
+        remaining = total
+
+        async def worker():
+            nonlocal remaining, errors
+            client = Client(url.hostname, url.port or 80, headers)
+            try:
+                while remaining > 0:
+                    remaining -= 1
+                    started = time.perf_counter()
+                    try:
+                        status = await client.get(path)
+                    except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+                    if status >= 400:
+                        errors += 1
+            finally:
+                client.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return len(latencies) / elapsed if elapsed else 0, latencies, errors
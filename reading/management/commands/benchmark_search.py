@@ -0,0 +1,133 @@
+import os
+import shutil
+import sqlite3
+import string
+import tempfile
+import time
+
+import numpy as np
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from reading import pagetext, search
+from reading.models import Book, Page
+
+ALIAS = 'search_benchmark'
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0
+
+
+class Command(BaseCommand):
+    help = ('Задержка search() на синтетическом корпусе (по умолчанию миллион страниц) во временной базе SQLite '
+            'с FTS5. Частоты слов распределены по Ципфу, запросы из частых, средних и редких слов')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1_000_000)
+        parser.add_argument('--pages-per-book', type=int, default=500)
+        parser.add_argument('--words', type=int, default=250, help='Слов на странице')
+        parser.add_argument('--vocabulary', type=int, default=50_000, help='Размер словаря корпуса')
+        parser.add_argument('--queries', type=int, default=100, help='Запросов каждого вида')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--path', help='Файл базы: если он есть, корпус не строится заново (и файл не удаляется)')
+
+    def handle(self, *args, **options):
+        directory = None
+        path = options['path']
+        if path is None:
+            directory = tempfile.mkdtemp(prefix='books-search-')
+            path = os.path.join(directory, 'search.sqlite3')
+        rng = np.random.default_rng(0)
+        vocabulary = self.vocabulary(rng, options['vocabulary'])
+        connections.settings[ALIAS] = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'OPTIONS': {}, 'TEST': {},
+        }
+        try:
+            if not os.path.exists(path):
+                self.build(path, rng, vocabulary, options)
+            pages = Page.objects.using(ALIAS).count()
+            self.stdout.write(f'{pages} page(s), {os.path.getsize(path) / 2 ** 30:.2f} GB on disk')
+            self.stdout.write(f'{"query":<22} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8} {"hits":>6}')
+            for name, ranks in self.query_kinds(options['vocabulary']):
+                self.report(name, rng, vocabulary, ranks, options)
+        finally:
+            connections[ALIAS].close()
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def vocabulary(self, rng, size):
+        letters = np.array(list(string.ascii_lowercase))
+        words = set()
+        while len(words) < size:
+            words.add(''.join(rng.choice(letters, rng.integers(3, 10))))
+        return sorted(words)
+
+    def query_kinds(self, size):
+        # ранги слов в словаре: 0 - самое частое
+        return [
+            ('common word', (10, 100)),
+            ('medium word', (1000, 5000)),
+            ('rare word', (size // 2, size)),
+            ('two medium words', (1000, 5000, 2)),
+            ('common + rare word', (10, 100, size // 2, size)),
+        ]
+
+    def build(self, path, rng, vocabulary, options):
+        started = time.perf_counter()
+        self.stdout.write('Building corpus...')
+        call_command('migrate', database=ALIAS, verbosity=0)
+        books = -(-options['pages'] // options['pages_per_book'])
+        Book.objects.using(ALIAS).bulk_create(
+            [Book(name=f'Book {i}', author=f'Author {i % 100}') for i in range(books)], batch_size=1000
+        )
+        book_ids = list(Book.objects.using(ALIAS).order_by('pk').values_list('pk', flat=True))
+        for book_id, name, author in Book.objects.using(ALIAS).values_list('pk', 'name', 'author'):
+            with connections[ALIAS].cursor() as cursor:
+                search.get_backend(connections[ALIAS]).index_book(cursor, book_id, name, author)
+        connections[ALIAS].close()
+
+        weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+        weights /= weights.sum()
+        # search() читает у страниц только номер и книгу, текст лежит в индексе FTS
+        empty = pagetext.encode('')
+        db = sqlite3.connect(path, isolation_level=None)
+        db.execute('PRAGMA journal_mode=OFF')
+        db.execute('PRAGMA synchronous=OFF')
+        db.execute('BEGIN')
+        chunk = 10_000
+        for start in range(0, options['pages'], chunk):
+            count = min(chunk, options['pages'] - start)
+            indices = rng.choice(len(vocabulary), size=(count, options['words']), p=weights)
+            rows = []
+            for offset, row in enumerate(indices.tolist()):
+                number = start + offset
+                rows.append((number + 1, book_ids[number // options['pages_per_book']],
+                             number % options['pages_per_book'] + 1, ' '.join(vocabulary[i] for i in row)))
+            db.executemany(f'INSERT INTO {Page._meta.db_table} (id, book_id, page_number, text) VALUES (?, ?, ?, ?)',
+                           [(page_id, book_id, number, empty) for page_id, book_id, number, _ in rows])
+            db.executemany(f'INSERT INTO {search.PAGE_TABLE} (rowid, text, book_id) VALUES (?, ?, ?)',
+                           [(page_id, text, book_id) for page_id, book_id, _, text in rows])
+            if (start // chunk) % 10 == 9:
+                self.stdout.write(f'{start + count} page(s), {time.perf_counter() - started:.0f}s')
+        db.execute('COMMIT')
+        db.execute(f"INSERT INTO {search.PAGE_TABLE} ({search.PAGE_TABLE}) VALUES ('optimize')")
+        db.close()
+        self.stdout.write(f'Corpus built in {time.perf_counter() - started:.0f}s')
+
+    def report(self, name, rng, vocabulary, ranks, options):
+        bounds = list(zip(ranks[::2], ranks[1::2])) if len(ranks) != 3 else [ranks[:2]] * ranks[2]
+        timings, hits = [], 0
+        for _ in range(options['queries']):
+            query = ' '.join(vocabulary[rng.integers(low, high)] for low, high in bounds)
+            started = time.perf_counter()
+            book_ids, pages = search.search(query, limit=options['limit'], using=ALIAS)
+            timings.append(time.perf_counter() - started)
+            hits += len(pages)
+        self.stdout.write(
+            f'{name:<22} {percentile(timings, 0.5) * 1000:>8.1f} {percentile(timings, 0.95) * 1000:>8.1f} '
+            f'{percentile(timings, 0.99) * 1000:>8.1f} {max(timings) * 1000:>8.1f} {hits / options["queries"]:>6.1f}'
+        )
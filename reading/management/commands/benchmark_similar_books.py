@@ -0,0 +1,89 @@
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from scipy import sparse
+
+from reading import similarity
+from reading.models import SimilarBook
+
+
+def synthetic_matrix(users, books, per_user, seed=0):
+    """
+    Матрица users x books как у similarity.interaction_matrix: у юзера в среднем per_user книг,
+    популярность книг убывает по степенному закону, веса от 1 до 3.
+    """
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(per_user, users).clip(1, books)
+    popularity = 1.0 / (np.arange(books) + 10.0) ** 0.8
+    rows = np.repeat(np.arange(users), counts)
+    cols = rng.choice(books, size=len(rows), p=popularity / popularity.sum())
+    weights = rng.choice(np.array([1.0, 2.0, 3.0], dtype=np.float32), size=len(rows))
+    matrix = sparse.coo_matrix((weights, (rows, cols)), shape=(users, books), dtype=np.float32).tocsr()
+    matrix.sum_duplicates()
+    return matrix
+
+
+class Command(BaseCommand):
+    help = ('Замеряет полный и инкрементальный пересчет похожих книг на синтетической матрице '
+            '(по умолчанию 100k юзеров x 50k книг) теми же функциями, что и build_similar_books')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--books', type=int, default=50_000)
+        parser.add_argument('--per-user', type=int, default=30, help='Среднее число книг у юзера')
+        parser.add_argument('--metric', choices=similarity.METRICS, default='cosine')
+        parser.add_argument('--top-k', type=int, default=20)
+        parser.add_argument('--dirty', type=int, default=500, help='Книг в инкрементальном пересчете')
+        parser.add_argument('--write', action='store_true',
+                            help='Также записать соседей в SimilarBook (в транзакции, которая откатывается)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        matrix = synthetic_matrix(options['users'], options['books'], options['per_user'])
+        self.stdout.write(f'Matrix {matrix.shape[0]} x {matrix.shape[1]}, {matrix.nnz} interaction(s), '
+                          f'built in {time.perf_counter() - started:.1f}s')
+
+        metric, k = options['metric'], options['top_k']
+        started = time.perf_counter()
+        prepared = similarity.prepare(matrix, metric)
+        prepare_seconds = time.perf_counter() - started
+
+        targets = list(range(matrix.shape[1]))
+        neighbours = []
+        started = time.perf_counter()
+        for start in range(0, len(targets), similarity.BLOCK_SIZE):
+            cols = targets[start:start + similarity.BLOCK_SIZE]
+            neighbours.extend(similarity.top_k(similarity.similarity_rows(prepared, cols, metric), cols, k))
+        full_seconds = time.perf_counter() - started
+
+        rng = np.random.default_rng(1)
+        dirty = sorted(rng.choice(matrix.shape[1], size=min(options['dirty'], matrix.shape[1]), replace=False).tolist())
+        started = time.perf_counter()
+        similarity.top_k(similarity.similarity_rows(prepared, dirty, metric), dirty, k)
+        dirty_seconds = time.perf_counter() - started
+
+        self.stdout.write(f'Metric {metric}, top {k}, blocks of {similarity.BLOCK_SIZE} book(s)')
+        self.stdout.write(f'Normalization:          {prepare_seconds:.1f}s')
+        self.stdout.write(f'Full rebuild:           {full_seconds:.1f}s ({len(targets) / full_seconds:.0f} books/s)')
+        self.stdout.write(f'Incremental, {len(dirty)} books: {dirty_seconds:.2f}s')
+        if options['write']:
+            self.stdout.write(f'Writing neighbours:     {self.write(neighbours):.1f}s')
+        # ru_maxrss в килобайтах (Linux)
+        self.stdout.write(f'Peak RSS:               {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB')
+
+    def write(self, neighbours):
+        # id книг синтетические, транзакция откатывается до проверки внешних ключей
+        rows = [
+            SimilarBook(book_id=col + 1, similar_id=similar + 1, rank=rank, score=score)
+            for col, row in enumerate(neighbours)
+            for rank, (similar, score) in enumerate(row)
+        ]
+        started = time.perf_counter()
+        with transaction.atomic():
+            SimilarBook.objects.bulk_create(rows, batch_size=5000)
+            seconds = time.perf_counter() - started
+            transaction.set_rollback(True)
+        return seconds
@@ -0,0 +1,167 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from reading import pagetext
+from reading.models import Book, BookStatus, LastPage, Page
+from reading.sqlite import apply_pragmas
+from regauth.models import CustomUser
+
+ALIAS = 'sqlite_benchmark'
+WORDS = 'the of and to in was he that it his her with as had for at but not on she be'.split()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает конкурентность читателей страниц и писателя прогресса на SQLite '
+            'с настройками по умолчанию и с профилем SQLITE_WAL_PRAGMAS на схеме из миграций')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=20)
+        parser.add_argument('--pages', type=int, default=200, help='Страниц в книге')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--readers', type=int, default=4, help='Потоков, читающих страницы')
+        parser.add_argument('--writers', type=int, default=1, help='Потоков, пишущих прогресс')
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix='books-sqlite-')
+        try:
+            template = os.path.join(directory, 'template.sqlite3')
+            self.stdout.write('Building schema and data...')
+            self.build(template, options)
+            self.stdout.write(f'{"profile":<8} {"reads/s":>9} {"read p99 ms":>12} {"writes/s":>9} '
+                              f'{"write p99 ms":>13} {"locked":>7}')
+            profiles = [
+                ('default', {'journal_mode': 'DELETE', 'synchronous': 'FULL'}),
+                ('wal', settings.SQLITE_WAL_PRAGMAS),
+            ]
+            for name, pragmas in profiles:
+                path = os.path.join(directory, f'{name}.sqlite3')
+                shutil.copyfile(template, path)
+                self.report(name, self.run(path, pragmas, options))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def build(self, path, options):
+        connections.settings[ALIAS] = {
+            **connections[DEFAULT_DB_ALIAS].settings_dict,
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': path, 'OPTIONS': {}, 'TEST': {},
+        }
+        call_command('migrate', database=ALIAS, verbosity=0)
+        users = CustomUser.objects.using(ALIAS).bulk_create(
+            [CustomUser(username=f'reader{i}', email=f'reader{i}@example.com', password='!')
+             for i in range(options['users'])]
+        )
+        books = Book.objects.using(ALIAS).bulk_create(
+            [Book(name=f'Book {i}', author='Benchmark', total_pages=options['pages']) for i in range(options['books'])]
+        )
+        rng = random.Random(0)
+        for book in books:
+            # текст кладем уже сжатым, как его хранит CompressedTextField
+            Page.objects.using(ALIAS).bulk_create([
+                Page(book_id=book.pk, page_number=number,
+                     text=pagetext.encode(' '.join(rng.choice(WORDS) for _ in range(300))))
+                for number in range(1, options['pages'] + 1)
+            ])
+        connections[ALIAS].close()
+        self.user_ids = [user.pk for user in users]
+
+    def run(self, path, pragmas, options):
+        with sqlite3.connect(path) as db:
+            pages = db.execute(f'SELECT id, book_id FROM {Page._meta.db_table}').fetchall()
+        stop = threading.Event()
+        results = {'reads': [], 'writes': [], 'locked': 0}
+        lock = threading.Lock()
+
+        def connect():
+            # как у django: timeout 5s, транзакции открываем сами
+            db = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+            apply_pragmas(db.cursor(), pragmas)
+            return db
+
+        def reader():
+            db, latencies, locked = connect(), [], 0
+            rng = random.Random()
+            while not stop.is_set():
+                page_id, book_id = rng.choice(pages)
+                started = time.perf_counter()
+                try:
+                    row = db.execute(
+                        f'SELECT id, text, page_number, book_id FROM {Page._meta.db_table} WHERE id = ? AND book_id = ?',
+                        (page_id, book_id),
+                    ).fetchone()
+                    pagetext.decode(row[1])
+                except sqlite3.OperationalError:
+                    locked += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            with lock:
+                results['reads'].extend(latencies)
+                results['locked'] += locked
+            db.close()
+
+        def writer():
+            db, latencies, locked = connect(), [], 0
+            rng = random.Random()
+            while not stop.is_set():
+                page_id, book_id = rng.choice(pages)
+                user_id = rng.choice(self.user_ids)
+                started = time.perf_counter()
+                try:
+                    # то же, что progress.write_progress делает для одной позиции
+                    db.execute('BEGIN')
+                    db.execute(
+                        f'INSERT INTO {BookStatus._meta.db_table} (user_id, book_id, status) VALUES (?, ?, ?) '
+                        f'ON CONFLICT DO NOTHING', (user_id, book_id, 'reading'),
+                    )
+                    db.execute(
+                        f'INSERT INTO {LastPage._meta.db_table} (user_id, book_id, page_id, updated_at) '
+                        f'VALUES (?, ?, ?, ?) ON CONFLICT (user_id, book_id) '
+                        f'DO UPDATE SET page_id = excluded.page_id, updated_at = excluded.updated_at',
+                        (user_id, book_id, page_id, timezone.now().isoformat()),
+                    )
+                    db.execute('COMMIT')
+                except sqlite3.OperationalError:
+                    locked += 1
+                    if db.in_transaction:
+                        db.execute('ROLLBACK')
+                    continue
+                latencies.append(time.perf_counter() - started)
+            with lock:
+                results['writes'].extend(latencies)
+                results['locked'] += locked
+            db.close()
+
+        threads = ([threading.Thread(target=reader) for _ in range(options['readers'])]
+                   + [threading.Thread(target=writer) for _ in range(options['writers'])])
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        results['seconds'] = options['seconds']
+        return results
+
+    def report(self, name, results):
+        seconds = results['seconds']
+        self.stdout.write(
+            f'{name:<8} {len(results["reads"]) / seconds:>9.0f} {percentile(results["reads"], 0.99) * 1000:>12.2f} '
+            f'{len(results["writes"]) / seconds:>9.0f} {percentile(results["writes"], 0.99) * 1000:>13.2f} '
+            f'{results["locked"]:>7}'
+        )
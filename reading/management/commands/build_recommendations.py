@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from reading import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает рекомендации книг для юзеров и популярные книги для юзеров без рекомендаций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users', help='Только для этого юзера')
+
+    def handle(self, *args, **options):
+        built = recommendations.build(options['users'])
+        self.stdout.write(self.style.SUCCESS(f'Recommendations built for {built} user(s)'))
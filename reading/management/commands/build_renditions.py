@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from reading import catalog_cache, renditions
+from reading.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Строит уменьшенные копии обложек для книг, у которых их нет или они устарели'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', help='Только для указанных книг')
+
+    def handle(self, *args, **options):
+        books = Book.objects.order_by('pk')
+        if options['book']:
+            books = books.filter(pk__in=options['book'])
+        changed = []
+        for book in books.iterator(chunk_size=200):
+            if renditions.build(book):
+                changed.append(book.pk)
+        catalog_cache.invalidate_books(changed)
+        self.stdout.write(self.style.SUCCESS(f'Renditions updated for {len(changed)} book(s)'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from reading import similarity
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает похожие книги: по умолчанию только книги с изменившимися взаимодействиями и их соседи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать все книги')
+        parser.add_argument('--metric', choices=similarity.METRICS, default='cosine')
+        parser.add_argument('--top-k', type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options['full']:
+            built = similarity.build(metric=options['metric'], k=options['top_k'])
+        else:
+            built = similarity.refresh(metric=options['metric'], k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Similar books updated for {built} book(s)'))
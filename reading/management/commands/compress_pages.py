@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Length
+
+from reading import pagetext
+from reading.models import Page, PageTextDictionary
+
+
+class Command(BaseCommand):
+    help = 'Обучает словари сжатия по страницам книг и пересжимает ими текст страниц (PAGE_TEXT_COMPRESSION)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--book', type=int, action='append', help='Только для указанных книг')
+        parser.add_argument('--min-pages', type=int, default=20, help='Книги с меньшим числом страниц сжимаются без словаря')
+        parser.add_argument('--sample', type=int, default=200, help='Сколько страниц книги брать для обучения словаря')
+
+    def handle(self, *args, **options):
+        codec = pagetext.default_codec()
+        books = Page.objects.values('book_id').annotate(pages=Count('id')).order_by('book_id')
+        if options['book']:
+            books = books.filter(book_id__in=options['book'])
+
+        total_before = total_after = 0
+        for row in books:
+            book_id = row['book_id']
+            dictionary_id = None
+            if codec != pagetext.CODEC_NONE and row['pages'] >= options['min_pages']:
+                dictionary_id = self.train(book_id, codec, row['pages'], options['sample'])
+            before, after = self.recompress(book_id, dictionary_id)
+            total_before += before
+            total_after += after
+            self.stdout.write(f'Book {book_id}: {row["pages"]} page(s), {before} -> {after} bytes')
+
+        saved = 1 - total_after / total_before if total_before else 0
+        self.stdout.write(self.style.SUCCESS(f'Stored text: {total_before} -> {total_after} bytes ({saved:.0%} saved)'))
+
+    def train(self, book_id, codec, page_count, sample):
+        pages = Page.objects.filter(book_id=book_id)
+        page_ids = list(pages.order_by('page_number').values_list('pk', flat=True))
+        # страницы равномерно по всей книге
+        sample_ids = page_ids[::max(page_count // sample, 1)][:sample]
+        data = pagetext.train_dictionary(pages.filter(pk__in=sample_ids).values_list('text', flat=True), codec)
+        if not data:
+            return None
+        dictionary = PageTextDictionary.objects.create(book_id=book_id, codec=codec, data=data)
+        pagetext.forget_book_dictionary(book_id)
+        return dictionary.pk
+
+    def recompress(self, book_id, dictionary_id):
+        after = 0
+        batch = []
+        with transaction.atomic():
+            pages = Page.objects.filter(book_id=book_id)
+            before = pages.aggregate(size=Sum(Length('text')))['size'] or 0
+            for page in pages.only('text').order_by('pk').iterator(chunk_size=500):
+                # bulk_update не вызывает pre_save, поэтому кладем уже сжатые байты
+                page.text = pagetext.encode(page.text, dictionary_id)
+                after += len(page.text)
+                batch.append(page)
+                if len(batch) >= 500:
+                    Page.objects.bulk_update(batch, ['text'])
+                    batch = []
+            Page.objects.bulk_update(batch, ['text'])
+        return before, after
@@ -0,0 +1,213 @@
+import csv
+import json
+import os
+import time
+from decimal import Decimal
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from reading import catalog_cache, search
+from reading.models import Book, BookGenre, BookRenderJob, Genre, Page
+
+MAX_PAGE_NUMBER = Decimal('9999.9')
+
+
+def read_jsonl(path):
+    """
+    Одна книга на строку: {"name", "author", "genres": [...], "image": "cover.jpg",
+    "pages": ["текст", ...] или [{"page_number": 1, "text": "..."}, ...]}
+    """
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f'{path}:{line_number}: {e}')
+
+
+def read_csv(path):
+    """
+    Одна страница на строку, колонки name, author, text и необязательные page_number, genres (через ;), image.
+    Строки одной книги должны идти подряд.
+    """
+    book = None
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            if book is None or row['name'] != book['name']:
+                if book is not None:
+                    yield book
+                book = {
+                    'name': row['name'],
+                    'author': row['author'],
+                    'genres': [genre.strip() for genre in (row.get('genres') or '').split(';') if genre.strip()],
+                    'image': row.get('image') or None,
+                    'pages': [],
+                }
+            page = {'text': row['text']}
+            if row.get('page_number'):
+                page['page_number'] = row['page_number']
+            book['pages'].append(page)
+    if book is not None:
+        yield book
+
+
+def read_text(path, author, page_chars):
+    """
+    Текст книги (например выгрузка EPUB в txt). Страницы разделены символом \\f,
+    если его нет - текст режется на страницы по page_chars символов по границам строк.
+    """
+    with open(path, encoding='utf-8') as f:
+        content = f.read()
+    if '\f' in content:
+        pages = [page.strip() for page in content.split('\f')]
+    else:
+        pages, current = [], ''
+        for line in content.splitlines(keepends=True):
+            if current and len(current) + len(line) > page_chars:
+                pages.append(current.strip())
+                current = ''
+            current += line
+        pages.append(current.strip())
+    name = os.path.splitext(os.path.basename(path))[0]
+    yield {'name': name, 'author': author, 'pages': [page for page in pages if page]}
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт книг со страницами из JSONL, CSV или txt без сигналов и рендера PDF на каждую страницу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы .jsonl, .csv или .txt')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Сколько страниц вставлять за раз')
+        parser.add_argument('--author', help='Автор для книг из .txt')
+        parser.add_argument('--page-chars', type=int, default=1800, help='Размер страницы для .txt без \\f')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.search_backend = search.get_backend()
+        self.book_ids = []
+        self.pages = 0
+        self.skipped = 0
+        self.seen = set()
+        started = time.monotonic()
+
+        batch, batch_pages = [], 0
+        for path in options['paths']:
+            for data in self.read(path, options):
+                book = self.build_book(data, os.path.dirname(path))
+                if book is None:
+                    continue
+                batch.append(book)
+                batch_pages += len(book[1])
+                if batch_pages >= self.batch_size:
+                    self.flush(batch)
+                    batch, batch_pages = [], 0
+        if batch:
+            self.flush(batch)
+
+        # PDF рендерится один раз на книгу, воркером render_books
+        now = timezone.now()
+        BookRenderJob.objects.bulk_create(
+            [BookRenderJob(book_id=book_id, run_after=now) for book_id in self.book_ids],
+            batch_size=self.batch_size, ignore_conflicts=True,
+        )
+        catalog_cache.invalidate_books(self.book_ids)
+
+        elapsed = time.monotonic() - started
+        rate = self.pages / elapsed if elapsed else 0
+        if self.skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {self.skipped} book(s) that already exist or repeat'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {len(self.book_ids)} book(s), {self.pages} page(s) in {elapsed:.1f}s ({rate:.0f} pages/sec)'
+        ))
+
+    def read(self, path, options):
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.jsonl':
+            return read_jsonl(path)
+        if extension == '.csv':
+            return read_csv(path)
+        if extension == '.txt':
+            if not options['author']:
+                raise CommandError('--author is required for .txt sources')
+            return read_text(path, options['author'], options['page_chars'])
+        raise CommandError(f'Unsupported source: {path}')
+
+    def build_book(self, data, base_dir):
+        name, author = (data.get('name') or '').strip(), (data.get('author') or '').strip()
+        if not name or not author:
+            raise CommandError(f'Book without name or author: {data.get("name")!r}')
+        if len(name) > Book._meta.get_field('name').max_length:
+            raise CommandError(f'Book name is too long: {name!r}')
+
+        if name in self.seen:
+            self.skipped += 1
+            return None
+        self.seen.add(name)
+
+        pages, page_numbers = [], set()
+        for index, page in enumerate(data.get('pages') or [], 1):
+            if isinstance(page, str):
+                page = {'text': page}
+            page_number = Decimal(str(page.get('page_number', index)))
+            if not 0 < page_number <= MAX_PAGE_NUMBER:
+                raise CommandError(f'{name}: page number {page_number} is out of range')
+            if page_number in page_numbers:
+                raise CommandError(f'{name}: duplicate page number {page_number}')
+            page_numbers.add(page_number)
+            pages.append(Page(page_number=page_number, text=page['text']))
+
+        book = Book(name=name, author=author, total_pages=len(pages))
+        image = data.get('image')
+        return book, pages, data.get('genres') or [], image and os.path.join(base_dir, image)
+
+    def save_image(self, book, path):
+        with open(path, 'rb') as f:
+            book.image.name = default_storage.save(
+                book.image.field.generate_filename(book, os.path.basename(path)), File(f)
+            )
+
+    def flush(self, batch):
+        names = {book.name for book, pages, genres, image in batch}
+        existing = set(Book.objects.filter(name__in=names).values_list('name', flat=True))
+        if existing:
+            self.skipped += len(existing)
+            batch = [item for item in batch if item[0].name not in existing]
+        for book, pages, genres, image in batch:
+            if image:
+                self.save_image(book, image)
+
+        with transaction.atomic():
+            books = Book.objects.bulk_create([book for book, pages, genres, image in batch])
+
+            genre_names = {genre for book, pages, genres, image in batch for genre in genres}
+            Genre.objects.bulk_create([Genre(name=genre) for genre in genre_names], ignore_conflicts=True)
+            genre_ids = dict(Genre.objects.filter(name__in=genre_names).values_list('name', 'id'))
+            BookGenre.objects.bulk_create(
+                [BookGenre(book=book, genre_id=genre_ids[genre])
+                 for book, pages, genres, image in batch for genre in genres],
+                ignore_conflicts=True,
+            )
+
+            pages = []
+            for book, book_pages, genres, image in batch:
+                for page in book_pages:
+                    page.book = book
+                pages.extend(book_pages)
+            Page.objects.bulk_create(pages, batch_size=self.batch_size)
+
+            # bulk_create не шлет post_save, индексируем поиск сами
+            with connection.cursor() as cursor:
+                for book in books:
+                    self.search_backend.index_book(cursor, book.pk, book.name, book.author)
+                for page in pages:
+                    self.search_backend.index_page(cursor, page.pk, page.book_id, page.text)
+
+        self.book_ids.extend(book.pk for book in books)
+        self.pages += len(pages)
+        self.stdout.write(f'{len(self.book_ids)} book(s), {self.pages} page(s)...')
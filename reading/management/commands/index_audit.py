@@ -0,0 +1,131 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from reading.models import Book, BookFeedback, BookGenre, Genre, Page
+from regauth.tokens import VersionedRefreshToken
+
+PARAMETER = re.compile(r'<(?:\w+:)?(\w+)>')
+
+
+def routes(patterns, prefix=''):
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from routes(pattern.url_patterns, route)
+        elif isinstance(pattern, URLPattern):
+            yield route, pattern.name
+
+
+def full_scans(connection, plan):
+    """
+    Строки плана, где таблица читается целиком.
+    """
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail); SCAN ... USING INDEX и виртуальные таблицы FTS не в счет
+        details = [row[-1] for row in plan]
+        return [detail for detail in details if detail.startswith('SCAN ')
+                and 'USING' not in detail and 'VIRTUAL TABLE' not in detail and '(' not in detail
+                and detail != 'SCAN CONSTANT ROW']
+    return [row[0].strip() for row in plan if 'Seq Scan on' in row[0]]
+
+
+class Command(BaseCommand):
+    help = ('Вызывает GET всех эндпоинтов api/v1/, делает EXPLAIN каждого их запроса и показывает полные '
+            'сканы таблиц. Записи (прогресс чтения) откатываются, кеш каталога на время проверки отключен')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='username, от имени которого вызываются эндпоинты (по умолчанию первый)')
+        parser.add_argument('--prefix', default='api/v1/', help='Проверять только пути с этим префиксом')
+        parser.add_argument('--verbose-plans', action='store_true', help='Печатать планы всех запросов')
+        parser.add_argument('--fail', action='store_true', help='Завершиться с ошибкой, если есть полные сканы')
+
+    def handle(self, *args, **options):
+        users = get_user_model().objects.order_by('pk')
+        user = (users.filter(username=options['user']) if options['user'] else users).first()
+        if user is None:
+            raise CommandError('No user to call endpoints with')
+        page = Page.objects.order_by('book_id', 'page_number').only('id', 'book_id').first()
+        if page is None:
+            raise CommandError('No book with pages to audit')
+        samples = {
+            'book_id': page.book_id,
+            'page_id': page.pk,
+            'pk': BookFeedback.objects.filter(user=user).values_list('pk', flat=True).first() or 0,
+        }
+        genre = Genre.objects.filter(pk__in=BookGenre.objects.values('genre_id')).values_list('name', flat=True).first()
+        query_params = {
+            'search': {'q': Book.objects.filter(pk=page.book_id).values_list('name', flat=True).get().split()[0]},
+            'search-by-genre': {'genre': genre or ''},
+            'last-page': {'book': page.book_id},
+        }
+        client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Bearer {VersionedRefreshToken.for_user(user).access_token}')
+
+        flagged = audited = 0
+        with override_settings(
+            ALLOWED_HOSTS=['*'],
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+            READING_PROGRESS_FLUSH_INTERVAL=0,
+        ):
+            for route, name in routes(get_resolver().url_patterns):
+                if not route.startswith(options['prefix']):
+                    continue
+                if any(parameter not in samples for parameter in PARAMETER.findall(route)):
+                    self.stdout.write(self.style.WARNING(f'Skipped {route}: no sample for its parameters'))
+                    continue
+                path = '/' + PARAMETER.sub(lambda match: str(samples[match.group(1)]), route)
+                queries, status = self.capture(client, path, query_params.get(name, {}))
+                if status == 405:
+                    continue
+                self.stdout.write(f'{path} [{status}] {len(queries)} quer{"y" if len(queries) == 1 else "ies"}')
+                for alias, sql in queries:
+                    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                        continue
+                    audited += 1
+                    plan = self.explain(alias, sql)
+                    scans = full_scans(connections[alias], plan)
+                    if options['verbose_plans'] or scans:
+                        self.stdout.write(f'  {sql[:200]}')
+                    if options['verbose_plans']:
+                        for row in plan:
+                            self.stdout.write(f'    {row[-1] if connections[alias].vendor == "sqlite" else row[0]}')
+                    # страница списка без фильтра (ORDER BY pk LIMIT n) читает таблицу по порядку и останавливается
+                    if scans and ' LIMIT ' in sql and ' WHERE ' not in sql:
+                        self.stdout.write(f'    scan stops at LIMIT: {", ".join(scans)}')
+                        continue
+                    for scan in scans:
+                        flagged += 1
+                        self.stdout.write(self.style.ERROR(f'    full scan: {scan}'))
+
+        summary = f'{audited} select(s) explained, {flagged} full scan(s)'
+        if flagged and options['fail']:
+            raise CommandError(summary)
+        self.stdout.write(self.style.WARNING(summary) if flagged else self.style.SUCCESS(summary))
+
+    def capture(self, client, path, params):
+        contexts = [CaptureQueriesContext(connections[alias]) for alias in connections]
+        with transaction.atomic():
+            for context in contexts:
+                context.__enter__()
+            try:
+                response = client.get(path, params)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            finally:
+                for context in contexts:
+                    context.__exit__(None, None, None)
+            # прогресс чтения и прочие побочные записи GET не сохраняем
+            transaction.set_rollback(True)
+        queries = [(context.connection.alias, query['sql']) for context in contexts for query in context.captured_queries]
+        return queries, response.status_code
+
+    def explain(self, alias, sql):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return cursor.fetchall()
@@ -0,0 +1,28 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from reading.models import Book
+from reading.rendering import FRAGMENTS_DIR, book_fragment_keys, fragment_path
+
+
+class Command(BaseCommand):
+    help = 'Удаляет закешированные PDF фрагменты, которые не входят ни в одну книгу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        live = set()
+        for book in Book.objects.all():
+            live.update(fragment_path(key) for key in book_fragment_keys(book))
+
+        removed = 0
+        if default_storage.exists(FRAGMENTS_DIR):
+            for prefix in default_storage.listdir(FRAGMENTS_DIR)[0]:
+                for name in default_storage.listdir(f'{FRAGMENTS_DIR}/{prefix}')[1]:
+                    path = f'{FRAGMENTS_DIR}/{prefix}/{name}'
+                    if path not in live:
+                        removed += 1
+                        if not options['dry_run']:
+                            default_storage.delete(path)
+        self.stdout.write(f'Removed {removed} fragment(s), {len(live)} in use')
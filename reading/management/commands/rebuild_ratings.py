@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from reading.models import Book, BookRating
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает rating_sum/rating_count книг по BookRating и показывает расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        drifted = 0
+        with transaction.atomic():
+            actual = {
+                row['book_id']: (row['total'], row['count'])
+                for row in BookRating.objects.exclude(rating__isnull=True).values('book_id')
+                .annotate(total=Sum('rating'), count=Count('id'))
+            }
+            books = Book.objects.select_for_update().only('name', 'rating_sum', 'rating_count')
+            for book in books.iterator(chunk_size=1000):
+                rating_sum, rating_count = actual.get(book.pk, (0, 0))
+                if (book.rating_sum, book.rating_count) == (rating_sum, rating_count):
+                    continue
+                drifted += 1
+                self.stdout.write(
+                    f'{book.pk} {book.name}: stored {book.rating_sum}/{book.rating_count}, '
+                    f'actual {rating_sum}/{rating_count}'
+                )
+                if not options['dry_run']:
+                    Book.objects.filter(pk=book.pk).update(rating_sum=rating_sum, rating_count=rating_count)
+
+        if drifted:
+            action = 'found' if options['dry_run'] else 'fixed'
+            self.stdout.write(self.style.WARNING(f'{drifted} book(s) with drift {action}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No drift'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reading import search
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает полнотекстовый индекс страниц и книг'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt'))
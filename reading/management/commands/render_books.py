@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from reading.models import BookRenderJob
+from reading.rendering import run_job
+
+
+class Command(BaseCommand):
+    help = 'Воркер очереди рендеринга PDF книг'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Обработать готовые задачи и выйти')
+        parser.add_argument('--interval', type=float, default=2.0, help='Пауза между опросами очереди, сек')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                requeued = BookRenderJob.requeue_stale(settings.BOOK_RENDER_STALE_TIMEOUT)
+                if requeued:
+                    self.stdout.write(f'Requeued {requeued} stale job(s)')
+                processed = self.drain()
+                if options['once']:
+                    break
+                if not processed:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
+
+    def drain(self):
+        processed = 0
+        while (job := BookRenderJob.claim()) is not None:
+            processed += 1
+            result = run_job(job)
+            if result:
+                self.stdout.write(self.style.SUCCESS(f'Rendered book {job.book_id}'))
+            elif result is None:
+                self.stdout.write(f'Book {job.book_id} changed during render, left to the next job')
+            else:
+                self.stderr.write(f'Render of book {job.book_id} failed (attempt {job.attempts})')
+        return processed
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Обслуживание SQLite: чекпоинт WAL (чтобы файл -wal не рос), PRAGMA optimize '
+            'и при --analyze полный ANALYZE. Запускать периодически, например из cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--checkpoint', default='TRUNCATE', choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'],
+                            help='Режим wal_checkpoint, PASSIVE не ждет читателей')
+        parser.add_argument('--analyze', action='store_true', help='Пересобрать статистику всех индексов')
+        parser.add_argument('--interval', type=float, help='Повторять каждые N секунд вместо одного прохода')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'Database {options["database"]!r} is not SQLite')
+        try:
+            while True:
+                self.maintain(connection, options)
+                if options['interval'] is None:
+                    break
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
+
+    def maintain(self, connection, options):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+            if journal_mode.lower() == 'wal':
+                started = time.monotonic()
+                cursor.execute(f'PRAGMA wal_checkpoint({options["checkpoint"]})')
+                busy, wal_pages, checkpointed = cursor.fetchone()
+                self.stdout.write(
+                    f'Checkpoint {options["checkpoint"]}: {checkpointed}/{wal_pages} WAL page(s) '
+                    f'in {time.monotonic() - started:.2f}s' + (' (blocked by readers)' if busy else '')
+                )
+            else:
+                self.stdout.write(self.style.WARNING(f'Journal mode is {journal_mode}, checkpoint skipped'))
+
+            started = time.monotonic()
+            if options['analyze']:
+                cursor.execute('ANALYZE')
+            else:
+                # ANALYZE только там, где статистика устарела
+                cursor.execute('PRAGMA optimize')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"ANALYZE" if options["analyze"] else "PRAGMA optimize"} in {time.monotonic() - started:.2f}s'
+        ))
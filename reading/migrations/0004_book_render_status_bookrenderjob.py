@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_rendered_books_ready(apps, schema_editor):
+    Book = apps.get_model('reading', 'Book')
+    Book.objects.using(schema_editor.connection.alias).exclude(pdf__isnull=True).exclude(pdf='').update(render_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0003_alter_page_page_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='render_status',
+            field=models.CharField(choices=[('pending', 'pending'), ('ready', 'ready'), ('failed', 'failed')], default='pending', editable=False, max_length=10),
+        ),
+        migrations.CreateModel(
+            name='BookRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('queued', 'queued'), ('running', 'running')], default='queued', max_length=10)),
+                ('run_after', models.DateTimeField()),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='render_jobs', to='reading.book')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['state', 'run_after'], name='render_job_state_run_after')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('state', 'queued')), fields=('book',), name='unique_queued_render_job')],
+            },
+        ),
+        migrations.RunPython(mark_rendered_books_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:03
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Book = apps.get_model('reading', 'Book')
+    BookRating = apps.get_model('reading', 'BookRating')
+    db_alias = schema_editor.connection.alias
+    totals = BookRating.objects.using(db_alias).exclude(rating__isnull=True).values('book_id') \
+        .annotate(total=Sum('rating'), count=Count('id'))
+    for row in totals:
+        Book.objects.using(db_alias).filter(pk=row['book_id']).update(rating_sum=row['total'], rating_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0004_book_render_status_bookrenderjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def fill_books_and_drop_duplicates(apps, schema_editor):
+    LastPage = apps.get_model('reading', 'LastPage')
+    last_pages = LastPage.objects.using(schema_editor.connection.alias)
+    seen = set()
+    duplicates = []
+    for last_page in last_pages.select_related('page').order_by('-id'):
+        key = (last_page.user_id, last_page.page.book_id)
+        if key in seen:
+            duplicates.append(last_page.pk)
+            continue
+        seen.add(key)
+        last_pages.filter(pk=last_page.pk).update(book_id=last_page.page.book_id)
+    last_pages.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0005_book_rating_sum_book_rating_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lastpage',
+            name='book',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='reading_positions', to='reading.book'),
+        ),
+        migrations.AddField(
+            model_name='lastpage',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(fill_books_and_drop_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.1 on 2026-10-18 11:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0006_lastpage_book_lastpage_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lastpage',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_positions', to='reading.book'),
+        ),
+        migrations.AddIndex(
+            model_name='lastpage',
+            index=models.Index(fields=['user', '-updated_at'], name='last_page_user_recent'),
+        ),
+        migrations.AddConstraint(
+            model_name='lastpage',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='unique_last_page_per_book'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.1 on 2026-10-18 12:30
+
+from django.conf import settings
+from django.db import migrations
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE reading_page_fts USING fts5(text, book_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')",
+    "CREATE VIRTUAL TABLE reading_book_fts USING fts5(name, author, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO reading_page_fts (rowid, text, book_id) SELECT id, text, book_id FROM reading_page",
+    "INSERT INTO reading_book_fts (rowid, name, author) SELECT id, name, author FROM reading_book",
+]
+SQLITE_BACKWARD = [
+    "DROP TABLE reading_page_fts",
+    "DROP TABLE reading_book_fts",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE TABLE reading_page_fts ("
+    " page_id bigint PRIMARY KEY REFERENCES reading_page (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,"
+    " book_id bigint NOT NULL,"
+    " document tsvector NOT NULL)",
+    "CREATE INDEX reading_page_fts_document ON reading_page_fts USING gin (document)",
+    "CREATE TABLE reading_book_fts ("
+    " book_id bigint PRIMARY KEY REFERENCES reading_book (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,"
+    " document tsvector NOT NULL)",
+    "CREATE INDEX reading_book_fts_document ON reading_book_fts USING gin (document)",
+    "INSERT INTO reading_page_fts (page_id, book_id, document)"
+    " SELECT id, book_id, to_tsvector(%(config)s, text) FROM reading_page",
+    "INSERT INTO reading_book_fts (book_id, document)"
+    " SELECT id, setweight(to_tsvector(%(config)s, name), 'A') || setweight(to_tsvector(%(config)s, author), 'B')"
+    " FROM reading_book",
+]
+POSTGRES_BACKWARD = [
+    "DROP TABLE reading_page_fts",
+    "DROP TABLE reading_book_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        # та же конфигурация to_tsvector, что у PostgresBackend, иначе документы не совпадут с запросами
+        params = {'config': settings.FULL_TEXT_SEARCH_CONFIG}
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement, params if '%(config)s' in statement else None)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0007_alter_lastpage_book_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
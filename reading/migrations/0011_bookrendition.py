@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 17:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0010_similarbook_similaritydirtybook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(choices=[('small', 'small'), ('medium', 'medium'), ('large', 'large')], max_length=10)),
+                ('format', models.CharField(choices=[('webp', 'webp'), ('jpeg', 'jpeg')], max_length=10)),
+                ('source', models.CharField(max_length=100)),
+                ('file', models.FileField(max_length=120, upload_to='')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='reading.book')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bookrendition',
+            constraint=models.UniqueConstraint(fields=('book', 'size', 'format'), name='unique_book_rendition'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+import reading.fields
+
+
+def compress_text(apps, schema_editor):
+    pages = apps.get_model('reading', 'Page').objects.using(schema_editor.connection.alias)
+    batch = []
+    for page in pages.only('text_plain').order_by('pk').iterator(chunk_size=1000):
+        # строка сжимается в get_db_prep_value кодеком PAGE_TEXT_COMPRESSION, без словаря
+        page.text = page.text_plain
+        batch.append(page)
+        if len(batch) >= 1000:
+            pages.bulk_update(batch, ['text'])
+            batch = []
+    pages.bulk_update(batch, ['text'])
+
+
+def decompress_text(apps, schema_editor):
+    pages = apps.get_model('reading', 'Page').objects.using(schema_editor.connection.alias)
+    batch = []
+    for page in pages.only('text').order_by('pk').iterator(chunk_size=1000):
+        page.text_plain = page.text
+        batch.append(page)
+        if len(batch) >= 1000:
+            pages.bulk_update(batch, ['text_plain'])
+            batch = []
+    pages.bulk_update(batch, ['text_plain'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0011_bookrendition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageTextDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.PositiveSmallIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='text_dictionaries', to='reading.book')),
+            ],
+        ),
+        migrations.RenameField(
+            model_name='page',
+            old_name='text',
+            new_name='text_plain',
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='text_plain',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='text',
+            field=reading.fields.CompressedTextField(dictionary_key='book_id', null=True),
+        ),
+        migrations.RunPython(compress_text, decompress_text),
+        migrations.RemoveField(
+            model_name='page',
+            name='text_plain',
+        ),
+        migrations.AlterField(
+            model_name='page',
+            name='text',
+            field=reading.fields.CompressedTextField(dictionary_key='book_id'),
+        ),
+    ]
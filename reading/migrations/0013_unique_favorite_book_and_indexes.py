@@ -0,0 +1,38 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_favorites(apps, schema_editor):
+    FavoriteBook = apps.get_model('reading', 'FavoriteBook')
+    favorites = FavoriteBook.objects.using(schema_editor.connection.alias)
+    # из повторов оставляем самую раннюю запись
+    duplicates = favorites.values('user_id', 'book_id').annotate(keep=Min('id'), count=Count('id')).filter(count__gt=1)
+    for row in duplicates.iterator():
+        favorites.filter(user_id=row['user_id'], book_id=row['book_id']).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0012_pagetextdictionary_compressed_page_text'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookfeedback',
+            index=models.Index(fields=['book', 'id'], name='book_feedback_book_id'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrating',
+            index=models.Index(condition=models.Q(('rating__isnull', False)), fields=['book', 'rating'], name='book_rating_rated'),
+        ),
+        migrations.RunPython(drop_duplicate_favorites, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='favoritebook',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='unique_favorite_book'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0013_unique_favorite_book_and_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularBook',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='reading.book')),
+                ('rank', models.PositiveSmallIntegerField(unique=True)),
+                ('score', models.FloatField()),
+            ],
+        ),
+    ]
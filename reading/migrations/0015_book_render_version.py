@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:21
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0014_popularbook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='render_version',
+            field=models.UUIDField(default=uuid.uuid4, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reading', '0015_book_render_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='similaritydirtybook',
+            name='claim',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+    ]
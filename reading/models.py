@@ -1,16 +1,14 @@
-import os
+import uuid
+from datetime import timedelta
 
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from regauth.models import CustomUser
-from django.db import models
+from .fields import CompressedTextField
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
-from django.core.files import File
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from regauth.models import CustomUser
+from django.utils import timezone
 
 
 class Genre(models.Model):
@@ -26,6 +24,14 @@ class Book(models.Model):
         ('reading', 'reading'),
         ('read', 'read'),
     ]
+    RENDER_PENDING = 'pending'
+    RENDER_READY = 'ready'
+    RENDER_FAILED = 'failed'
+    RENDER_STATUS_CHOICES = [
+        (RENDER_PENDING, 'pending'),
+        (RENDER_READY, 'ready'),
+        (RENDER_FAILED, 'failed'),
+    ]
 
     name = models.CharField(max_length=35, unique=True, null=False)
     image = models.ImageField(null=True, blank=True, upload_to='book_images/')
@@ -33,34 +39,197 @@ class Book(models.Model):
     total_pages = models.IntegerField(default=0, editable=False)
     pdf = models.FileField(upload_to='book_pdfs/', blank=True, null=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='')
+    render_status = models.CharField(max_length=10, choices=RENDER_STATUS_CHOICES, default=RENDER_PENDING, editable=False)
+    # меняется вместе с render_status=pending при правке PDF_FIELDS или страниц,
+    # воркер публикует PDF только если версия не поменялась за время рендера
+    render_version = models.UUIDField(default=uuid.uuid4, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Поля, которые поддерживаются сигналами и воркером через update(), save() их не перезаписывает
+    DERIVED_FIELDS = ('total_pages', 'pdf', 'rating_sum', 'rating_count')
+    # Поля, которые попадают в PDF (обложка); страницы помечают книгу сами, см. update_total_pages
+    PDF_FIELDS = ('name', 'author', 'image')
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return round(self.rating_sum / self.rating_count, 2)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if all(loaded.get(name, models.DEFERRED) is not models.DEFERRED for name in cls.PDF_FIELDS):
+            instance._loaded_pdf_values = instance.pdf_values()
+        return instance
+
+    def pdf_values(self):
+        return {name: (self.image.name or '') if name == 'image' else getattr(self, name) for name in self.PDF_FIELDS}
+
+    def pdf_changed(self, update_fields=None):
+        """
+        Меняет ли сохранение то, что нарисовано в PDF. Без загруженных значений считаем, что меняет.
+        """
+        fields = self.PDF_FIELDS if update_fields is None else set(update_fields) & set(self.PDF_FIELDS)
+        loaded = getattr(self, '_loaded_pdf_values', None)
+        if self._state.adding or loaded is None or not fields:
+            return bool(fields)
+        if 'image' in fields and self.image and not self.image._committed:
+            return True
+        current = self.pdf_values()
+        return any(current[name] != loaded[name] for name in fields)
 
     def save(self, *args, **kwargs):
+        # PDF собирает воркер `render_books`, здесь только помечаем его устаревшим, если правка попадает в PDF
+        update_fields = kwargs.get('update_fields')
+        render = self.pdf_changed(update_fields)
+        if render:
+            self.render_status = self.RENDER_PENDING
+            self.render_version = uuid.uuid4()
+        render_fields = {'render_status', 'render_version'}
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *render_fields} if render else set(update_fields) - render_fields
+        elif not self._state.adding:
+            # без рендера состояние рендера не трогаем: воркер мог опубликовать PDF после загрузки книги
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+                and (render or field.name not in render_fields)
+            ]
         super().save(*args, **kwargs)
-        self.total_pages = self.pages.count()
-        super().save(update_fields=['total_pages'])
+        self._loaded_pdf_values = self.pdf_values()
+        if render:
+            BookRenderJob.request(self.pk)
+
+
+class BookRenderJob(models.Model):
+    """
+    Очередь рендеринга PDF. Для одной книги в очереди держится не больше одной задачи,
+    повторные запросы только сдвигают run_after (debounce), пока задача не ждет дольше BOOK_RENDER_MAX_DELAY.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    STATE_CHOICES = [
+        (QUEUED, 'queued'),
+        (RUNNING, 'running'),
+    ]
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='render_jobs')
+    state = models.CharField(max_length=10, choices=STATE_CHOICES, default=QUEUED)
+    run_after = models.DateTimeField()
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book'], condition=models.Q(state='queued'), name='unique_queued_render_job')
+        ]
+        indexes = [
+            models.Index(fields=['state', 'run_after'], name='render_job_state_run_after'),
+        ]
 
-        buffer = BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        p.drawString(100, 750, f"Book Title: {self.name}")
-        p.drawString(100, 735, f"Author: {self.author}")
-        p.drawString(100, 720, f"Total Pages: {self.total_pages}")
+    @classmethod
+    def request(cls, book_id):
+        transaction.on_commit(lambda: cls.schedule(book_id))
+
+    @classmethod
+    def schedule(cls, book_id, delay=None):
+        now = timezone.now()
+        run_after = now + (settings.BOOK_RENDER_DEBOUNCE if delay is None else delay)
+        queued = cls.objects.filter(book_id=book_id, state=cls.QUEUED)
+        if queued.filter(created_at__gt=now - settings.BOOK_RENDER_MAX_DELAY).update(run_after=run_after, updated_at=now):
+            return
+        if queued.exists() or not Book.objects.filter(pk=book_id).exists():
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(book_id=book_id, run_after=run_after)
+        except IntegrityError:
+            # другой процесс уже поставил эту книгу в очередь
+            pass
+
+    @classmethod
+    def claim(cls):
+        now = timezone.now()
+        candidates = cls.objects.filter(state=cls.QUEUED, run_after__lte=now).order_by('run_after')
+        for job in candidates[:10]:
+            claimed = cls.objects.filter(pk=job.pk, state=cls.QUEUED).update(
+                state=cls.RUNNING, attempts=models.F('attempts') + 1, updated_at=now
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+        return None
+
+    @classmethod
+    def requeue_stale(cls, timeout):
+        stale = cls.objects.filter(state=cls.RUNNING, updated_at__lt=timezone.now() - timeout)
+        book_ids = list(stale.values_list('book_id', flat=True))
+        stale.delete()
+        for book_id in book_ids:
+            cls.schedule(book_id, delay=timedelta(0))
+        return len(book_ids)
+
+    def retry_or_fail(self, error):
+        if self.attempts >= settings.BOOK_RENDER_MAX_ATTEMPTS:
+            self.delete()
+            Book.objects.filter(pk=self.book_id).update(render_status=Book.RENDER_FAILED)
+            return False
+        if BookRenderJob.objects.filter(book_id=self.book_id, state=self.QUEUED).exists():
+            # в очереди уже есть более свежая задача, она и перерисует книгу
+            self.delete()
+            return True
+        self.state = self.QUEUED
+        self.last_error = error
+        self.run_after = timezone.now() + settings.BOOK_RENDER_DEBOUNCE * 2 ** self.attempts
+        self.save(update_fields=['state', 'last_error', 'run_after', 'updated_at'])
+        return True
+
+
+class BookRendition(models.Model):
+    """
+    Уменьшенная копия обложки. Файл адресуется по содержимому (book_renditions/<sha256>.<ext>),
+    source - имя исходного Book.image, из которого она сделана.
+    """
+    SIZE_CHOICES = [
+        ('small', 'small'),
+        ('medium', 'medium'),
+        ('large', 'large'),
+    ]
+    FORMAT_CHOICES = [
+        ('webp', 'webp'),
+        ('jpeg', 'jpeg'),
+    ]
 
-        if self.image:
-            image_path = os.path.join(settings.MEDIA_ROOT, self.image.name)
-            p.drawImage(image_path, 100, 600, width=200, height=200)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='renditions')
+    size = models.CharField(max_length=10, choices=SIZE_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    source = models.CharField(max_length=100)
+    file = models.FileField(max_length=120)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'size', 'format'], name='unique_book_rendition')
+        ]
 
-        p.showPage()
 
-        for page in self.pages.all():
-            p.drawString(100, 700, f"Page Number: {page.page_number}")
-            p.drawString(100, 685, page.text)
-            p.showPage()
+@receiver(post_delete, sender=BookRendition)
+def delete_rendition_file(sender, instance, **kwargs):
+    name = instance.file.name
+    storage = instance.file.storage
 
-        p.save()
+    def delete_if_unused():
+        # одинаковые обложки разных книг делят один файл
+        if not BookRendition.objects.filter(file=name).exists():
+            storage.delete(name)
 
-        pdf_file_name = f'book_{self.id}.pdf'
-        self.pdf.save(pdf_file_name, File(buffer), save=False)
-        super().save(update_fields=['pdf'])
+    transaction.on_commit(delete_if_unused)
 
 
 class BookStatus(models.Model):
@@ -80,8 +249,18 @@ class BookGenre(models.Model):
         unique_together = ('book', 'genre')
 
 
+class PageTextDictionary(models.Model):
+    """
+    Словарь сжатия текста страниц одной книги (см. reading.pagetext).
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='text_dictionaries')
+    codec = models.PositiveSmallIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 class Page(models.Model):
-    text = models.TextField()
+    text = CompressedTextField(dictionary_key='book_id')
     page_number = models.DecimalField(max_digits=6, decimal_places=1, validators=[MinValueValidator(0), MaxValueValidator(9999.9)])
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='pages')
 
@@ -98,23 +277,45 @@ class Page(models.Model):
 
 @receiver(post_save, sender=Page)
 @receiver(post_delete, sender=Page)
-def update_total_pages(sender, instance, **kwargs):
-    book = instance.book
-    book.total_pages = book.pages.count()
-    book.save(update_fields=['total_pages'])
+def update_total_pages(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Book):
+        # удаляется сама книга
+        return
+    book_id = instance.book_id
+    Book.objects.filter(pk=book_id).update(
+        total_pages=Page.objects.filter(book_id=book_id).count(),
+        render_status=Book.RENDER_PENDING,
+        render_version=uuid.uuid4(),
+    )
+    BookRenderJob.request(book_id)
 
 
 class LastPage(models.Model):
+    """
+    Позиция чтения: последняя открытая страница юзера в каждой книге.
+    """
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='recent_pages')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reading_positions')
     page = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='recent_pages')
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_last_page_per_book'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-updated_at'], name='last_page_user_recent'),
+        ]
 
 
 class FavoriteBook(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='favorite_books')
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='favorited_by')
 
-    # class Meta:
-    #     unique_together = ('user', 'book')
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'book'], name='unique_favorite_book'),
+        ]
 
 
 class BookRating(models.Model):
@@ -127,6 +328,46 @@ class BookRating(models.Model):
         constraints = [
             models.CheckConstraint(check=models.Q(rating__gte=1) & models.Q(rating__lte=10), name='rating_range')
         ]
+        indexes = [
+            # пересчет рейтингов книг читает только поставленные оценки
+            models.Index(fields=['book', 'rating'], condition=models.Q(rating__isnull=False), name='book_rating_rated'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # изменение оценки и счетчиков книги в одной транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+def apply_rating_delta(book_id, rating, sign):
+    if rating is None:
+        return
+    Book.objects.filter(pk=book_id).update(
+        rating_sum=models.F('rating_sum') + sign * rating,
+        rating_count=models.F('rating_count') + sign,
+    )
+
+
+@receiver(pre_save, sender=BookRating)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = BookRating.objects.filter(pk=instance.pk).values_list('book_id', 'rating').first()
+
+
+@receiver(post_save, sender=BookRating)
+def add_rating_to_book(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous is not None:
+        apply_rating_delta(*previous, sign=-1)
+    apply_rating_delta(instance.book_id, instance.rating, sign=1)
+
+
+@receiver(post_delete, sender=BookRating)
+def remove_rating_from_book(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Book):
+        return
+    apply_rating_delta(instance.book_id, instance.rating, sign=-1)
 
 
 class BookFeedback(models.Model):
@@ -134,5 +375,75 @@ class BookFeedback(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='feedbacks')
     feedback = models.TextField()
 
-    # class Meta:
-    #     unique_together = ('user', 'book')
+    class Meta:
+        # unique_together = ('user', 'book')
+        indexes = [
+            # отзывы книги листаются курсором по id
+            models.Index(fields=['book', 'id'], name='book_feedback_book_id'),
+        ]
+
+
+class Recommendation(models.Model):
+    """
+    Предпосчитанные рекомендации (manage.py build_recommendations), rank 0 - самая подходящая книга.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='recommendations')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'rank'], name='unique_recommendation_rank'),
+        ]
+
+
+class PopularBook(models.Model):
+    """
+    Популярные книги для юзеров без рекомендаций, считаются вместе с ними (manage.py build_recommendations).
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    rank = models.PositiveSmallIntegerField(unique=True)
+    score = models.FloatField()
+
+
+class SimilarBook(models.Model):
+    """
+    Топ-K похожих книг ("с этой книгой также читают"), считается manage.py build_similar_books.
+    """
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_books')
+    similar = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='similar_to')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_similar_book_rank'),
+        ]
+
+
+class SimilarityDirtyBook(models.Model):
+    """
+    Книги, у которых поменялись взаимодействия с момента последнего пересчета похожих книг.
+    claim - пересчет, который взял книгу (similarity.refresh); новая пометка его сбрасывает.
+    """
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    claim = models.UUIDField(null=True, editable=False)
+
+    @classmethod
+    def mark(cls, book_ids):
+        # уже помеченную книгу пересчет мог взять до этого изменения: сбрасываем claim, чтобы пометка осталась
+        cls.objects.bulk_create([cls(book_id=book_id) for book_id in set(book_ids)],
+                                update_conflicts=True, unique_fields=['book'], update_fields=['claim'])
+
+
+@receiver(post_save, sender=BookRating)
+@receiver(post_save, sender=FavoriteBook)
+@receiver(post_save, sender=BookStatus)
+@receiver(post_delete, sender=BookRating)
+@receiver(post_delete, sender=FavoriteBook)
+@receiver(post_delete, sender=BookStatus)
+def mark_similarity_dirty(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Book):
+        return
+    SimilarityDirtyBook.mark([instance.book_id])
@@ -0,0 +1,140 @@
+"""
+Сжатое хранение текста страниц.
+
+Формат значения в колонке: заголовок (кодек: 1 байт, id словаря PageTextDictionary: 4 байта, 0 - без словаря)
+и данные. Кодек для новых записей задает PAGE_TEXT_COMPRESSION ('none', 'zlib', 'zstd'),
+читаются любые. Словари обучаются по страницам одной книги командой `compress_pages`
+и не удаляются, пока жива книга, поэтому старые записи всегда можно прочитать.
+"""
+import struct
+import time
+import zlib
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+HEADER = struct.Struct('>BI')
+# zlib использует не больше 32KB словаря (размер окна)
+ZLIB_DICTIONARY_SIZE = 32 * 1024
+ZSTD_DICTIONARY_SIZE = 64 * 1024
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 10
+# Как долго процесс помнит текущий словарь книги
+BOOK_DICTIONARY_TTL = 60
+
+
+def default_codec():
+    codec = CODECS.get(settings.PAGE_TEXT_COMPRESSION)
+    if codec is None:
+        raise ImproperlyConfigured(f'Unknown PAGE_TEXT_COMPRESSION: {settings.PAGE_TEXT_COMPRESSION!r}')
+    if codec == CODEC_ZSTD and zstandard is None:
+        raise ImproperlyConfigured("PAGE_TEXT_COMPRESSION='zstd' requires the zstandard package")
+    return codec
+
+
+def compress(data, codec, dictionary=None):
+    if codec == CODEC_ZLIB:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zdict=dictionary) if dictionary else zlib.compressobj(ZLIB_LEVEL)
+        return compressor.compress(data) + compressor.flush()
+    if codec == CODEC_ZSTD:
+        zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=zdict).compress(data)
+    return data
+
+
+def decompress(data, codec, dictionary=None):
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured('Page text is zstd-compressed, install the zstandard package')
+        zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=zdict).decompress(data)
+    return data
+
+
+def encode(text, dictionary_id=None):
+    """
+    Сжимает текст в формат колонки. Если сжатие не помогло, текст хранится как есть.
+    """
+    raw = text.encode()
+    if dictionary_id:
+        codec, dictionary = get_dictionary(dictionary_id)
+    else:
+        codec, dictionary = default_codec(), None
+    if codec != CODEC_NONE:
+        data = compress(raw, codec, dictionary)
+        if len(data) < len(raw):
+            return HEADER.pack(codec, dictionary_id or 0) + data
+    return HEADER.pack(CODEC_NONE, 0) + raw
+
+
+def decode(value):
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    codec, dictionary_id = HEADER.unpack_from(value)
+    dictionary = get_dictionary(dictionary_id)[1] if dictionary_id else None
+    return decompress(value[HEADER.size:], codec, dictionary).decode()
+
+
+@lru_cache(maxsize=256)
+def get_dictionary(dictionary_id):
+    dictionary = apps.get_model('reading', 'PageTextDictionary').objects.get(pk=dictionary_id)
+    return dictionary.codec, bytes(dictionary.data)
+
+
+_book_dictionaries = {}
+
+
+def book_dictionary_id(book_id):
+    """
+    id последнего словаря книги для новых записей (None если словаря нет или он другого кодека).
+    """
+    now = time.monotonic()
+    cached = _book_dictionaries.get(book_id)
+    if cached is None or cached[1] < now:
+        dictionary = (apps.get_model('reading', 'PageTextDictionary').objects
+                      .filter(book_id=book_id, codec=default_codec()).order_by('-pk').only('pk').first())
+        cached = (dictionary and dictionary.pk, now + BOOK_DICTIONARY_TTL)
+        _book_dictionaries[book_id] = cached
+    return cached[0]
+
+
+def forget_book_dictionary(book_id):
+    _book_dictionaries.pop(book_id, None)
+
+
+def train_dictionary(texts, codec):
+    """
+    Строит словарь по страницам книги. Для zstd - штатное обучение, для zlib словарь -
+    это просто выборка страниц равномерно по книге, обрезанная до размера окна.
+    """
+    samples = [text.encode() for text in texts if text]
+    if not samples:
+        return None
+    if codec == CODEC_ZSTD:
+        try:
+            return zstandard.train_dictionary(ZSTD_DICTIONARY_SIZE, samples).as_bytes()
+        except zstandard.ZstdError:
+            # слишком мало данных для обучения
+            return None
+    if codec == CODEC_ZLIB:
+        per_sample = max(ZLIB_DICTIONARY_SIZE // len(samples), 256)
+        step = max(len(samples) * per_sample // ZLIB_DICTIONARY_SIZE, 1)
+        dictionary = b''.join(sample[:per_sample] for sample in samples[::step])
+        return dictionary[-ZLIB_DICTIONARY_SIZE:]
+    return None
@@ -0,0 +1,140 @@
+import atexit
+import logging
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BookStatus, LastPage, Page, SimilarityDirtyBook
+
+logger = logging.getLogger(__name__)
+
+
+def write_progress(entries):
+    """
+    Записывает пачку позиций (user_id, book_id, page_id, updated_at) одной транзакцией:
+    статус книги становится 'reading' (если она еще не 'read'), позиции пишутся одним upsert.
+    Позиции старше уже сохраненных (например, из офлайн клиента) пропускаются.
+    Возвращает число примененных позиций.
+    """
+    page_ids = {entry[2] for entry in entries}
+    existing = set(Page.objects.filter(pk__in=page_ids).values_list('pk', flat=True))
+    latest = {}
+    for user_id, book_id, page_id, updated_at in entries:
+        if page_id in existing and ((user_id, book_id) not in latest or latest[user_id, book_id][1] < updated_at):
+            latest[user_id, book_id] = (page_id, updated_at)
+    if not latest:
+        return 0
+
+    pairs = Q()
+    for user_id, book_id in latest:
+        pairs |= Q(user_id=user_id, book_id=book_id)
+
+    with transaction.atomic():
+        stored = LastPage.objects.filter(pairs).values_list('user_id', 'book_id', 'updated_at')
+        for user_id, book_id, updated_at in stored:
+            if updated_at > latest[user_id, book_id][1]:
+                del latest[user_id, book_id]
+        if not latest:
+            return 0
+
+        BookStatus.objects.bulk_create(
+            [BookStatus(user_id=user_id, book_id=book_id, status='reading') for user_id, book_id in latest],
+            ignore_conflicts=True,
+        )
+        BookStatus.objects.filter(pairs, status='').update(status='reading')
+        SimilarityDirtyBook.mark([book_id for _, book_id in latest])
+
+        LastPage.objects.bulk_create(
+            [
+                LastPage(user_id=user_id, book_id=book_id, page_id=page_id, updated_at=updated_at)
+                for (user_id, book_id), (page_id, updated_at) in latest.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'book'],
+            update_fields=['page', 'updated_at'],
+        )
+    return len(latest)
+
+
+class ProgressBuffer:
+    """
+    Буфер прогресса чтения с отложенной записью. Повторные обновления одного юзера в одной книге схлопываются,
+    фоновый поток раз в READING_PROGRESS_FLUSH_INTERVAL секунд пишет их в базу пачками.
+    При штатной остановке процесса (atexit) оставшееся дописывается.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._pid = None
+        self._stopped = threading.Event()
+
+    def record(self, user_id, book_id, page_id):
+        updated_at = timezone.now()
+        if settings.READING_PROGRESS_FLUSH_INTERVAL <= 0:
+            write_progress([(user_id, book_id, page_id, updated_at)])
+            return
+        with self._lock:
+            self._pending[user_id, book_id] = (page_id, updated_at)
+        self._ensure_thread()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        items = list(pending.items())
+        batch_size = settings.READING_PROGRESS_BATCH_SIZE
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            try:
+                write_progress([(*key, *position) for key, position in batch])
+            except Exception:
+                logger.exception('Failed to flush %d reading progress entries', len(batch))
+                self._requeue(batch)
+
+    def _requeue(self, batch):
+        with self._lock:
+            for key, position in batch:
+                # более новое обновление, пришедшее во время записи, важнее
+                self._pending.setdefault(key, position)
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='reading-progress-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(settings.READING_PROGRESS_FLUSH_INTERVAL):
+            close_old_connections()
+            self.flush()
+
+    def shutdown(self):
+        self._stopped.set()
+        self.flush()
+
+
+buffer = ProgressBuffer()
+atexit.register(buffer.shutdown)
+
+
+def record(user, page):
+    buffer.record(user.id, page.book_id, page.id)
+
+
+async def arecord(user, page):
+    # без буфера позиция пишется сразу, в async views это нужно увести в поток
+    if settings.READING_PROGRESS_FLUSH_INTERVAL <= 0:
+        await sync_to_async(record)(user, page)
+    else:
+        record(user, page)
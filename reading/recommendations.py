@@ -0,0 +1,172 @@
+"""
+Офлайн построение рекомендаций по взаимодействиям юзеров с книгами:
+близость по жанрам плюс совместная встречаемость книг (item-item co-occurrence).
+Популярные книги для новых юзеров тоже считаются здесь, запрос их только читает.
+"""
+import math
+from collections import defaultdict
+from itertools import combinations
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Book, BookGenre, BookRating, BookStatus, FavoriteBook, PopularBook, Recommendation
+
+STATUS_WEIGHTS = {'reading': 1.0, 'read': 2.0}
+FAVORITE_WEIGHT = 3.0
+GENRE_WEIGHT = 0.4
+CO_OCCURRENCE_WEIGHT = 0.6
+
+
+def load_interactions():
+    """
+    Возвращает {user_id: {book_id: вес}}. Оценка 1..10 дает вес от -0.8 до 1.0.
+    """
+    interactions = defaultdict(lambda: defaultdict(float))
+    for user_id, book_id, status in BookStatus.objects.values_list('user_id', 'book_id', 'status').iterator():
+        interactions[user_id][book_id] += STATUS_WEIGHTS.get(status, 0.0)
+    for user_id, book_id in FavoriteBook.objects.values_list('user_id', 'book_id').iterator():
+        interactions[user_id][book_id] += FAVORITE_WEIGHT
+    ratings = BookRating.objects.exclude(rating__isnull=True).values_list('user_id', 'book_id', 'rating')
+    for user_id, book_id, rating in ratings.iterator():
+        interactions[user_id][book_id] += (rating - 5) / 5
+    return interactions
+
+
+def load_genres():
+    genres = defaultdict(set)
+    for book_id, genre_id in BookGenre.objects.values_list('book_id', 'genre_id').iterator():
+        genres[book_id].add(genre_id)
+    return genres
+
+
+def genre_index(genres, counts, per_genre):
+    """
+    {genre_id: [book_id, ...]}: самые популярные книги жанра, не больше per_genre.
+    Строится один раз, чтобы не обходить весь каталог для каждого юзера.
+    """
+    index = defaultdict(list)
+    for book_id, book_genres in genres.items():
+        for genre_id in book_genres:
+            index[genre_id].append(book_id)
+    return {
+        genre_id: sorted(book_ids, key=lambda book_id: (-counts.get(book_id, 0), book_id))[:per_genre]
+        for genre_id, book_ids in index.items()
+    }
+
+
+def popularity(interactions):
+    counts = defaultdict(int)
+    for books in interactions.values():
+        for book_id, weight in books.items():
+            if weight > 0:
+                counts[book_id] += 1
+    return counts
+
+
+def co_occurrence(interactions, max_books_per_user):
+    pairs = defaultdict(lambda: defaultdict(int))
+    for books in interactions.values():
+        liked = sorted((book_id for book_id, weight in books.items() if weight > 0), key=books.get, reverse=True)
+        for a, b in combinations(sorted(liked[:max_books_per_user]), 2):
+            pairs[a][b] += 1
+            pairs[b][a] += 1
+    return pairs
+
+
+def recommend(books, genres, genre_books, pairs, counts, limit):
+    seen = set(books)
+    liked = {book_id: weight for book_id, weight in books.items() if weight > 0}
+
+    affinity = defaultdict(float)
+    for book_id, weight in liked.items():
+        for genre_id in genres.get(book_id, ()):
+            affinity[genre_id] += weight
+    total_affinity = sum(affinity.values()) or 1.0
+
+    scores = defaultdict(float)
+    for book_id, weight in liked.items():
+        for other_id, together in pairs.get(book_id, {}).items():
+            if other_id not in seen:
+                similarity = together / math.sqrt(counts[book_id] * counts[other_id])
+                scores[other_id] += CO_OCCURRENCE_WEIGHT * weight * similarity
+    # кандидаты по жанрам - только из жанров с наибольшей близостью
+    top_genres = sorted(affinity, key=lambda genre_id: (-affinity[genre_id], genre_id))
+    candidates = {
+        book_id
+        for genre_id in top_genres[:settings.RECOMMENDATIONS_TOP_GENRES]
+        for book_id in genre_books.get(genre_id, ())
+        if book_id not in seen
+    }
+    for book_id in candidates:
+        genre_score = sum(affinity.get(genre_id, 0.0) for genre_id in genres[book_id]) / total_affinity
+        if genre_score:
+            scores[book_id] += GENRE_WEIGHT * genre_score
+
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def store_popular(counts):
+    popular = sorted(counts, key=lambda book_id: (-counts[book_id], book_id))[:settings.RECOMMENDATIONS_PER_USER]
+    with transaction.atomic():
+        PopularBook.objects.all().delete()
+        PopularBook.objects.bulk_create([
+            PopularBook(book_id=book_id, rank=rank, score=counts[book_id]) for rank, book_id in enumerate(popular)
+        ])
+    return popular
+
+
+def popular_book_ids():
+    """
+    id популярных книг из последнего build(). Пока он ни разу не запускался - новые книги.
+    """
+    limit = settings.RECOMMENDATIONS_PER_USER
+    popular = list(PopularBook.objects.order_by('rank').values_list('book_id', flat=True)[:limit])
+    return popular or list(Book.objects.order_by('-pk').values_list('pk', flat=True)[:limit])
+
+
+def build(user_ids=None):
+    """
+    Пересчитывает таблицу Recommendation (для всех юзеров или только для user_ids).
+    Рекомендации юзеров, у которых не осталось взаимодействий, удаляются: им отдаются популярные книги.
+    Возвращает число юзеров, для которых записаны рекомендации.
+    """
+    limit = settings.RECOMMENDATIONS_PER_USER
+    interactions = load_interactions()
+    genres = load_genres()
+    counts = popularity(interactions)
+    genre_books = genre_index(genres, counts, settings.RECOMMENDATIONS_GENRE_CANDIDATES)
+    pairs = co_occurrence(interactions, settings.RECOMMENDATIONS_MAX_BOOKS_PER_USER)
+    store_popular(counts)
+
+    if user_ids is None:
+        targets = interactions.keys()
+        stale = set(Recommendation.objects.values_list('user_id', flat=True).distinct()) - interactions.keys()
+    else:
+        targets = [user_id for user_id in user_ids if user_id in interactions]
+        stale = [user_id for user_id in user_ids if user_id not in interactions]
+    stale = list(stale)
+    for start in range(0, len(stale), 500):
+        Recommendation.objects.filter(user_id__in=stale[start:start + 500]).delete()
+
+    built = 0
+    batch = []
+    for user_id in targets:
+        ranked = recommend(interactions[user_id], genres, genre_books, pairs, counts, limit)
+        batch.append((user_id, ranked))
+        if len(batch) >= 500:
+            built += _store(batch)
+            batch = []
+    built += _store(batch)
+    return built
+
+
+def _store(batch):
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=[user_id for user_id, _ in batch]).delete()
+        Recommendation.objects.bulk_create([
+            Recommendation(user_id=user_id, book_id=book_id, rank=rank, score=score)
+            for user_id, ranked in batch
+            for rank, (book_id, score) in enumerate(ranked)
+        ])
+    return len(batch)
@@ -0,0 +1,226 @@
+import hashlib
+import zlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+from reportlab.lib.pagesizes import letter
+
+from . import catalog_cache, renditions
+from .models import Book, Page
+
+# Меняется при любом изменении отрисовки, чтобы старые фрагменты не попадали в новые PDF
+RENDERER_VERSION = 3
+FRAGMENTS_DIR = 'pdf_fragments'
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+# Обложка рисуется квадратом 200pt, больше 2px на точку в PDF не кладем
+COVER_IMAGE_PX = 400
+
+
+def _fragment_key(*parts):
+    digest = hashlib.sha256(str(RENDERER_VERSION).encode())
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode())
+    return digest.hexdigest()
+
+
+def fragment_path(key):
+    return f'{FRAGMENTS_DIR}/{key[:2]}/{key}.obj'
+
+
+def cover_fragment_key(book):
+    return _fragment_key('cover', book.name, book.author, book.total_pages, bool(book.image))
+
+
+def image_fragment_key(book):
+    return _fragment_key('image', book.image.name, book.image.size)
+
+
+def page_fragment_key(page_number, text):
+    return _fragment_key('page', page_number, text)
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', 'replace')
+    for char, escaped in ((b'\\', b'\\\\'), (b'(', b'\\('), (b')', b'\\)'), (b'\r', b'\\r'), (b'\n', b'\\n')):
+        data = data.replace(char, escaped)
+    return b'(' + data + b')'
+
+
+def _text(lines):
+    ops = [b'BT /F1 12 Tf']
+    for x, y, text in lines:
+        ops.append(b'1 0 0 1 %d %d Tm %s Tj' % (x, y, _pdf_string(text)))
+    ops.append(b'ET')
+    return b'\n'.join(ops)
+
+
+def _stream(data, **entries):
+    entries['Length'] = len(data)
+    header = b' '.join(b'/%s %s' % (key.encode(), str(value).encode()) for key, value in entries.items())
+    return b'<< ' + header + b' >>\nstream\n' + data + b'\nendstream'
+
+
+def _content_stream(ops):
+    return _stream(zlib.compress(ops), Filter='/FlateDecode')
+
+
+def draw_cover(book):
+    ops = _text([
+        (100, 750, f"Book Title: {book.name}"),
+        (100, 735, f"Author: {book.author}"),
+        (100, 720, f"Total Pages: {book.total_pages}"),
+    ])
+    if book.image:
+        ops += b'\nq 200 0 0 200 100 600 cm /Im1 Do Q'
+    return _content_stream(ops)
+
+
+def draw_image(book):
+    with book.image.open('rb') as f:
+        data = f.read()
+    image = Image.open(BytesIO(data))
+    if max(image.size) > COVER_IMAGE_PX:
+        image = image.copy()
+        image.thumbnail((COVER_IMAGE_PX, COVER_IMAGE_PX), Image.LANCZOS)
+        data = renditions.encode(image, 'jpeg')
+        image = Image.open(BytesIO(data))
+    entries = {'Type': '/XObject', 'Subtype': '/Image', 'Width': image.width, 'Height': image.height,
+               'BitsPerComponent': 8}
+    if image.format == 'JPEG' and image.mode in ('RGB', 'L'):
+        return _stream(data, ColorSpace='/DeviceRGB' if image.mode == 'RGB' else '/DeviceGray',
+                       Filter='/DCTDecode', **entries)
+    return _stream(zlib.compress(image.convert('RGB').tobytes()), ColorSpace='/DeviceRGB',
+                   Filter='/FlateDecode', **entries)
+
+
+def draw_page(page_number, text):
+    return _content_stream(_text([
+        (100, 700, f"Page Number: {page_number}"),
+        (100, 685, text),
+    ]))
+
+
+def get_fragment(key, draw, *args):
+    """
+    Возвращает готовый объект PDF из кеша фрагментов, рисуя его только при промахе.
+    """
+    path = fragment_path(key)
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as f:
+            return f.read()
+    fragment = draw(*args)
+    default_storage.save(path, ContentFile(fragment))
+    return fragment
+
+
+def _page_rows(book):
+    return Page.objects.filter(book=book).values_list('page_number', 'text').iterator(chunk_size=500)
+
+
+def book_fragment_keys(book):
+    yield cover_fragment_key(book)
+    if book.image:
+        yield image_fragment_key(book)
+    for page_number, text in _page_rows(book):
+        yield page_fragment_key(page_number, text)
+
+
+class PdfAssembler:
+    """
+    Минимальный писатель PDF: страницы уже лежат сериализованными объектами,
+    остается только пронумеровать их и записать xref.
+    """
+    CATALOG, PAGES, FONT, IMAGE = 1, 2, 3, 4
+
+    def __init__(self, has_image):
+        self.out = BytesIO()
+        self.offsets = {}
+        self.kids = []
+        self.next_number = self.IMAGE + 1
+        xobjects = b' /XObject << /Im1 %d 0 R >>' % self.IMAGE if has_image else b''
+        self.resources = b'<< /Font << /F1 %d 0 R >>%s >>' % (self.FONT, xobjects)
+        self.out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        self.write_object(self.FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                     b'/Encoding /WinAnsiEncoding >>')
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.out.tell()
+        self.out.write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def add_page(self, content):
+        page, contents = self.next_number, self.next_number + 1
+        self.next_number += 2
+        self.write_object(contents, content)
+        self.write_object(page, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %s '
+                                b'/Contents %d 0 R >>' % (self.PAGES, PAGE_WIDTH, PAGE_HEIGHT,
+                                                          self.resources, contents))
+        self.kids.append(page)
+
+    def finish(self):
+        kids = b' '.join(b'%d 0 R' % kid for kid in self.kids)
+        self.write_object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.kids)))
+        self.write_object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        size = self.next_number
+        xref = self.out.tell()
+        self.out.write(b'xref\n0 %d\n0000000000 65535 f \n' % size)
+        for number in range(1, size):
+            if number in self.offsets:
+                self.out.write(b'%010d 00000 n \n' % self.offsets[number])
+            else:
+                self.out.write(b'0000000000 65535 f \n')
+        self.out.write(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (size, self.CATALOG, xref))
+        return self.out.getvalue()
+
+
+def render_book_pdf(book):
+    """
+    Собирает PDF книги из закешированных фрагментов: после правки одной страницы
+    перерисовывается только она, остальные страницы просто копируются.
+    """
+    pdf = PdfAssembler(has_image=bool(book.image))
+    if book.image:
+        pdf.write_object(pdf.IMAGE, get_fragment(image_fragment_key(book), draw_image, book))
+    pdf.add_page(get_fragment(cover_fragment_key(book), draw_cover, book))
+    for page_number, text in _page_rows(book):
+        pdf.add_page(get_fragment(page_fragment_key(page_number, text), draw_page, page_number, text))
+    return pdf.finish()
+
+
+def publish_book_pdf(book, content):
+    """
+    Публикует PDF, если книгу не правили с момента ее загрузки воркером. Возвращает False, если PDF устарел:
+    правка уже поставила новую задачу, а статус остается pending.
+    """
+    old_name = book.pdf.name if book.pdf else None
+    book.pdf.save(f'book_{book.id}.pdf', ContentFile(content), save=False)
+    published = Book.objects.filter(pk=book.pk, render_version=book.render_version).update(
+        pdf=book.pdf.name, render_status=Book.RENDER_READY
+    )
+    if not published:
+        book.pdf.storage.delete(book.pdf.name)
+        return False
+    if old_name and old_name != book.pdf.name:
+        book.pdf.storage.delete(old_name)
+    return True
+
+
+def run_job(job):
+    """
+    Выполняет одну захваченную задачу. Возвращает True если PDF опубликован, False если рендер упал
+    и None, если книгу правили во время рендера (ее перерисует следующая задача).
+    """
+    try:
+        book = Book.objects.get(pk=job.book_id)
+        renditions.build(book)
+        published = publish_book_pdf(book, render_book_pdf(book))
+    except Exception as e:
+        job.retry_or_fail(repr(e))
+        catalog_cache.invalidate_books([job.book_id])
+        return False
+    job.delete()
+    catalog_cache.invalidate_books([job.book_id])
+    return True if published else None
@@ -0,0 +1,109 @@
+"""
+Уменьшенные копии обложек для списков книг (BOOK_RENDITION_SIZES x BOOK_RENDITION_FORMATS).
+
+Строит их воркер `render_books` вместе с PDF. Имя файла - sha256 содержимого,
+так что по одному URL всегда отдается одно и то же и его можно кешировать навсегда.
+"""
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import BookRendition
+
+RENDITIONS_DIR = 'book_renditions'
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def resize(image, width):
+    """
+    Уменьшает картинку до ширины width с сохранением пропорций, не увеличивая маленькие.
+    """
+    if image.width <= width:
+        return image
+    height = max(round(image.height * width / image.width), 1)
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def encode(image, fmt):
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            # прозрачность в JPEG заливаем белым
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    elif fmt == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+    out = BytesIO()
+    image.save(out, PIL_FORMATS[fmt], quality=settings.BOOK_RENDITION_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def store(data, fmt):
+    digest = hashlib.sha256(data).hexdigest()
+    name = f'{RENDITIONS_DIR}/{digest[:2]}/{digest}.{EXTENSIONS[fmt]}'
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+    return name
+
+
+def is_current(book, renditions):
+    expected = {(size, fmt) for size in settings.BOOK_RENDITION_SIZES for fmt in settings.BOOK_RENDITION_FORMATS}
+    current = {(r.size, r.format) for r in renditions if r.source == book.image.name}
+    return current == expected and len(renditions) == len(expected)
+
+
+def build(book):
+    """
+    Пересобирает копии обложки, если они сделаны не из текущего Book.image.
+    Возвращает True если что-то поменялось.
+    """
+    existing = BookRendition.objects.filter(book=book)
+    if not book.image:
+        return existing.delete()[0] > 0
+    if is_current(book, list(existing)):
+        return False
+
+    with book.image.open('rb') as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    renditions = []
+    for size, width in settings.BOOK_RENDITION_SIZES.items():
+        resized = resize(image, width)
+        for fmt in settings.BOOK_RENDITION_FORMATS:
+            renditions.append(BookRendition(
+                book=book, size=size, format=fmt, source=book.image.name,
+                file=store(encode(resized, fmt), fmt), width=resized.width, height=resized.height,
+            ))
+    with transaction.atomic():
+        existing.delete()
+        BookRendition.objects.bulk_create(renditions)
+    return True
+
+
+def srcsets(renditions, request=None):
+    """
+    Группирует копии одной книги в srcset-строки по форматам: {'webp': 'url 160w, url 320w', ...}
+    """
+    by_format = {}
+    seen = set()
+    for rendition in sorted(renditions, key=lambda r: r.width):
+        # маленькая обложка дает одинаковые small/medium/large, в srcset ширины должны быть разными
+        if (rendition.format, rendition.width) in seen:
+            continue
+        seen.add((rendition.format, rendition.width))
+        url = rendition.file.url
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        by_format.setdefault(rendition.format, []).append(f'{url} {rendition.width}w')
+    return {fmt: ', '.join(candidates) for fmt, candidates in by_format.items()}
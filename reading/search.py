@@ -0,0 +1,259 @@
+"""
+Полнотекстовый поиск по тексту страниц и названию/автору книг.
+
+Индекс лежит в отдельных таблицах (создаются миграцией 0008) и обновляется сигналами Page/Book:
+на SQLite это FTS5 таблицы, на Postgres - таблицы с tsvector и GIN индексом.
+"""
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Book, Page
+
+PAGE_TABLE = 'reading_page_fts'
+BOOK_TABLE = 'reading_book_fts'
+SNIPPET_WORDS = 16
+
+
+def terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def make_snippet(text, words):
+    """
+    Сниппет для бэкендов без встроенной подсветки: окно вокруг первого найденного слова.
+    """
+    tokens = re.split(r'(\W+)', text)
+    lowered = [token.lower() for token in tokens]
+    hit = next((i for i, token in enumerate(lowered) if any(token.startswith(word) for word in words)), 0)
+    start = max(hit - SNIPPET_WORDS, 0)
+    window = tokens[start:hit + SNIPPET_WORDS]
+    snippet = ''.join(
+        f'<b>{token}</b>' if any(token.lower().startswith(word) for word in words) else token
+        for token in window
+    )
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if hit + SNIPPET_WORDS < len(tokens) else ''
+    return prefix + snippet.strip() + suffix
+
+
+class SqliteBackend:
+
+    def index_page(self, cursor, page_id, book_id, text):
+        cursor.execute(f'DELETE FROM {PAGE_TABLE} WHERE rowid = %s', [page_id])
+        cursor.execute(f'INSERT INTO {PAGE_TABLE} (rowid, text, book_id) VALUES (%s, %s, %s)',
+                       [page_id, text, book_id])
+
+    def delete_page(self, cursor, page_id):
+        cursor.execute(f'DELETE FROM {PAGE_TABLE} WHERE rowid = %s', [page_id])
+
+    def index_book(self, cursor, book_id, name, author):
+        cursor.execute(f'DELETE FROM {BOOK_TABLE} WHERE rowid = %s', [book_id])
+        cursor.execute(f'INSERT INTO {BOOK_TABLE} (rowid, name, author) VALUES (%s, %s, %s)',
+                       [book_id, name, author])
+
+    def delete_book(self, cursor, book_id):
+        cursor.execute(f'DELETE FROM {BOOK_TABLE} WHERE rowid = %s', [book_id])
+
+    def clear(self, cursor):
+        cursor.execute(f'DELETE FROM {PAGE_TABLE}')
+        cursor.execute(f'DELETE FROM {BOOK_TABLE}')
+
+    def match(self, words):
+        return ' '.join('"%s"' % word for word in words)
+
+    def frequent(self, cursor, word):
+        # считаем совпадения только до порога: это дешево даже для самых частых слов
+        cursor.execute(
+            f'SELECT count(*) FROM (SELECT rowid FROM {PAGE_TABLE} WHERE {PAGE_TABLE} MATCH %s LIMIT %s)',
+            [self.match([word]), settings.FULL_TEXT_SEARCH_RANKED_PAGES],
+        )
+        return cursor.fetchone()[0] >= settings.FULL_TEXT_SEARCH_RANKED_PAGES
+
+    def search_pages(self, cursor, words, limit):
+        """
+        bm25 считается для каждой найденной страницы (на миллионе страниц частое слово - это секунды),
+        поэтому ранжируем только по редким словам, а частые лишь фильтруют. Если редких нет,
+        bm25 считается для FULL_TEXT_SEARCH_CANDIDATES самых новых совпадений.
+        """
+        snippet = f"snippet({PAGE_TABLE}, 0, '<b>', '</b>', '…', {SNIPPET_WORDS})"
+        rare = [word for word in words if not self.frequent(cursor, word)]
+        if not rare:
+            # нижняя граница rowid доходит до FTS5, совпадения старше нее не читаются
+            cursor.execute(
+                f"SELECT rowid, book_id, {snippet}, -bm25({PAGE_TABLE}) AS score FROM {PAGE_TABLE} "
+                f"WHERE {PAGE_TABLE} MATCH %s AND rowid >= (SELECT min(rowid) FROM "
+                f"(SELECT rowid FROM {PAGE_TABLE} WHERE {PAGE_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s)) "
+                f"ORDER BY bm25({PAGE_TABLE}) LIMIT %s",
+                [self.match(words), self.match(words), settings.FULL_TEXT_SEARCH_CANDIDATES, limit],
+            )
+        elif len(rare) == len(words):
+            cursor.execute(
+                f"SELECT rowid, book_id, {snippet}, -bm25({PAGE_TABLE}) AS score FROM {PAGE_TABLE} "
+                f"WHERE {PAGE_TABLE} MATCH %s ORDER BY bm25({PAGE_TABLE}) LIMIT %s",
+                [self.match(words), limit],
+            )
+        else:
+            # +rowid: список из подзапроса строится один раз, а не отдельным MATCH на каждый rowid
+            cursor.execute(
+                f"SELECT rowid, book_id, {snippet}, -bm25({PAGE_TABLE}) AS score FROM {PAGE_TABLE} "
+                f"WHERE {PAGE_TABLE} MATCH %s AND +rowid IN "
+                f"(SELECT rowid FROM {PAGE_TABLE} WHERE {PAGE_TABLE} MATCH %s) "
+                f"ORDER BY bm25({PAGE_TABLE}) LIMIT %s",
+                [self.match(rare), self.match(words), limit],
+            )
+        return cursor.fetchall()
+
+    def search_books(self, cursor, words, limit):
+        cursor.execute(
+            f"SELECT rowid, -bm25({BOOK_TABLE}, 10.0, 5.0) AS score FROM {BOOK_TABLE} "
+            f"WHERE {BOOK_TABLE} MATCH %s ORDER BY bm25({BOOK_TABLE}, 10.0, 5.0) LIMIT %s",
+            [self.match(words), limit],
+        )
+        return cursor.fetchall()
+
+
+class PostgresBackend:
+
+    @property
+    def config(self):
+        return settings.FULL_TEXT_SEARCH_CONFIG
+
+    def index_page(self, cursor, page_id, book_id, text):
+        cursor.execute(
+            f'INSERT INTO {PAGE_TABLE} (page_id, book_id, document) VALUES (%s, %s, to_tsvector(%s, %s)) '
+            f'ON CONFLICT (page_id) DO UPDATE SET book_id = EXCLUDED.book_id, document = EXCLUDED.document',
+            [page_id, book_id, self.config, text],
+        )
+
+    def delete_page(self, cursor, page_id):
+        cursor.execute(f'DELETE FROM {PAGE_TABLE} WHERE page_id = %s', [page_id])
+
+    def index_book(self, cursor, book_id, name, author):
+        cursor.execute(
+            f"INSERT INTO {BOOK_TABLE} (book_id, document) VALUES "
+            f"(%s, setweight(to_tsvector(%s, %s), 'A') || setweight(to_tsvector(%s, %s), 'B')) "
+            f"ON CONFLICT (book_id) DO UPDATE SET document = EXCLUDED.document",
+            [book_id, self.config, name, self.config, author],
+        )
+
+    def delete_book(self, cursor, book_id):
+        cursor.execute(f'DELETE FROM {BOOK_TABLE} WHERE book_id = %s', [book_id])
+
+    def clear(self, cursor):
+        cursor.execute(f'TRUNCATE {PAGE_TABLE}, {BOOK_TABLE}')
+
+    def search_pages(self, cursor, words, limit):
+        cursor.execute(
+            f"SELECT page_id, book_id, ts_rank(document, query) AS score "
+            f"FROM {PAGE_TABLE}, plainto_tsquery(%s, %s) query WHERE document @@ query "
+            f"ORDER BY score DESC LIMIT %s",
+            [self.config, ' '.join(words), limit],
+        )
+        hits = cursor.fetchall()
+        pages = Page.objects.using(cursor.db.alias).filter(pk__in=[hit[0] for hit in hits])
+        texts = dict(pages.values_list('pk', 'text'))
+        return [(page_id, book_id, make_snippet(texts.get(page_id, ''), words), score)
+                for page_id, book_id, score in hits]
+
+    def search_books(self, cursor, words, limit):
+        cursor.execute(
+            f"SELECT book_id, ts_rank(document, query) AS score "
+            f"FROM {BOOK_TABLE}, plainto_tsquery(%s, %s) query WHERE document @@ query "
+            f"ORDER BY score DESC LIMIT %s",
+            [self.config, ' '.join(words), limit],
+        )
+        return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SqliteBackend(),
+    'postgresql': PostgresBackend(),
+}
+
+
+def get_backend(db_connection=connection):
+    return BACKENDS[db_connection.vendor]
+
+
+def search(query, limit=20, using=None):
+    """
+    Возвращает (книги, страницы): id книг по убыванию релевантности и
+    хиты страниц вида {page, book, book_name, page_number, snippet, rank}.
+    using - другая база с индексом (benchmark_search), по умолчанию страницы читаются через роутер.
+    """
+    words = terms(query)
+    if not words:
+        return [], []
+    db_connection = connections[using or DEFAULT_DB_ALIAS]
+    backend = get_backend(db_connection)
+    with db_connection.cursor() as cursor:
+        book_hits = backend.search_books(cursor, words, limit)
+        page_hits = backend.search_pages(cursor, words, limit)
+
+    pages = (Page.objects.using(using) if using else Page.objects).filter(pk__in=[hit[0] for hit in page_hits])
+    pages = pages.values_list('pk', 'page_number', 'book__name')
+    pages = {pk: (page_number, book_name) for pk, page_number, book_name in pages}
+    results = [
+        {
+            'page': page_id,
+            'book': book_id,
+            'book_name': pages[page_id][1],
+            'page_number': str(pages[page_id][0]),
+            'snippet': snippet,
+            'rank': score,
+        }
+        for page_id, book_id, snippet, score in page_hits if page_id in pages
+    ]
+    return [book_id for book_id, _ in book_hits], results
+
+
+def rebuild():
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        backend.clear(cursor)
+        for book_id, name, author in Book.objects.values_list('pk', 'name', 'author').iterator():
+            backend.index_book(cursor, book_id, name, author)
+        for page in Page.objects.only('book_id', 'text').iterator(chunk_size=1000):
+            backend.index_page(cursor, page.pk, page.book_id, page.text)
+
+
+def index_books(book_ids):
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        for book_id, name, author in Book.objects.filter(pk__in=book_ids).values_list('pk', 'name', 'author'):
+            backend.index_book(cursor, book_id, name, author)
+        pages = Page.objects.filter(book_id__in=book_ids).only('book_id', 'text')
+        for page in pages.iterator(chunk_size=1000):
+            backend.index_page(cursor, page.pk, page.book_id, page.text)
+
+
+@receiver(post_save, sender=Page)
+def index_page(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    with connection.cursor() as cursor:
+        get_backend().index_page(cursor, instance.pk, instance.book_id, instance.text)
+
+
+@receiver(post_delete, sender=Page)
+def unindex_page(sender, instance, **kwargs):
+    with connection.cursor() as cursor:
+        get_backend().delete_page(cursor, instance.pk)
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    with connection.cursor() as cursor:
+        get_backend().index_book(cursor, instance.pk, instance.name, instance.author)
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    with connection.cursor() as cursor:
+        get_backend().delete_book(cursor, instance.pk)
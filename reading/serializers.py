@@ -1,7 +1,10 @@
 # serializers.py
-from django.db.models import Avg
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.urls import reverse
 from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
+from . import renditions
 from .models import *
 
 
@@ -16,23 +19,6 @@ class PageSerializer(serializers.ModelSerializer):
         model = Page
         fields = ['id', 'text', 'page_number', 'book']
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        user = self.context['request'].user
-        book = instance.book
-
-        book_status, created = BookStatus.objects.get_or_create(user=user, book=book)
-        if book_status.status != 'read':
-            book_status.status = 'reading'
-            book_status.save()
-
-        LastPage.objects.update_or_create(
-            user=user,
-            defaults={'page': instance}
-        )
-
-        return representation
-
 
 class PageListSerializer(serializers.ModelSerializer):
     class Meta:
@@ -40,35 +26,119 @@ class PageListSerializer(serializers.ModelSerializer):
         fields = ['id',  'page_number', 'book']
 
 
+class BookListListSerializer(serializers.ListSerializer):
+    """
+    Загружает жанры и статусы сразу для всей страницы книг,
+    чтобы список обходился фиксированным числом запросов.
+    """
+
+    def to_representation(self, data):
+        books = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        related = getattr(self.child, '_related', None)
+        # aload_related мог загрузить все заранее
+        if related is None or not related['ids'].issuperset(book.pk for book in books):
+            self.child.load_related(books)
+        return super().to_representation(books)
+
+
 class BookListSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField()
+    pdf = serializers.SerializerMethodField()
     genre = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
     status = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
-        fields = ['id', 'name', 'image', 'author', 'total_pages', 'pdf', 'genre', 'average_rating', 'status']
+        fields = ['id', 'name', 'image', 'image_srcset', 'author', 'total_pages', 'pdf', 'render_status', 'genre',
+                  'average_rating', 'status']
+        list_serializer_class = BookListListSerializer
+
+    def related_querysets(self, books):
+        book_ids = [book.pk for book in books]
+        querysets = {
+            'genre': BookGenre.objects.filter(book_id__in=book_ids).order_by('id').values_list('book_id', 'genre__name'),
+            'image_srcset': BookRendition.objects.filter(book_id__in=[book.pk for book in books if book.image]),
+        }
+        user = self.context['request'].user
+        # with_status=False - ответ для общего кеша каталога, статусы подмешиваются позже
+        if user.is_authenticated and self.context.get('with_status', True):
+            querysets['status'] = BookStatus.objects.filter(user=user, book_id__in=book_ids).values_list('book_id', 'status')
+        return querysets
+
+    def load_related(self, books):
+        self.set_related(books, {name: list(queryset) for name, queryset in self.related_querysets(books).items()})
+
+    async def aload_related(self, books):
+        """
+        load_related для async views, после него сериализация в базу не ходит.
+        """
+        rows = {}
+        for name, queryset in self.related_querysets(books).items():
+            rows[name] = [row async for row in queryset]
+        self.set_related(books, rows)
+
+    def set_related(self, books, rows):
+        genres = {}
+        for book_id, genre_name in rows['genre']:
+            genres.setdefault(book_id, []).append(genre_name)
+
+        srcsets = {}
+        current_images = {book.pk: book.image.name for book in books if book.image}
+        by_book = {}
+        for rendition in rows['image_srcset']:
+            # копии от прошлой обложки не отдаем, пока воркер не пересобрал новые
+            if rendition.source == current_images[rendition.book_id]:
+                by_book.setdefault(rendition.book_id, []).append(rendition)
+        for book_id, book_renditions in by_book.items():
+            srcsets[book_id] = renditions.srcsets(book_renditions, self.context.get('request'))
+
+        self._related = {
+            'ids': {book.pk for book in books},
+            'genre': genres,
+            'image_srcset': srcsets,
+            'status': dict(rows.get('status', [])),
+        }
+
+    def get_related(self, obj, name):
+        related = getattr(self, '_related', None)
+        if related is None or obj.pk not in related['ids']:
+            self.load_related([obj])
+        return self._related[name].get(obj.pk)
+
+    def delivery_url(self, name, obj):
+        # ссылки на BookCoverView/BookPdfView (Range, ETag, X-Accel-Redirect), а не на /media/
+        url = reverse(name, kwargs={'book_id': obj.pk})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    @extend_schema_field(serializers.URLField(allow_null=True))
+    def get_image(self, obj):
+        return self.delivery_url('book-cover', obj) if obj.image else None
+
+    @extend_schema_field(serializers.URLField(allow_null=True))
+    def get_pdf(self, obj):
+        # PDF еще не перерисован или рендер упал, старую ссылку не отдаем
+        if not obj.pdf or obj.render_status != Book.RENDER_READY:
+            return None
+        return self.delivery_url('book-pdf', obj)
 
     @extend_schema_field(serializers.ListField(child=serializers.CharField()))
     def get_genre(self, obj):
-        book_genres = BookGenre.objects.filter(book=obj)
-        return [i.genre.name for i in book_genres]
+        return self.get_related(obj, 'genre') or []
+
+    @extend_schema_field(serializers.DictField(child=serializers.CharField()))
+    def get_image_srcset(self, obj):
+        return self.get_related(obj, 'image_srcset') or {}
 
     @extend_schema_field(serializers.FloatField(allow_null=True))
     def get_average_rating(self, obj):
-        average_rating = BookRating.objects.filter(book=obj).exclude(rating__isnull=True).aggregate(Avg('rating'))[
-            'rating__avg']
-        if average_rating is not None:
-            return round(average_rating, 2)
-        return None
+        return obj.average_rating
 
     @extend_schema_field(serializers.CharField())
     def get_status(self, obj):
-        user = self.context['request'].user
-        book_status = BookStatus.objects.filter(user=user, book=obj).first()
-        if book_status:
-            return book_status.status
-        return ''
+        return self.get_related(obj, 'status') or ''
 
 
 class LastPageSerializer(serializers.ModelSerializer):
@@ -76,7 +146,26 @@ class LastPageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = LastPage
-        fields = ['user', 'page']
+        fields = ['user', 'book', 'page', 'updated_at']
+
+
+class ReadingPositionSerializer(serializers.Serializer):
+    book = serializers.IntegerField()
+    page = serializers.IntegerField()
+    updated_at = serializers.DateTimeField(required=False)
+
+
+class ReadingPositionBulkSerializer(serializers.Serializer):
+    positions = serializers.ListField(
+        child=ReadingPositionSerializer(), allow_empty=False, max_length=settings.READING_POSITIONS_BULK_MAX
+    )
+
+    def validate_positions(self, value):
+        page_books = dict(Page.objects.filter(pk__in={item['page'] for item in value}).values_list('pk', 'book_id'))
+        for item in value:
+            if page_books.get(item['page']) != item['book']:
+                raise serializers.ValidationError(f"Page {item['page']} does not belong to book {item['book']}.")
+        return value
 
 
 class FavoriteBookSerializer(serializers.ModelSerializer):
@@ -86,14 +175,13 @@ class FavoriteBookSerializer(serializers.ModelSerializer):
         fields = ['user', 'book']
 
     def create(self, validated_data):
-        user = validated_data['user']
-        book = validated_data['book']
-
-        if FavoriteBook.objects.filter(user=user, book=book).exists():
+        # повтор ловит unique_favorite_book, без лишнего exists() перед вставкой
+        try:
+            with transaction.atomic():
+                return FavoriteBook.objects.create(**validated_data)
+        except IntegrityError:
             raise serializers.ValidationError("This book is already in favorites.")
 
-        return FavoriteBook.objects.create(**validated_data)
-
 
 class BookRatingSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,171 @@
+"""
+"С этой книгой также читают": item-item похожесть по разреженной матрице юзер x книга.
+
+Матрица строится из BookStatus, FavoriteBook и BookRating (веса как в recommendations),
+похожесть (cosine или jaccard) считается блоками столбцов матричным умножением scipy,
+для каждой книги сохраняется топ-K соседей в SimilarBook.
+"""
+import uuid
+from array import array
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from scipy import sparse
+
+from .models import BookRating, BookStatus, FavoriteBook, SimilarBook, SimilarityDirtyBook
+from .recommendations import FAVORITE_WEIGHT, STATUS_WEIGHTS
+
+BLOCK_SIZE = 2048
+METRICS = ('cosine', 'jaccard')
+
+
+def interaction_matrix():
+    """
+    Возвращает (матрица users x books в CSR, массив book_id для столбцов).
+    Повторные взаимодействия суммируются, отрицательные веса (плохие оценки) обнуляются.
+    """
+    user_ids, book_ids, weights = array('q'), array('q'), array('d')
+
+    def add(rows, weight):
+        for user_id, book_id, value in rows:
+            user_ids.append(user_id)
+            book_ids.append(book_id)
+            weights.append(weight(value))
+
+    add(BookStatus.objects.values_list('user_id', 'book_id', 'status').iterator(chunk_size=10000),
+        lambda status: STATUS_WEIGHTS.get(status, 0.0))
+    add(FavoriteBook.objects.values_list('user_id', 'book_id', 'id').iterator(chunk_size=10000),
+        lambda _: FAVORITE_WEIGHT)
+    add(BookRating.objects.exclude(rating__isnull=True).values_list('user_id', 'book_id', 'rating')
+        .iterator(chunk_size=10000), lambda rating: (rating - 5) / 5)
+
+    users, rows = np.unique(np.frombuffer(user_ids, dtype=np.int64), return_inverse=True)
+    books, cols = np.unique(np.frombuffer(book_ids, dtype=np.int64), return_inverse=True)
+    matrix = sparse.coo_matrix(
+        (np.frombuffer(weights, dtype=np.float64), (rows, cols)), shape=(len(users), len(books))
+    ).tocsr()
+    matrix.data = np.clip(matrix.data, 0, None).astype(np.float32)
+    matrix.eliminate_zeros()
+    return matrix, books
+
+
+def prepare(matrix, metric):
+    """
+    Нормализация, которая нужна метрике, считается один раз на всю матрицу.
+    """
+    if metric == 'cosine':
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+        norms[norms == 0] = 1.0
+        return (matrix @ sparse.diags(1.0 / norms)).tocsr(), None
+    binary = (matrix > 0).astype(np.float32)
+    return binary, np.asarray(binary.sum(axis=0)).ravel()
+
+
+def similarity_rows(prepared, cols, metric):
+    """
+    Похожесть книг cols со всеми книгами: разреженная матрица len(cols) x books.
+    """
+    matrix, counts = prepared
+    product = (matrix[:, cols].T @ matrix).tocsr()
+    if metric == 'jaccard':
+        row_counts = np.repeat(counts[cols], np.diff(product.indptr))
+        product.data = product.data / (row_counts + counts[product.indices] - product.data)
+    return product
+
+
+def top_k(row_matrix, own_cols, k):
+    """
+    Для каждой строки возвращает [(столбец, score), ...] по убыванию score, без самой книги.
+    """
+    result = []
+    for i, own_col in enumerate(own_cols):
+        start, end = row_matrix.indptr[i], row_matrix.indptr[i + 1]
+        cols, values = row_matrix.indices[start:end], row_matrix.data[start:end]
+        keep = (cols != own_col) & (values > 0)
+        cols, values = cols[keep], values[keep]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            cols, values = cols[best], values[best]
+        order = np.lexsort((cols, -values))
+        result.append(list(zip(cols[order].tolist(), values[order].tolist())))
+    return result
+
+
+def build(book_ids=None, metric='cosine', k=None):
+    """
+    Пересчитывает соседей для всех книг (book_ids=None) или только для book_ids.
+    Возвращает число книг, для которых записаны соседи.
+    """
+    k = k or settings.SIMILAR_BOOKS_TOP_K
+    matrix, books = interaction_matrix()
+    return write_neighbours(prepare(matrix, metric), books, book_ids, metric, k)
+
+
+def write_neighbours(prepared, books, book_ids, metric, k):
+    positions = {int(book_id): col for col, book_id in enumerate(books)}
+    if book_ids is None:
+        targets = list(range(len(books)))
+        SimilarBook.objects.exclude(book_id__in=positions).delete()
+    else:
+        targets = [positions[book_id] for book_id in book_ids if book_id in positions]
+        SimilarBook.objects.filter(book_id__in=[book_id for book_id in book_ids if book_id not in positions]).delete()
+
+    for start in range(0, len(targets), BLOCK_SIZE):
+        cols = targets[start:start + BLOCK_SIZE]
+        neighbours = top_k(similarity_rows(prepared, cols, metric), cols, k)
+        with transaction.atomic():
+            block_books = [int(books[col]) for col in cols]
+            SimilarBook.objects.filter(book_id__in=block_books).delete()
+            SimilarBook.objects.bulk_create(
+                [
+                    SimilarBook(book_id=book_id, similar_id=int(books[col]), rank=rank, score=score)
+                    for book_id, row in zip(block_books, neighbours)
+                    for rank, (col, score) in enumerate(row)
+                ],
+                batch_size=5000,
+            )
+    return len(targets)
+
+
+def affected_books(prepared, books, dirty, metric, k):
+    """
+    Книги, чьи списки соседей могли поменяться: сами dirty, книги, у которых dirty уже в топ-K,
+    и книги, в чей топ-K dirty теперь проходит. Похожесть симметрична, поэтому хватает строк dirty.
+    """
+    affected = set(dirty)
+    affected.update(SimilarBook.objects.filter(similar_id__in=dirty).values_list('book_id', flat=True))
+    # score K-го соседа; у книг с неполным списком порога нет
+    thresholds = dict(SimilarBook.objects.filter(rank=k - 1).values_list('book_id', 'score'))
+    positions = {int(book_id): col for col, book_id in enumerate(books)}
+    cols = [positions[book_id] for book_id in dirty if book_id in positions]
+    for start in range(0, len(cols), BLOCK_SIZE):
+        rows = similarity_rows(prepared, cols[start:start + BLOCK_SIZE], metric)
+        for col, score in zip(rows.indices.tolist(), rows.data.tolist()):
+            book_id = int(books[col])
+            if score > thresholds.get(book_id, 0):
+                affected.add(book_id)
+    return affected
+
+
+def refresh(metric='cosine', k=None):
+    """
+    Инкрементальный пересчет: книги, помеченные в SimilarityDirtyBook, и их соседи.
+    Пометки берутся до чтения матрицы, а удаляются только взятые: книга, которую пометили
+    снова во время пересчета, останется до следующего запуска.
+    """
+    k = k or settings.SIMILAR_BOOKS_TOP_K
+    claim = uuid.uuid4()
+    if not SimilarityDirtyBook.objects.update(claim=claim):
+        return 0
+    claimed = SimilarityDirtyBook.objects.filter(claim=claim)
+    try:
+        dirty = list(claimed.values_list('book_id', flat=True))
+        matrix, books = interaction_matrix()
+        prepared = prepare(matrix, metric)
+        built = write_neighbours(prepared, books, affected_books(prepared, books, dirty, metric, k), metric, k)
+    except BaseException:
+        claimed.update(claim=None)
+        raise
+    claimed.delete()
+    return built
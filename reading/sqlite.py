@@ -0,0 +1,20 @@
+"""
+Профиль SQLite для одиночных узлов: PRAGMA из SQLITE_PRAGMAS выставляются на каждом новом соединении.
+С WAL читатели не ждут запись прогресса чтения, а писатель не ждет читателей.
+Чекпоинт WAL, PRAGMA optimize и ANALYZE - команда sqlite_maintenance.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def apply_pragmas(cursor, pragmas):
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite' and settings.SQLITE_PRAGMAS:
+        with connection.cursor() as cursor:
+            apply_pragmas(cursor, settings.SQLITE_PRAGMAS)
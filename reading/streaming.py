@@ -0,0 +1,33 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+CHUNK_BYTES = 64 * 1024
+
+
+def iter_json_array(rows, fields, chunk_bytes=CHUNK_BYTES):
+    """
+    Отдает JSON массив объектов кусками, не держа в памяти весь список.
+    Формат совпадает с JSONRenderer DRF (компактный, без экранирования юникода, Decimal строкой).
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    buffer = ['[']
+    size = 1
+    first = True
+    for row in rows:
+        item = encoder.encode(dict(zip(fields, row)))
+        if not first:
+            item = ',' + item
+        first = False
+        buffer.append(item)
+        size += len(item)
+        if size >= chunk_bytes:
+            yield ''.join(buffer).encode()
+            buffer, size = [], 0
+    buffer.append(']')
+    yield ''.join(buffer).encode()
+
+
+def stream_queryset(queryset, fields, chunk_size=500):
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    return iter_json_array(rows, [field.removesuffix('_id') for field in fields])
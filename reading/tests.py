@@ -1,3 +1,290 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from regauth.models import CustomUser
+from . import recommendations, rendering, search, similarity
+from .models import (
+    Book, BookGenre, BookRating, BookRenderJob, BookStatus, FavoriteBook, Genre, LastPage, Page, Recommendation,
+    SimilarBook, SimilarityDirtyBook,
+)
+
+
+# ответы строятся на каждый запрос, а не берутся из кеша каталога
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class BookListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        cls.genres = Genre.objects.bulk_create([Genre(name='fantasy'), Genre(name='history')])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def add_books(self, count):
+        start = Book.objects.count()
+        # bulk_create без save(): рендер PDF здесь не нужен; у половины книг есть обложка
+        books = Book.objects.bulk_create([
+            Book(name=f'Book {start + i}', author='Author', image=f'book_images/{start + i}.jpg' if i % 2 else None)
+            for i in range(count)
+        ])
+        BookGenre.objects.bulk_create([BookGenre(book=book, genre=genre) for book in books for genre in self.genres])
+        BookStatus.objects.bulk_create([BookStatus(user=self.user, book=book, status='reading') for book in books])
+
+    def assertListQueries(self, num, books):
+        with self.assertNumQueries(num):
+            response = self.client.get('/api/v1/books/', {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), books)
+        return response.data['results']
+
+    def test_anonymous(self):
+        # книги, жанры, копии обложек
+        self.add_books(10)
+        self.assertListQueries(3, 10)
+        self.add_books(10)
+        results = self.assertListQueries(3, 20)
+        self.assertEqual(results[0]['genre'], ['fantasy', 'history'])
+        self.assertEqual(results[0]['status'], '')
+
+    def test_authenticated_with_statuses(self):
+        # плюс один запрос статусов юзера
+        self.client.force_authenticate(self.user)
+        self.add_books(10)
+        self.assertListQueries(4, 10)
+        self.add_books(10)
+        results = self.assertListQueries(4, 20)
+        self.assertTrue(all(book['status'] == 'reading' for book in results))
+
+
+@override_settings(
+    CATALOG_CACHE_ENABLED=True,
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'catalog-tests'}},
+)
+class CatalogETagTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.bulk_create([Book(name='Book', author='Author')])[0]
+        self.client = APIClient()
+        self.etag = self.client.get(f'/api/v1/books/{self.book.pk}/')['ETag']
+
+    def get(self, if_none_match):
+        return self.client.get(f'/api/v1/books/{self.book.pk}/', HTTP_IF_NONE_MATCH=if_none_match).status_code
+
+    def test_whole_tags_match(self):
+        for header in (self.etag, f'W/{self.etag}', f'"other", {self.etag}', '*'):
+            self.assertEqual(self.get(header), 304, header)
+        # обрезанный или дополненный тег - это другой тег
+        for header in (self.etag[:-3] + '"', f'x{self.etag}', f'{self.etag}x', '"other"'):
+            self.assertEqual(self.get(header), 200, header)
+
+
+class LastPageViewTests(TestCase):
+    def test_page_is_joined(self):
+        user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        book = Book.objects.bulk_create([Book(name='Book', author='Author')])[0]
+        page = Page.objects.create(book=book, page_number=1, text='text')
+        LastPage.objects.create(user=user, book=book, page=page)
+        client = APIClient()
+        client.force_authenticate(user)
+        # позиция вместе со страницей одним запросом, текст страницы входит в ответ
+        with self.assertNumQueries(1):
+            response = client.get('/api/v1/users/last-page/', {'book': book.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['page']['text'], 'text')
+
+
+class SearchViewTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        book = Book.objects.create(name='Dragons', author='Author')
+        self.pages = [
+            Page.objects.create(book=book, page_number=number, text=f'the dragon sleeps {number}').pk
+            for number in range(1, 4)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_limit(self):
+        response = self.client.get('/api/v1/books/search/', {'q': 'dragon', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['pages']), 2)
+
+    def test_limit_must_be_positive(self):
+        for limit in (0, -1):
+            response = self.client.get('/api/v1/books/search/', {'q': 'dragon', 'limit': limit})
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(FULL_TEXT_SEARCH_RANKED_PAGES=3, FULL_TEXT_SEARCH_CANDIDATES=2)
+    def test_frequent_words(self):
+        Page.objects.filter(pk=self.pages[1]).update(text='dragon dragon dragon 2')
+        search.rebuild()
+        # 'dragon' есть на всех трех страницах: bm25 только по двум новым, чаще всего слово на второй
+        response = self.client.get('/api/v1/books/search/', {'q': 'dragon'})
+        self.assertEqual([page['page'] for page in response.data['pages']], [self.pages[1], self.pages[2]])
+        self.assertGreater(response.data['pages'][0]['rank'], response.data['pages'][1]['rank'])
+        # частое слово только фильтрует, ранжирует редкое
+        response = self.client.get('/api/v1/books/search/', {'q': 'dragon 2'})
+        self.assertEqual([page['page'] for page in response.data['pages']], [self.pages[1]])
+        self.assertIn('<b>2</b>', response.data['pages'][0]['snippet'])
+
+
+class RecommendationViewTests(TestCase):
+    def setUp(self):
+        self.books = Book.objects.bulk_create([Book(name=f'Book {i}', author='Author') for i in range(3)])
+        self.user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def recommended(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/v1/books/rec/')
+        self.assertEqual(response.status_code, 200)
+        # взаимодействия всех юзеров читает только build_recommendations
+        for table in (FavoriteBook._meta.db_table, BookRating._meta.db_table):
+            self.assertFalse([query for query in context.captured_queries if table in query['sql']])
+        return [book['id'] for book in response.data]
+
+    def test_newest_books_before_build(self):
+        self.assertEqual(self.recommended(), [book.pk for book in reversed(self.books)])
+
+    def test_popular_books_after_build(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='secret')
+        FavoriteBook.objects.create(user=other, book=self.books[1])
+        recommendations.build()
+        self.assertEqual(self.recommended(), [self.books[1].pk])
+
+    def test_genre_candidates_and_stale_rows(self):
+        genre = Genre.objects.create(name='fantasy')
+        BookGenre.objects.bulk_create([BookGenre(book=self.books[i], genre=genre) for i in (0, 2)])
+        for user_ids in (None, [self.user.pk]):
+            favorite = FavoriteBook.objects.create(user=self.user, book=self.books[0])
+            recommendations.build()
+            self.assertEqual(self.recommended(), [self.books[2].pk])
+            # взаимодействий не осталось - снова популярные книги
+            favorite.delete()
+            recommendations.build(user_ids)
+            self.assertFalse(Recommendation.objects.filter(user=self.user).exists())
+
+
+@override_settings(SIMILAR_BOOKS_TOP_K=1)
+class SimilarityRefreshTests(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c = Book.objects.bulk_create([Book(name=name, author='Author') for name in 'ABC'])
+        self.users = [
+            CustomUser.objects.create_user(username=f'reader{i}', email=f'reader{i}@example.com', password='secret')
+            for i in range(3)
+        ]
+        FavoriteBook.objects.bulk_create([
+            FavoriteBook(user=self.users[0], book=self.b),
+            *[FavoriteBook(user=user, book=self.c) for user in self.users],
+        ])
+        similarity.build()
+        SimilarityDirtyBook.objects.all().delete()
+
+    def neighbours(self):
+        return [(row[0], row[1], row[2], round(row[3], 5))
+                for row in SimilarBook.objects.order_by('book', 'rank').values_list('book', 'similar', 'rank', 'score')]
+
+    def test_refresh_matches_full_build(self):
+        # помечена только A, но она вытесняет B из топа C
+        FavoriteBook.objects.create(user=self.users[1], book=self.a)
+        FavoriteBook.objects.create(user=self.users[2], book=self.a)
+        self.assertEqual(list(SimilarityDirtyBook.objects.values_list('book', flat=True)), [self.a.pk])
+        similarity.refresh()
+        refreshed = self.neighbours()
+        self.assertIn((self.c.pk, self.a.pk, 0), [row[:3] for row in refreshed])
+        similarity.build()
+        self.assertEqual(refreshed, self.neighbours())
+
+    def test_mark_during_refresh_is_kept(self):
+        FavoriteBook.objects.create(user=self.users[1], book=self.a)
+        load = similarity.interaction_matrix
+
+        def load_and_mark():
+            loaded = load()
+            # новое взаимодействие после чтения матрицы
+            FavoriteBook.objects.create(user=self.users[2], book=self.a)
+            return loaded
+
+        with mock.patch.object(similarity, 'interaction_matrix', load_and_mark):
+            similarity.refresh()
+        self.assertEqual(list(SimilarityDirtyBook.objects.values_list('book', flat=True)), [self.a.pk])
+
+
+class RenderJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media_root, BOOK_RENDER_DEBOUNCE=timedelta(0), CATALOG_CACHE_ENABLED=False,
+        ))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book = Book.objects.create(name='Book', author='Author')
+            Page.objects.create(book=self.book, page_number=1, text='first')
+
+    def test_publish(self):
+        self.assertTrue(rendering.run_job(BookRenderJob.claim()))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.render_status, Book.RENDER_READY)
+        self.assertTrue(self.book.pdf)
+
+    def test_pdf_served_only_when_ready(self):
+        user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        client = APIClient()
+        client.force_authenticate(user)
+        url = f'/api/v1/books/{self.book.pk}/pdf/'
+        self.assertEqual(client.get(url).status_code, 409)
+        self.assertIsNone(client.get(f'/api/v1/books/{self.book.pk}/').data['pdf'])
+
+        rendering.run_job(BookRenderJob.claim())
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        # ссылка ведет на BookPdfView, а не в /media/
+        self.assertEqual(client.get(f'/api/v1/books/{self.book.pk}/').data['pdf'], f'http://testserver{url}')
+
+        Book.objects.filter(pk=self.book.pk).update(render_status=Book.RENDER_FAILED)
+        self.assertEqual(client.get(url).status_code, 404)
+
+    def test_only_pdf_fields_request_render(self):
+        rendering.run_job(BookRenderJob.claim())
+        book = Book.objects.get(pk=self.book.pk)
+        book.status = 'read'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+            book.save(update_fields=['status'])
+        book.refresh_from_db()
+        self.assertEqual(book.render_status, Book.RENDER_READY)
+        self.assertFalse(BookRenderJob.objects.exists())
+
+        book.name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save(update_fields=['name'])
+        book.refresh_from_db()
+        self.assertEqual(book.render_status, Book.RENDER_PENDING)
+        self.assertTrue(BookRenderJob.objects.exists())
+
+    def test_edit_during_render_keeps_pending(self):
+        render = rendering.render_book_pdf
+
+        def render_and_edit(book):
+            content = render(book)
+            with self.captureOnCommitCallbacks(execute=True):
+                Page.objects.create(book=self.book, page_number=2, text='second')
+            return content
+
+        with mock.patch.object(rendering, 'render_book_pdf', render_and_edit):
+            self.assertIsNone(rendering.run_job(BookRenderJob.claim()))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.render_status, Book.RENDER_PENDING)
+        self.assertFalse(self.book.pdf)
+        # правку перерисует следующая задача
+        self.assertTrue(rendering.run_job(BookRenderJob.claim()))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.render_status, Book.RENDER_READY)
@@ -5,9 +5,15 @@ from .views import *
 urlpatterns = [
     path('books/', BookListView.as_view(), name='book-list'),
     path('books/<int:book_id>/', BookDetailView.as_view(), name='book-detail'),
+    path('books/<int:book_id>/similar/', SimilarBooksView.as_view(), name='similar-books'),
+    path('books/<int:book_id>/pdf/', BookPdfView.as_view(), name='book-pdf'),
+    path('books/<int:book_id>/cover/', BookCoverView.as_view(), name='book-cover'),
     path('books/<int:book_id>/pages/', PageListView.as_view(), name='page-list'),
+    path('books/<int:book_id>/pages/dump/', PageDumpView.as_view(), name='page-dump'),
     path('books/<int:book_id>/pages/<int:page_id>/', PageDetailView.as_view(), name='page-detail'),
+    path('books/<int:book_id>/pages/<int:page_id>/window/', PageWindowView.as_view(), name='page-window'),
     path('users/last-page/', LastPageView.as_view(), name='last-page'),
+    path('users/last-page/bulk/', LastPageBulkView.as_view(), name='last-page-bulk'),
     path('books/<int:book_id>/fav/', AddToFavoritesView.as_view(), name='add-to-favorites'),
     path('users/fav/', GetFavoriteBookView.as_view(), name='add-to-favorites'),
     path('books/<int:book_id>/rating/', AddRatingView.as_view(), name='add-rating'),
@@ -16,6 +22,7 @@ urlpatterns = [
     path('books/<int:book_id>/feedback/<int:pk>/rm/', RemoveFeedbackView.as_view(), name='remove-feedback'),
     path('books/history/', HistoryView.as_view(), name='history'),
     path('books/sch-genre/', SearchByGenreView.as_view(), name='search-by-genre'),
+    path('books/search/', SearchView.as_view(), name='search'),
     path('books/rec/', RecommendationView.as_view(), name='recommendation'),
 
 ]
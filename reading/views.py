@@ -1,12 +1,22 @@
 # views.py
-from django.db.models import Avg, Count
-from drf_spectacular.utils import extend_schema
+import mimetypes
+
+from django.conf import settings
+from django.db.models import F, Subquery
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import generics
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from . import catalog_cache, delivery, progress, recommendations, search
 from .models import Book, Page
+from .pagination import HistoryCursorPagination, IdCursorPagination, PageNumberCursorPagination
 from .serializers import *
+from .streaming import stream_queryset
 
 
 @extend_schema(tags=['Books'])
@@ -19,6 +29,15 @@ class BookListView(generics.ListAPIView):
     permission_classes = [AllowAny]
     queryset = Book.objects.all()
     serializer_class = BookListSerializer
+    pagination_class = IdCursorPagination
+
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'with_status': False}
+
+    def list(self, request, *args, **kwargs):
+        return catalog_cache.respond(
+            request, catalog_cache.list_key(request), lambda: super(BookListView, self).list(request, *args, **kwargs).data
+        )
 
 
 @extend_schema(tags=['Books'])
@@ -31,14 +50,64 @@ class BookDetailView(generics.RetrieveAPIView):
     queryset = Book.objects.all()
     serializer_class = BookListSerializer
 
+    def get_serializer_context(self):
+        return {**super().get_serializer_context(), 'with_status': False}
+
     def get(self, request, *args, **kwargs):
         book_id = self.kwargs.get('book_id')
-        try:
-            book = Book.objects.get(pk=book_id)
-            serializer = self.get_serializer(book)
-            return Response(serializer.data)
-        except Book.DoesNotExist:
-            return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+        return catalog_cache.respond(request, catalog_cache.detail_key(request, book_id), lambda: self.build(book_id))
+
+    def build(self, book_id):
+        book = Book.objects.filter(pk=book_id).first()
+        if book is None:
+            return None
+        return self.get_serializer(book).data
+
+
+@extend_schema(tags=['Books'])
+class SimilarBooksView(generics.ListAPIView):
+    """
+       Здесь не нужен access токен. Книги, которые читают вместе с этой ("с этой книгой также читают"),
+       самые похожие первыми
+    """
+    permission_classes = [AllowAny]
+    serializer_class = BookListSerializer
+
+    def get_queryset(self):
+        return Book.objects.filter(similar_to__book_id=self.kwargs.get('book_id')).order_by('similar_to__rank')
+
+
+@extend_schema(tags=['Books'], responses={(200, 'application/pdf'): OpenApiTypes.BINARY})
+class BookPdfView(generics.GenericAPIView):
+    """
+       Здесь нужен access токен. Отдает PDF книги потоком, поддерживает Range (для постраничной загрузки
+       в PDF вьюверах), ETag и Last-Modified. Пока книга ждет рендера - 409
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, book_id):
+        book = Book.objects.filter(pk=book_id).only('pdf', 'render_status').first()
+        if book is not None and book.render_status == Book.RENDER_PENDING:
+            # старый PDF уже не совпадает с книгой, новый еще не опубликован
+            return Response({"error": "PDF is being rendered"}, status=status.HTTP_409_CONFLICT)
+        if book is None or not book.pdf or book.render_status != Book.RENDER_READY:
+            return Response({"error": "PDF not available"}, status=status.HTTP_404_NOT_FOUND)
+        return delivery.serve(request, book.pdf, 'application/pdf')
+
+
+@extend_schema(tags=['Books'], responses={(200, 'image/*'): OpenApiTypes.BINARY})
+class BookCoverView(generics.GenericAPIView):
+    """
+       Здесь не нужен access токен. Отдает обложку книги потоком с поддержкой Range, ETag и Last-Modified
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, book_id):
+        book = Book.objects.filter(pk=book_id).only('image').first()
+        if book is None or not book.image:
+            return Response({"error": "Image not available"}, status=status.HTTP_404_NOT_FOUND)
+        content_type = mimetypes.guess_type(book.image.name)[0] or 'application/octet-stream'
+        return delivery.serve(request, book.image, content_type)
 
 
 @extend_schema(tags=['Books'])
@@ -48,16 +117,34 @@ class PageListView(generics.ListAPIView):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = PageListSerializer
+    pagination_class = PageNumberCursorPagination
+
+    def get_queryset(self):
+        return Page.objects.filter(book_id=self.kwargs.get('book_id')).defer('text')
 
     def get(self, request, *args, **kwargs):
-        book_id = self.kwargs.get('book_id')
-        try:
-            book = Book.objects.get(pk=book_id)
-            pages = Page.objects.filter(book=book)
-            serializer = self.get_serializer(pages, many=True)
-            return Response(serializer.data)
-        except Book.DoesNotExist:
+        if not Book.objects.filter(pk=self.kwargs.get('book_id')).exists():
             return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+        return self.list(request, *args, **kwargs)
+
+
+@extend_schema(tags=['Books'], responses=PageSerializer(many=True))
+class PageDumpView(generics.GenericAPIView):
+    """
+       Здесь нужен access токен и эндпоинт выдает все страницы книги вместе с текстом одним JSON массивом.
+       Ответ пишется потоком, страницы читаются из базы кусками, поэтому память не растет с размером книги
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = PageSerializer
+
+    def get(self, request, book_id):
+        if not Book.objects.filter(pk=book_id).exists():
+            return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
+        pages = Page.objects.filter(book_id=book_id).order_by('page_number')
+        return StreamingHttpResponse(
+            stream_queryset(pages, ['id', 'text', 'page_number', 'book_id']),
+            content_type='application/json',
+        )
 
 
 @extend_schema(tags=['Books'])
@@ -74,6 +161,7 @@ class PageDetailView(generics.RetrieveAPIView):
         try:
             page = Page.objects.get(pk=page_id, book=book_id)
             serializer = self.get_serializer(page, context={'request': request})
+            progress.record(request.user, page)
 
             return Response(serializer.data)
         except Page.DoesNotExist:
@@ -82,6 +170,49 @@ class PageDetailView(generics.RetrieveAPIView):
             return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+@extend_schema(tags=['Books'], parameters=[
+    OpenApiParameter('k', int, description='Сколько следующих страниц вернуть (по умолчанию PAGE_WINDOW_DEFAULT)'),
+])
+class PageWindowView(generics.GenericAPIView):
+    """
+        Здесь нужен access токен. Отдает страницу page_id и k следующих за ней страниц книги одним запросом,
+        чтобы клиент листал книгу без запроса на каждую страницу. Позиция чтения сохраняется по page_id,
+        дальнейшие перелистывания клиент может отправить пачкой в users/last-page/bulk/.
+        В заголовке Link (rel="next" и rel="prefetch") - адрес следующего окна
+    """
+    serializer_class = PageSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, book_id, page_id):
+        try:
+            k = int(request.query_params.get('k', settings.PAGE_WINDOW_DEFAULT))
+        except ValueError:
+            return Response({"error": "k must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        k = max(0, min(k, settings.PAGE_WINDOW_MAX))
+
+        # один range-запрос по индексу (book, page_number), лишняя страница - начало следующего окна
+        start = Page.objects.filter(pk=page_id, book_id=book_id).values('page_number')
+        pages = list(Page.objects.filter(book_id=book_id, page_number__gte=Subquery(start))
+                     .order_by('page_number')[:k + 2])
+        if not pages or pages[0].pk != page_id:
+            return Response({"error": "Page not found"}, status=status.HTTP_404_NOT_FOUND)
+        following = pages[k + 1] if len(pages) > k + 1 else None
+        pages = pages[:k + 1]
+
+        progress.record(request.user, pages[0])
+        serializer = self.get_serializer(pages, many=True)
+        next_url = None
+        if following is not None:
+            next_url = request.build_absolute_uri(
+                reverse('page-window', args=[book_id, following.pk]) + f'?k={k}'
+            )
+        response = Response({"next": next_url, "results": serializer.data})
+        if next_url:
+            response['Link'] = f'<{next_url}>; rel="next", <{next_url}>; rel="prefetch"'
+        response['Cache-Control'] = f'private, max-age={settings.PAGE_WINDOW_MAX_AGE}'
+        return response
+
+
 @extend_schema(tags=['Users'])
 class LastPageView(generics.RetrieveAPIView):
     """
@@ -91,12 +222,36 @@ class LastPageView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        try:
-            last_page = LastPage.objects.get(user=request.user)
-            serializer = self.get_serializer(last_page)
-            return Response(serializer.data)
-        except LastPage.DoesNotExist:
+        last_pages = LastPage.objects.filter(user=request.user).select_related('page')
+        book_id = request.query_params.get('book')
+        if book_id:
+            last_pages = last_pages.filter(book_id=book_id)
+        last_page = last_pages.order_by('-updated_at').first()
+        if last_page is None:
             return Response({"error": "No last page found for user"}, status=status.HTTP_404_NOT_FOUND)
+        serializer = self.get_serializer(last_page)
+        return Response(serializer.data)
+
+
+@extend_schema(tags=['Users'])
+class LastPageBulkView(generics.GenericAPIView):
+    """
+        Здесь нужен access токен. Принимает пачку позиций чтения от офлайн/мобильного клиента
+        ({"positions": [{"book": 1, "page": 10, "updated_at": "..."}]}) и сохраняет их одним upsert.
+        Позиции старше уже сохраненных игнорируются
+    """
+    serializer_class = ReadingPositionBulkSerializer
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        now = timezone.now()
+        applied = progress.write_progress([
+            (request.user.id, item['book'], item['page'], min(item.get('updated_at', now), now))
+            for item in serializer.validated_data['positions']
+        ])
+        return Response({"applied": applied}, status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=['Books'])
@@ -143,11 +298,10 @@ class AddRatingView(generics.CreateAPIView):
 
     def get(self, request, book_id):
         try:
-            book = Book.objects.get(id=book_id)
-            average_rating = BookRating.objects.filter(book=book).exclude(rating__isnull=True).aggregate(Avg('rating'))[
-                'rating__avg']
+            book = Book.objects.only('rating_sum', 'rating_count').get(id=book_id)
+            average_rating = book.average_rating
             if average_rating is not None:
-                return Response({"average_rating": round(average_rating, 2)}, status=status.HTTP_200_OK)
+                return Response({"average_rating": average_rating}, status=status.HTTP_200_OK)
             else:
                 return Response({"average_rating": "No ratings yet"}, status=status.HTTP_200_OK)
         except Book.DoesNotExist:
@@ -163,6 +317,7 @@ class AddFeedbackView(generics.CreateAPIView):
     """
     serializer_class = BookFeedbackSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
 
     def post(self, request, book_id):
         try:
@@ -179,9 +334,9 @@ class AddFeedbackView(generics.CreateAPIView):
     def get(self, request, book_id):
         try:
             book = Book.objects.get(id=book_id)
-            feedbacks = BookFeedback.objects.filter(book=book)
+            feedbacks = self.paginate_queryset(BookFeedback.objects.filter(book=book))
             serializer = self.get_serializer(feedbacks, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return self.get_paginated_response(serializer.data)
         except Book.DoesNotExist:
             return Response({"error": "Book not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -194,11 +349,10 @@ class GetFavoriteBookView(generics.ListAPIView):
     """
     permission_classes = [IsAuthenticated]
     serializer_class = FavoriteBookSerializer
+    pagination_class = IdCursorPagination
 
-    def get(self, request, *args, **kwargs):
-        favorite_books = FavoriteBook.objects.filter(user=request.user)
-        serializer = self.get_serializer(favorite_books, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    def get_queryset(self):
+        return FavoriteBook.objects.filter(user=self.request.user)
 
 
 @extend_schema(tags=['Books'])
@@ -233,14 +387,16 @@ class RemoveFeedbackView(generics.DestroyAPIView):
 class HistoryView(generics.ListAPIView):
     """
     Нужен Access token
-    Апи для вывода истории просмотров книг пользователем.
+    Апи для вывода истории просмотров книг пользователем, последние прочитанные книги первыми.
     """
     serializer_class = BookListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = HistoryCursorPagination
 
     def get_queryset(self):
         user = self.request.user
-        return Book.objects.filter(pages__recent_pages__user=user)
+        return Book.objects.filter(reading_positions__user=user) \
+            .annotate(last_read_at=F('reading_positions__updated_at'))
 
 
 @extend_schema(tags=['Books'])
@@ -251,28 +407,60 @@ class SearchByGenreView(generics.ListAPIView):
     """
     serializer_class = BookListSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = IdCursorPagination
 
     def get_queryset(self):
         genre_name = self.request.query_params.get('genre')
         if genre_name:
-            return Book.objects.filter(genres__name=genre_name)
+            return Book.objects.filter(bookgenre__genre__name=genre_name)
         else:
             return Book.objects.all()
 
 
+@extend_schema(tags=['Books'], parameters=[OpenApiParameter('q', str), OpenApiParameter('limit', int)])
+class SearchView(generics.GenericAPIView):
+    """
+    Нужен Access token
+    Полнотекстовый поиск: ?q=слова запроса. Возвращает книги, у которых совпало название или автор,
+    и страницы, в тексте которых найдены все слова, со сниппетами. Результаты отсортированы по релевантности.
+    """
+    serializer_class = BookListSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        query = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), 100)
+        except ValueError:
+            return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        # LIMIT -1 в SQLite снимает ограничение
+        if limit < 1:
+            return Response({"error": "limit must be positive"}, status=status.HTTP_400_BAD_REQUEST)
+        book_ids, pages = search.search(query, limit=limit)
+        books = Book.objects.in_bulk(book_ids)
+        serializer = self.get_serializer([books[pk] for pk in book_ids if pk in books], many=True)
+        return Response({"books": serializer.data, "pages": pages}, status=status.HTTP_200_OK)
+
+
 @extend_schema(tags=['Books'])
 class RecommendationView(generics.ListAPIView):
     """
     Нужен Access token
-    Апи для вывода рекомендаций пользователю на основе его истории просмотров и жанров.
+    Апи для вывода рекомендаций пользователю на основе его истории просмотров, избранного, оценок и жанров.
+    Рекомендации предпосчитаны (manage.py build_recommendations), для новых юзеров отдаются популярные книги.
     """
     serializer_class = BookListSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         user = self.request.user
-        # Получаем жанры, которые пользователь предпочитает
-        user_favorite_genres = user.favorite_genres.values_list('name', flat=True)
-        # Сортируем книги по количеству совпадающих жанров
-        return Book.objects.annotate(num_common_genres=Count('genres', filter=models.Q(genres__name__in=user_favorite_genres))) \
-            .order_by('-num_common_genres')
\ No newline at end of file
+        return Book.objects.filter(recommendations__user=user).order_by('recommendations__rank')
+
+    def list(self, request, *args, **kwargs):
+        books = list(self.get_queryset())
+        if not books:
+            popular = recommendations.popular_book_ids()
+            found = Book.objects.in_bulk(popular)
+            books = [found[pk] for pk in popular if pk in found]
+        serializer = self.get_serializer(books, many=True)
+        return Response(serializer.data)
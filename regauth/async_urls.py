@@ -0,0 +1,9 @@
+# async_urls.py
+from django.urls import path
+from .async_views import *
+
+urlpatterns = [
+    path('register/', RegistrationView.as_view(), name='async-register'),
+    path('login/', LoginView.as_view(), name='async-login'),
+    path('change-password/', ChangePasswordView.as_view(), name='async-change-password'),
+]
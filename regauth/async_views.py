@@ -0,0 +1,132 @@
+"""
+Async версии регистрации, входа и смены пароля для запуска под ASGI (Books.asgi), смонтированы в
+api/v1/async/regauth/. Пароль хешируется в пуле regauth.hashing, и пока он считается, воркер обслуживает
+другие запросы, а не держит поток, как синхронные regauth.views.
+
+DRF не умеет async views, поэтому это обычные django views с тем же форматом ответов, что у regauth.views.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed, NotAuthenticated
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import hashing
+from .authentication import StatelessJWTAuthentication
+from .backends import PooledModelBackend
+from .models import CustomUser
+from .serializers import ChangePasswordSerializer, UserRegisSerializer, UserSerializer
+from .tokens import VersionedRefreshToken
+
+authenticator = StatelessJWTAuthentication()
+backend = PooledModelBackend()
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(data, status=status_code, safe=False,
+                        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+class AsyncPasswordView(View):
+    """
+    Базовая async view: разбирает тело парсерами DRF и отдает ошибки DRF (в том числе 429 HashingBusy
+    с Retry-After) в том же виде, что и синхронные view.
+    """
+    http_method_names = ['post', 'options']
+    authentication_required = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # как APIView: вход по токену, а не по сессии, CSRF здесь не нужен
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        drf_request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        try:
+            if self.authentication_required:
+                auth = await authenticator.aauthenticate(request)
+                if auth is None:
+                    raise NotAuthenticated()
+                drf_request.user = auth[0]
+            return await super().dispatch(drf_request, *args, **kwargs)
+        except APIException as exc:
+            response = render(exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail},
+                              exc.status_code)
+            if isinstance(exc, (NotAuthenticated, AuthenticationFailed)):
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = str(math.ceil(exc.wait))
+            return response
+
+
+class RegistrationView(AsyncPasswordView):
+    """
+    Обычная регистация, async версия RegistrationAPIView
+    """
+
+    async def post(self, request):
+        serializer = UserRegisSerializer(data=request.data)
+        # проверки уникальности ходят в базу
+        if not await sync_to_async(serializer.is_valid)():
+            return render(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        user = serializer.new_user(serializer.validated_data)
+        user.password = await hashing.amake_password(serializer.validated_data['password'])
+        await user.asave()
+        refresh = VersionedRefreshToken.for_user(user)
+        return render({
+            'message': 'Registered',
+            'user': UserSerializer(user).data,
+            'access_token': str(refresh.access_token),
+            'refresh_token': str(refresh),
+        })
+
+
+class LoginView(AsyncPasswordView):
+    """
+    login, async версия CustomUserLoginView
+    """
+
+    async def post(self, request):
+        username = request.data.get(CustomUser.USERNAME_FIELD)
+        password = request.data.get('password')
+        if not username or not password:
+            errors = {field: ['This field is required.'] for field, value
+                      in ((CustomUser.USERNAME_FIELD, username), ('password', password)) if not value}
+            return render(errors, status.HTTP_400_BAD_REQUEST)
+        user = await backend.aauthenticate(request, username=username, password=password)
+        if user is None:
+            raise AuthenticationFailed('No active account found with the given credentials')
+        refresh = VersionedRefreshToken.for_user(user)
+        return render({'refresh': str(refresh), 'access': str(refresh.access_token), 'user_id': user.pk})
+
+
+class ChangePasswordView(AsyncPasswordView):
+    """
+    Смена пароля, async версия ChangePasswordAPIView
+    """
+    authentication_required = True
+
+    async def post(self, request):
+        serializer = ChangePasswordSerializer(data=request.data)
+        if not serializer.is_valid():
+            return render(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        user = await CustomUser.objects.aget(pk=request.user.pk)
+        valid, _ = await hashing.acheck_password(serializer.validated_data['old_password'], user.password)
+        if not valid:
+            return render({'detail': 'Invalid old password'}, status.HTTP_400_BAD_REQUEST)
+
+        # смена пароля отзывает все выданные токены, клиенту отдаем новые
+        user.password = await hashing.amake_password(serializer.validated_data['new_password'])
+        user.token_version += 1
+        await user.asave(update_fields=['password', 'token_version'])
+        refresh = VersionedRefreshToken.for_user(user)
+        return render({
+            'detail': 'Password changed successfully',
+            'access_token': str(refresh.access_token),
+            'refresh_token': str(refresh),
+        })
@@ -0,0 +1,80 @@
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import user_cache
+from .denylist import denylist
+from .tokens import VERSION_CLAIM
+
+
+def lazy_user(user_id):
+    """
+    Пользователь, у которого загружен только id. Остальные поля отложены
+    и подтягиваются все сразу (из LRU user_cache) при первом обращении к любому из них.
+    """
+    model = get_user_model()
+    user = model.from_db(DEFAULT_DB_ALIAS, ['id'], [user_id])
+    user._lazy = True
+    return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWT аутентификация без запроса пользователя: подписи токена доверяем, а отзыв проверяем
+    по версии токенов пользователя (claim `ver` против CustomUser.token_version) из кеша
+    и по denylist jti.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.get_token_user_id(validated_token)
+        self.check_state(validated_token, user_cache.get_state(user_id))
+        # токен разлогиненной сессии; почти всегда отвечает Bloom-фильтр без запроса
+        if denylist.is_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return lazy_user(user_id)
+
+    async def aauthenticate(self, request):
+        """
+        authenticate для async views (reading.async_views): разбор и проверка подписи токена
+        не ходят в базу, состояние пользователя и denylist читаются через async API.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_token_user_id(validated_token)
+        self.check_state(validated_token, await user_cache.aget_state(user_id))
+        if await denylist.ais_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return lazy_user(user_id)
+
+    def get_token_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    def check_state(self, validated_token, state):
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        token_version, is_active = state
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        # токены, выданные до появления claim, считаются версией 0
+        if validated_token.get(VERSION_CLAIM, 0) != token_version:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+
+
+class StatelessJWTScheme(SimpleJWTScheme):
+    # для схемы OpenAPI это тот же Bearer JWT, что и у JWTAuthentication
+    target_class = StatelessJWTAuthentication
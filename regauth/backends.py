@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from . import hashing
+
+UserModel = get_user_model()
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend, который проверяет пароль в пуле regauth.hashing, а не в потоке запроса.
+    При переполненном пуле поднимает hashing.HashingBusy (429). aauthenticate - для regauth.async_views.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # как в ModelBackend: хешируем впустую, чтобы по времени ответа нельзя было узнать, есть ли юзер
+            hashing.make_password(password)
+            return None
+
+        valid, needs_update = hashing.check_password(password, user.password)
+        if not valid:
+            return None
+        if needs_update:
+            user.password = hashing.make_password(password)
+            user.save(update_fields=['password'])
+        if self.user_can_authenticate(user):
+            return user
+        return None
+
+    async def aauthenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = await UserModel._default_manager.aget(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            await hashing.amake_password(password)
+            return None
+
+        valid, needs_update = await hashing.acheck_password(password, user.password)
+        if not valid:
+            return None
+        if needs_update:
+            user.password = await hashing.amake_password(password)
+            await user.asave(update_fields=['password'])
+        if self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,134 @@
+"""
+Denylist токенов по jti (RevokedToken) с Bloom-фильтром в памяти процесса.
+
+Фильтр содержит все jti из таблицы (с точностью до TOKEN_DENYLIST_SYNC_INTERVAL для записей,
+добавленных другими процессами), поэтому для подавляющего большинства токенов, которые не отозваны,
+проверка обходится без запроса. Таблицу спрашиваем только при положительном ответе фильтра.
+"""
+import hashlib
+import math
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class Denylist:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        self._synced_at = None
+        self._checked_at = 0
+
+    def _new_bloom(self):
+        return BloomFilter(settings.TOKEN_DENYLIST_BLOOM_CAPACITY, settings.TOKEN_DENYLIST_BLOOM_ERROR_RATE)
+
+    def _load(self, bloom, since=None):
+        entries = RevokedToken.objects.filter(expires_at__gt=timezone.now())
+        if since is not None:
+            entries = entries.filter(revoked_at__gte=since)
+        for jti in entries.values_list('jti', flat=True).iterator(chunk_size=10000):
+            bloom.add(jti.bytes)
+
+    def _fresh(self, now):
+        return self._bloom is not None and now - self._checked_at < settings.TOKEN_DENYLIST_SYNC_INTERVAL
+
+    def sync(self, force=False):
+        """
+        Дочитывает в фильтр записи, добавленные с прошлой синхронизации. Переполненный фильтр строится заново.
+        """
+        now = time.monotonic()
+        if not force and self._fresh(now):
+            return
+        with self._lock:
+            if not force and self._fresh(now):
+                return
+            started = timezone.now()
+            if self._bloom is None or self._bloom.count > settings.TOKEN_DENYLIST_BLOOM_CAPACITY:
+                bloom = self._new_bloom()
+                self._load(bloom)
+                self._bloom = bloom
+            else:
+                # с запасом на транзакции, которые закоммитились позже своего revoked_at
+                self._load(self._bloom, since=self._synced_at - timedelta(seconds=settings.TOKEN_DENYLIST_SYNC_INTERVAL))
+            self._synced_at = started
+            self._checked_at = now
+
+    def is_revoked(self, jti):
+        jti = parse_jti(jti)
+        if jti is None:
+            return True
+        self.sync()
+        if jti.bytes not in self._bloom:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    async def ais_revoked(self, jti):
+        """
+        is_revoked для async views: синхронизация фильтра уходит в поток только когда она нужна.
+        """
+        jti = parse_jti(jti)
+        if jti is None:
+            return True
+        if not self._fresh(time.monotonic()):
+            await sync_to_async(self.sync)()
+        if jti.bytes not in self._bloom:
+            return False
+        return await RevokedToken.objects.filter(jti=jti).aexists()
+
+    def revoke(self, jti, exp):
+        """
+        Добавляет jti в denylist. Возвращает False, если он там уже был - так refresh токен
+        "расходуется" атомарно и повторное использование видно даже при гонке двух запросов.
+        """
+        jti = parse_jti(jti)
+        if jti is None:
+            return False
+        expires_at = datetime.fromtimestamp(exp, tz=dt_timezone.utc)
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        self.sync()
+        with self._lock:
+            self._bloom.add(jti.bytes)
+        return True
+
+
+def parse_jti(jti):
+    try:
+        return uuid.UUID(str(jti))
+    except ValueError:
+        return None
+
+
+denylist = Denylist()
@@ -0,0 +1,215 @@
+"""
+Хеширование и проверка паролей в отдельном пуле процессов.
+
+Лимиты общие для всех процессов хоста (file lock в PASSWORD_HASHING_LOCK_DIR), а не для каждого
+воркера gunicorn/uvicorn: одновременно хешируют не больше PASSWORD_HASHING_WORKERS процессов,
+а если операций в работе больше PASSWORD_HASHING_MAX_PENDING, новые сразу получают 429 (HashingBusy)
+вместо ожидания в очереди. PASSWORD_HASHING_WORKERS = 0 - хешировать прямо в потоке запроса.
+
+Синхронные view (regauth.views) все равно держат поток воркера, пока ждут хеш; async view
+(regauth.async_views, под ASGI) ждут amake_password/acheck_password и поток не занимают.
+"""
+import asyncio
+import atexit
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from rest_framework.exceptions import Throttled
+
+from Books import metrics
+
+try:
+    import fcntl
+except ImportError:
+    # не Unix: лимиты считаются внутри процесса
+    fcntl = None
+
+hash_seconds = metrics.histogram(
+    'password_hash_seconds', 'Время хеширования/проверки пароля в воркере', ['operation'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.4, 0.8, 1.6, 3.2),
+)
+queue_wait_seconds = metrics.histogram(
+    'password_hash_queue_wait_seconds', 'Ожидание свободного воркера хеширования', ['operation'],
+)
+rejected_total = metrics.counter(
+    'password_hash_rejected_total', 'Запросы, отклоненные с 429 из-за переполненной очереди хеширования', ['operation'],
+)
+in_flight = 0
+
+
+class HashingBusy(Throttled):
+    default_detail = 'Too many password operations in progress, please retry.'
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _lock(name, blocking):
+    """
+    Открытый файл с flock на нем или None, если файл уже занят (при blocking=False).
+    Лок держится, пока файл не закрыт, и снимается сам, если процесс умер.
+    """
+    os.makedirs(settings.PASSWORD_HASHING_LOCK_DIR, exist_ok=True)
+    file = open(os.path.join(settings.PASSWORD_HASHING_LOCK_DIR, name), 'a')
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        file.close()
+        return None
+    return file
+
+
+def _worker_slot(slot):
+    """
+    Один из PASSWORD_HASHING_WORKERS слотов хоста: первый свободный, а если все заняты - ждем свой slot.
+    """
+    workers = max(settings.PASSWORD_HASHING_WORKERS, 1)
+    for offset in range(workers):
+        file = _lock(f'worker-{(slot + offset) % workers}.lock', blocking=False)
+        if file is not None:
+            return file
+    return _lock(f'worker-{slot}.lock', blocking=True)
+
+
+def _run(operation, slot, *args):
+    from django.contrib.auth import hashers
+
+    worker = _worker_slot(slot) if slot is not None else None
+    try:
+        started = time.time()
+        if operation == 'make':
+            result = hashers.make_password(*args)
+        else:
+            password, encoded = args
+            # needs_update - хеш сделан другим алгоритмом/стоимостью и его надо пересчитать
+            valid = hashers.check_password(password, encoded)
+            result = (valid, valid and hashers.identify_hasher(encoded).must_update(encoded))
+        return result, started, time.time()
+    finally:
+        if worker is not None:
+            worker.close()
+
+
+class HashingPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # процессы заводятся по мере надобности, хешируют одновременно не больше слотов хоста
+                self._executor = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_HASHING_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                )
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+    def _acquire(self, operation):
+        """
+        Занимает место в очереди хоста: (номер места, открытый файл с локом или None без fcntl).
+        """
+        global in_flight
+        limit = settings.PASSWORD_HASHING_MAX_PENDING
+        if fcntl is not None:
+            start = random.randrange(limit)
+            for offset in range(limit):
+                ticket = (start + offset) % limit
+                file = _lock(f'ticket-{ticket}.lock', blocking=False)
+                if file is not None:
+                    return ticket, file
+        else:
+            with self._lock:
+                if in_flight < limit:
+                    in_flight += 1
+                    return in_flight, None
+        rejected_total.inc(operation=operation)
+        raise HashingBusy(wait=settings.PASSWORD_HASHING_RETRY_AFTER)
+
+    def _release(self, file, future=None):
+        global in_flight
+        if file is not None:
+            file.close()
+        with self._lock:
+            if file is None:
+                in_flight -= 1
+            if future is not None and isinstance(future.exception(), BrokenProcessPool):
+                # воркер упал (например, OOM) - следующий запрос поднимет новый пул
+                self._executor = None
+
+    def submit(self, operation, *args):
+        """
+        Ставит операцию в пул и возвращает concurrent.futures.Future с результатом.
+        """
+        ticket, file = self._acquire(operation)
+        submitted = time.time()
+        try:
+            workers = settings.PASSWORD_HASHING_WORKERS
+            slot = ticket % max(workers, 1) if file is not None else None
+            if workers <= 0:
+                future = Future()
+                future.set_result(_run(operation, slot, *args))
+            else:
+                future = self.executor().submit(_run, operation, slot, *args)
+        except BaseException:
+            self._release(file)
+            raise
+        future.add_done_callback(lambda done: self._release(file, done))
+        return _Timed(future, operation, submitted)
+
+
+class _Timed:
+    def __init__(self, future, operation, submitted):
+        self.future = future
+        self.operation = operation
+        self.submitted = submitted
+
+    def unwrap(self, outcome):
+        result, started, finished = outcome
+        queue_wait_seconds.observe(max(started - self.submitted, 0), operation=self.operation)
+        hash_seconds.observe(finished - started, operation=self.operation)
+        return result
+
+    def result(self):
+        return self.unwrap(self.future.result())
+
+    async def aresult(self):
+        return self.unwrap(await asyncio.wrap_future(self.future))
+
+
+pool = HashingPool()
+atexit.register(pool.shutdown)
+
+
+def make_password(password):
+    return pool.submit('make', password).result()
+
+
+def check_password(password, encoded):
+    """
+    Возвращает (пароль верный, хеш надо пересчитать).
+    """
+    return pool.submit('check', password, encoded).result()
+
+
+async def amake_password(password):
+    return await pool.submit('make', password).aresult()
+
+
+async def acheck_password(password, encoded):
+    return await pool.submit('check', password, encoded).aresult()
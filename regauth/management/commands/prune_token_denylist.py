@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from regauth.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = 'Удаляет из denylist токены, срок действия которых уже истек'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='Сколько записей удалять за запрос')
+        parser.add_argument('--interval', type=float, help='Повторять каждые N секунд вместо одного прохода')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                deleted = self.prune(options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} expired token(s)'))
+                if options['interval'] is None:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped')
+
+    def prune(self, batch_size):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            # пачками по индексу expires_at, чтобы не держать долгую блокировку
+            jtis = list(RevokedToken.objects.filter(expires_at__lte=now)
+                        .order_by('expires_at').values_list('jti', flat=True)[:batch_size])
+            if not jtis:
+                return deleted
+            deleted += RevokedToken.objects.filter(jti__in=jtis).delete()[0]
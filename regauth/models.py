@@ -1,7 +1,60 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import user_cache
 
 
 class CustomUser(AbstractUser):
     username = models.CharField(max_length=50, unique=True)
     email = models.EmailField(unique=True)
+    # Увеличивается, чтобы отозвать все выданные пользователю токены
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        if getattr(self, '_lazy', False) and fields is not None:
+            # ленивый пользователь из StatelessJWTAuthentication: грузим все поля разом
+            self._lazy = False
+            row = user_cache.get_row(self.pk)
+            if row is None:
+                raise self.DoesNotExist('User no longer exists')
+            deferred = self.get_deferred_fields()
+            for attname, value in row.items():
+                if attname in deferred:
+                    setattr(self, attname, value)
+            self._loaded_row = row
+            return
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+
+    def save(self, *args, **kwargs):
+        loaded_row = getattr(self, '_loaded_row', None)
+        if loaded_row is not None and kwargs.get('update_fields') is None:
+            # строка могла прийти из кеша, поэтому пишем только то, что поменяли
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and getattr(self, field.attname) != loaded_row.get(field.attname)
+            ]
+        super().save(*args, **kwargs)
+
+    def revoke_tokens(self):
+        CustomUser.objects.filter(pk=self.pk).update(token_version=F('token_version') + 1)
+        user_cache.invalidate(self.pk)
+        self.token_version = CustomUser.objects.filter(pk=self.pk).values_list('token_version', flat=True).get()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_user_cache(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+class RevokedToken(models.Model):
+    """
+    Denylist токенов по jti: использованные при ротации refresh токены и токены разлогиненных сессий.
+    Записи с истекшим expires_at удаляет `prune_token_denylist`.
+    """
+    jti = models.UUIDField(primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -1,5 +1,6 @@
 import re
 from rest_framework import serializers
+from . import hashing
 from .models import CustomUser
 
 
@@ -40,12 +41,17 @@ class UserRegisSerializer(serializers.ModelSerializer):
 
         return value
 
-    def create(self, validated_data):
-        user = CustomUser.objects.create_user(
-            email=validated_data.get('email', ''),
-            username=validated_data['username'],
-            password=validated_data['password'],
+    def new_user(self, validated_data):
+        # то же, что create_user, но без пароля: его хеширует пул regauth.hashing
+        return CustomUser(
+            email=CustomUser.objects.normalize_email(validated_data.get('email', '')),
+            username=CustomUser.normalize_username(validated_data['username']),
         )
+
+    def create(self, validated_data):
+        user = self.new_user(validated_data)
+        user.password = hashing.make_password(validated_data['password'])
+        user.save()
         return user
 
 
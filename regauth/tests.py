@@ -1,3 +1,79 @@
-from django.test import TestCase
+import base64
+import fcntl
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import hashing
+from .models import CustomUser
+from .tokens import VersionedRefreshToken
+
+
+class LogoutTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='secret')
+        self.client = APIClient()
+
+    def test_logout_revokes_access_token(self):
+        access = str(VersionedRefreshToken.for_user(self.user).access_token)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.post('/api/v1/regauth/logout/').status_code, 200)
+        self.assertEqual(self.client.post('/api/v1/regauth/logout/').status_code, 401)
+
+    def test_logout_with_basic_auth(self):
+        # access токена нет, request.auth равен None
+        credentials = base64.b64encode(b'reader:secret').decode()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(self.client.post('/api/v1/regauth/logout/').status_code, 200)
+
+    def test_logout_with_session(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post('/api/v1/regauth/logout/?all=true').status_code, 200)
+
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir, ignore_errors=True)
+        self.enterContext(override_settings(PASSWORD_HASHING_LOCK_DIR=lock_dir))
+        self.lock_dir = lock_dir
+        self.credentials = {'username': 'reader', 'email': 'reader@example.com', 'password': 'secret1'}
+
+    @override_settings(PASSWORD_HASHING_MAX_PENDING=1)
+    def test_queue_is_shared_between_processes(self):
+        # место в очереди держит другой процесс: отдельный open и flock на тот же файл
+        with open(os.path.join(self.lock_dir, 'ticket-0.lock'), 'a') as ticket:
+            fcntl.flock(ticket, fcntl.LOCK_EX)
+            response = APIClient().post('/api/v1/regauth/register/', self.credentials)
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '1')
+        response = APIClient().post('/api/v1/regauth/register/', self.credentials)
+        self.assertEqual(response.status_code, 200)
+
+    async def test_async_register_and_login(self):
+        response = await self.async_client.post('/api/v1/async/regauth/register/', self.credentials,
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        login = {'username': 'reader', 'password': 'secret1'}
+        response = await self.async_client.post('/api/v1/async/regauth/login/', login,
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'refresh', 'access', 'user_id'})
+        response = await self.async_client.post('/api/v1/async/regauth/login/', {**login, 'password': 'wrong'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_async_change_password(self):
+        user = await CustomUser.objects.acreate(username='reader', email='reader@example.com',
+                                                password=await hashing.amake_password('secret1'))
+        access = str(VersionedRefreshToken.for_user(user).access_token)
+        response = await self.async_client.post(
+            '/api/v1/async/regauth/change-password/', {'old_password': 'secret1', 'new_password': 'secret2'},
+            content_type='application/json', headers={'Authorization': f'Bearer {access}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        await user.arefresh_from_db()
+        self.assertEqual(await hashing.acheck_password('secret2', user.password), (True, False))
@@ -0,0 +1,21 @@
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+# Версия токенов пользователя на момент выдачи, см. CustomUser.token_version
+VERSION_CLAIM = 'ver'
+
+
+class VersionedRefreshToken(RefreshToken):
+    """
+    Refresh токен с версией токенов пользователя. Claim копируется и в access токен.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[VERSION_CLAIM] = user.token_version
+        return token
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = VersionedRefreshToken
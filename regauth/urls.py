@@ -8,7 +8,7 @@ urlpatterns = [
     path('login/', CustomUserLoginView.as_view(), name='login'),
     path('all-users/', CustomUserList.as_view(), name='all-users'),
     path('user/<int:pk>/', UserSearchList.as_view(), name='user-update'),
-    # path('logout/', TokenBlacklistView.as_view(), name='auth_logout'),
+    path('logout/', LogoutAPIView.as_view(), name='auth_logout'),
     path('change-password/', ChangePasswordAPIView.as_view(), name='change-password'),
     path('token/refresh/', CustomUserTokenRefreshView.as_view(), name='token_refresh'),
     path('user-profile/', UserInfoAPIView.as_view(), name='user-info'),  # Add this line
@@ -0,0 +1,81 @@
+"""
+Кеши для аутентификации без запроса пользователя на каждый запрос.
+
+- состояние пользователя (token_version, is_active) хранится в кеше Django,
+  по нему проверяются токены (см. regauth.authentication). Если кеш не общий (LocMemCache),
+  отзыв токенов и деактивация в одном процессе видны в остальных не позже AUTH_TOKEN_STATE_TTL;
+- строки пользователей лежат в небольшом LRU в памяти процесса и нужны только
+  ленивому пользователю, когда view обращается к полям кроме id.
+Оба сбрасываются при сохранении пользователя, LRU в других процессах живет не дольше AUTH_USER_CACHE_TTL.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+_rows = OrderedDict()
+_lock = threading.Lock()
+
+
+def state_key(user_id):
+    return f'auth:user:{user_id}:state'
+
+
+def get_state(user_id):
+    """
+    (token_version, is_active) пользователя или None, если его нет.
+    """
+    state = cache.get(state_key(user_id))
+    if state is None:
+        row = get_user_model().objects.filter(pk=user_id).values_list('token_version', 'is_active').first()
+        if row is None:
+            return None
+        state = tuple(row)
+        cache.set(state_key(user_id), state, settings.AUTH_TOKEN_STATE_TTL)
+    return state
+
+
+async def aget_state(user_id):
+    """
+    get_state для async views.
+    """
+    state = await cache.aget(state_key(user_id))
+    if state is None:
+        row = await get_user_model().objects.filter(pk=user_id).values_list('token_version', 'is_active').afirst()
+        if row is None:
+            return None
+        state = tuple(row)
+        await cache.aset(state_key(user_id), state, settings.AUTH_TOKEN_STATE_TTL)
+    return state
+
+
+def get_row(user_id):
+    """
+    Значения всех полей пользователя {attname: value} из LRU или базы.
+    """
+    now = time.monotonic()
+    with _lock:
+        cached = _rows.get(user_id)
+        if cached is not None and cached[1] > now:
+            _rows.move_to_end(user_id)
+            return cached[0]
+    model = get_user_model()
+    attnames = [field.attname for field in model._meta.concrete_fields]
+    row = model.objects.filter(pk=user_id).values(*attnames).first()
+    if row is None:
+        return None
+    with _lock:
+        _rows[user_id] = (row, now + settings.AUTH_USER_CACHE_TTL)
+        _rows.move_to_end(user_id)
+        while len(_rows) > settings.AUTH_USER_CACHE_SIZE:
+            _rows.popitem(last=False)
+    return row
+
+
+def invalidate(user_id):
+    with _lock:
+        _rows.pop(user_id, None)
+    cache.delete(state_key(user_id))
@@ -1,4 +1,5 @@
 from django.shortcuts import render
+from drf_spectacular.types import OpenApiTypes
 from drf_spectacular.utils import extend_schema
 
 # Create your views here.
@@ -9,7 +10,12 @@ from rest_framework.permissions import IsAuthenticated
 from .serializers import *
 from .models import CustomUser
 from rest_framework.views import APIView
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import hashing, user_cache
+from .denylist import denylist
+from .tokens import VERSION_CLAIM, VersionedRefreshToken, VersionedTokenObtainPairSerializer
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -26,7 +32,7 @@ class RegistrationAPIView(APIView):
         serializer = UserRegisSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
+            refresh = VersionedRefreshToken.for_user(user)
             access_token = str(refresh.access_token)
             refresh_token = str(refresh)
 
@@ -45,18 +51,17 @@ class CustomUserLoginView(TokenObtainPairView):
     login
     """
 
-    def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        tokens = response.data
-
-        access_token = tokens.get('access', None)
+    serializer_class = VersionedTokenObtainPairSerializer
 
-        if access_token:
-            access_token_instance = AccessToken(access_token)
-            payload = access_token_instance.payload
-            user_id = payload['user_id']
-            tokens['user_id'] = user_id
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
 
+        tokens = dict(serializer.validated_data)
+        tokens['user_id'] = serializer.user.pk
         return Response(tokens, status=status.HTTP_200_OK)
 
 
@@ -81,7 +86,9 @@ class UserSearchList(generics.ListAPIView):
         pass
     permission_classes = [AllowAny]
     serializer_class = UserSerializer
-    queryset = CustomUser.objects.all()
+
+    def get_queryset(self):
+        return CustomUser.objects.filter(pk=self.kwargs['pk'])
 
 
 @extend_schema(tags=['Authorization'])
@@ -93,7 +100,10 @@ class UserInfoAPIView(generics.RetrieveUpdateAPIView):
     serializer_class = UserSerializer
 
     def get_object(self):
-        return self.request.user
+        if self.request.method in ('GET', 'HEAD'):
+            return self.request.user
+        # для изменения профиля берем свежую строку, а не закешированную
+        return CustomUser.objects.get(pk=self.request.user.pk)
 
     def get(self, request, *args, **kwargs):
         user_instance = self.get_object()
@@ -109,37 +119,94 @@ class ChangePasswordAPIView(APIView):
     def post(self, request):
         serializer = ChangePasswordSerializer(data=request.data)
         if serializer.is_valid():
-            user = request.user
+            user = CustomUser.objects.get(pk=request.user.pk)
 
             old_password = serializer.validated_data['old_password']
             new_password = serializer.validated_data['new_password']
 
-            if not user.check_password(old_password):
+            if not hashing.check_password(old_password, user.password)[0]:
                 return Response({'detail': 'Invalid old password'}, status=status.HTTP_400_BAD_REQUEST)
 
-            user.set_password(new_password)
-            user.save()
-            return Response({'detail': 'Password changed successfully'}, status=status.HTTP_200_OK)
+            # смена пароля отзывает все выданные токены, клиенту отдаем новые
+            user.password = hashing.make_password(new_password)
+            user.token_version += 1
+            user.save(update_fields=['password', 'token_version'])
+            refresh = VersionedRefreshToken.for_user(user)
+            return Response({
+                'detail': 'Password changed successfully',
+                'access_token': str(refresh.access_token),
+                'refresh_token': str(refresh),
+            }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @extend_schema(tags=['Authorization'])
 class CustomUserTokenRefreshView(APIView):
-    serializer_class = UserSerializer
-
     """
-        эндпоинт для обновление access токена
+        эндпоинт для обновление access токена. При ROTATE_REFRESH_TOKENS возвращает и новый refresh токен,
+        а старый сразу попадает в denylist. Повторное использование refresh токена отзывает все токены юзера
     """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+    serializer_class = UserSerializer
 
     def post(self, request, *args, **kwargs):
         try:
-            refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
-            access_token = str(token.access_token)
-            return Response({'access': access_token}, status=status.HTTP_200_OK)
-        except Exception as e:
+            token = RefreshToken(request.data["refresh"])
+        except (KeyError, TokenError):
             return Response({'error': 'invalid token'}, status.HTTP_401_UNAUTHORIZED)
 
+        user_id = token['user_id']
+        state = user_cache.get_state(user_id)
+        if state is None or not state[1] or token.get(VERSION_CLAIM, 0) != state[0]:
+            return Response({'error': 'invalid token'}, status.HTTP_401_UNAUTHORIZED)
+
+        jti = token[jwt_settings.JTI_CLAIM]
+        if not jwt_settings.ROTATE_REFRESH_TOKENS:
+            if denylist.is_revoked(jti):
+                return Response({'error': 'invalid token'}, status.HTTP_401_UNAUTHORIZED)
+            return Response({'access': str(token.access_token)}, status=status.HTTP_200_OK)
+
+        # вставка jti и есть проверка: второй запрос с тем же токеном ее не пройдет
+        if not denylist.revoke(jti, token['exp']):
+            # refresh токен уже использовали - скорее всего он утек, отзываем всю цепочку
+            CustomUser(pk=user_id).revoke_tokens()
+            return Response({'error': 'invalid token'}, status.HTTP_401_UNAUTHORIZED)
+
+        data = {'access': str(token.access_token)}
+        token.set_jti()
+        token.set_exp()
+        token.set_iat()
+        data['refresh'] = str(token)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+@extend_schema(tags=['Authorization'], request=OpenApiTypes.OBJECT, responses=OpenApiTypes.OBJECT)
+class LogoutAPIView(APIView):
+    """
+        Отзывает текущий access токен и переданный refresh токен ({"refresh": "..."}),
+        с ?all=true - все токены юзера на всех устройствах. При входе по сессии или Basic access токена нет
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if request.query_params.get('all') == 'true':
+            request.user.revoke_tokens()
+            return Response({'detail': 'Logged out'}, status=status.HTTP_200_OK)
+
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                token = RefreshToken(refresh)
+            except TokenError:
+                return Response({'error': 'invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+            if token['user_id'] != request.user.pk:
+                return Response({'error': 'invalid token'}, status=status.HTTP_400_BAD_REQUEST)
+            denylist.revoke(token[jwt_settings.JTI_CLAIM], token['exp'])
+        if request.auth is not None:
+            denylist.revoke(request.auth[jwt_settings.JTI_CLAIM], request.auth['exp'])
+        return Response({'detail': 'Logged out'}, status=status.HTTP_200_OK)
+
 
 
 # class AllUsersView(APIView):